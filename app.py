@@ -1,178 +1,380 @@
 # app.py
 # app.py
-import streamlit as st
-from pypdf import PdfReader, PdfWriter
-import io
-import requests
+import os
 import time
-import json
+
+import streamlit as st
+
+from dedup import DEFAULT_MAX_DISTANCE
+from job_panel import get_runner, remember_job, show_jobs
+from large_file import LARGE_FILE_THRESHOLD, PageTextStore, UploadSpool
+from ocr_engines import DEFAULT_MIN_CONFIDENCE, ENGINES, make_engine, tesseract_available
+from ocr_space import FREE_PLAN_LIMIT
+from ratelimit import AdaptiveLimiter, TokenBucket
+from render import DEFAULT_DPI, DEFAULT_MAX_BYTES
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from scheduler import DocumentScheduler
+from telemetry import Tracer
+from telemetry_panel import show_stage_timings
+from transport import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, KeyPool, Transport,
+                       key_source)
+from viewer import export_buttons, show_documents, show_pages
+
+ENGINE_LABELS = {
+    "ocr.space": "OCR.space",
+    "tesseract": "Tesseract (local)",
+    "tesseract+ocr.space": "Tesseract, OCR.space for low-confidence pages",
+}
 
 st.set_page_config(page_title="PDF OCR (per-page upload)", layout="wide")
 st.title("📄 PDF Text Extractor — digital text + per-page OCR.space uploads")
 
-uploaded = st.file_uploader("Upload a PDF", type=["pdf"])
+uploads = st.file_uploader("Upload PDFs", type=["pdf"], accept_multiple_files=True)
+# Large-file mode spools uploads to temp files (below): a file is deleted as
+# soon as its upload is removed, and the rest when the session ends
+spool = st.session_state.setdefault("upload_spool", UploadSpool())
+spool.retain(upload.file_id for upload in uploads or ())
 api_key = st.text_input(
     "OCR.space API key (leave blank to use 'helloworld' test key)",
     value="helloworld",
-    help="Get a free key from https://ocr.space/ if you plan to OCR many files or large PDFs."
+    help="Get a free key from https://ocr.space/ if you plan to OCR many files or large PDFs. Separate "
+         "several keys with commas to spread pages over them."
 )
 
-if uploaded is None:
-    st.info("Upload a PDF to extract text.")
+use_cache = st.sidebar.checkbox("Cache OCR results on disk", value=True,
+                                help="Reuse results for pages already sent to OCR.space (survives reruns).")
+cache_dir = st.sidebar.text_input("Cache directory", value=DEFAULT_CACHE_DIR)
+cache = ResultCache(cache_dir) if use_cache else None
+
+# OCR backend: OCR.space, local Tesseract (one process per core), or Tesseract
+# first with only low-confidence pages escalated to OCR.space
+engine_name = st.sidebar.selectbox("OCR engine", ENGINES, format_func=ENGINE_LABELS.get)
+min_confidence = DEFAULT_MIN_CONFIDENCE
+if engine_name == "tesseract+ocr.space":
+    min_confidence = st.sidebar.slider("Escalate pages below confidence", min_value=0, max_value=100,
+                                       value=DEFAULT_MIN_CONFIDENCE,
+                                       help="Mean Tesseract word confidence (0-100).")
+if engine_name != "ocr.space" and not tesseract_available():
+    st.sidebar.warning("Tesseract is not installed (pytesseract + tesseract binary): local OCR will fail"
+                       + (" and every page goes to OCR.space." if engine_name != "tesseract" else "."))
+local_workers = os.cpu_count() or 1
+
+
+# One keep-alive connection pool and one key pool per setting, kept across
+# reruns so connections stay open and per-key usage keeps counting
+@st.cache_resource
+def get_transport(pool_size, connect_timeout, read_timeout):
+    return Transport(pool_size, connect_timeout, read_timeout)
+
+
+@st.cache_resource
+def get_api_keys(text, rate, quota):
+    return key_source(text, rate=rate, quota=quota)
+
+
+with st.sidebar.expander("Connection and API keys"):
+    pool_size = st.number_input("Keep-alive connections", min_value=1, max_value=64, value=DEFAULT_POOL_SIZE)
+    connect_timeout = st.number_input("Connect timeout (s)", min_value=1.0, max_value=60.0,
+                                      value=DEFAULT_CONNECT_TIMEOUT)
+    read_timeout = st.number_input("Read timeout (s)", min_value=5.0, max_value=600.0, value=DEFAULT_READ_TIMEOUT)
+    key_rps = st.number_input("Max requests per second per key (0 = no limit)", min_value=0.0, max_value=20.0,
+                              value=0.0, step=0.25)
+    key_quota = st.number_input("Requests per key per day (0 = no limit)", min_value=0, value=0, step=100,
+                                help="With several keys, pages go to the key with the most headroom; a key "
+                                     "that keeps failing is benched for a minute.")
+transport = get_transport(int(pool_size), float(connect_timeout), float(read_timeout))
+api_keys = get_api_keys(api_key.strip() or "helloworld", key_rps or None, int(key_quota) or None)
+
+
+def show_key_usage():
+    if isinstance(api_keys, KeyPool):
+        st.caption("Per-key usage")
+        st.dataframe(api_keys.stats())
+
+# Background mode: the job keeps running (and checkpointing finished pages)
+# when the tab is closed or the script reruns, and can be resumed after a crash
+background = st.sidebar.checkbox("Run as background job", value=False,
+                                 help="Submit the PDF as a job and follow its progress; finished pages are "
+                                      "saved as they complete, so interrupted jobs resume where they stopped.")
+if background:
+    runner = get_runner()
+    render_in_job = st.sidebar.checkbox("Render pages before upload", value=True, key="job_render")
+    dedup_in_job = st.sidebar.checkbox("OCR duplicate pages only once", value=True, key="job_dedup")
+    triage_in_job = st.sidebar.checkbox("Triage pages on thumbnails", value=True, key="job_triage")
+    if uploads and st.button("Submit background job" + ("s" if len(uploads) > 1 else "")):
+        for uploaded in uploads:
+            job_id = runner.submit_ocr(
+                uploaded, uploaded.name, api_keys,
+                render_options={"dpi": DEFAULT_DPI, "max_bytes": DEFAULT_MAX_BYTES} if render_in_job else None,
+                engine=engine_name, min_confidence=min_confidence,
+                dedup_distance=DEFAULT_MAX_DISTANCE if dedup_in_job else None, triage=triage_in_job,
+                cache_dir=cache_dir if use_cache else None
+            )
+            remember_job(job_id)
+            st.success(f"Submitted job {job_id} ({uploaded.name}).")
+    show_jobs(runner, "ocr", api_keys)
     st.stop()
 
-pdf_bytes = uploaded.read()
-try:
-    pdf_reader = PdfReader(io.BytesIO(pdf_bytes))
-    total_pages = len(pdf_reader.pages)
-except Exception as e:
-    st.error(f"Cannot read PDF: {e}")
+if not uploads:
+    st.info("Upload one or more PDFs to extract text.")
     st.stop()
 
-st.info(f"Opened PDF — {total_pages} pages found.")
-extracted_text = [None] * total_pages
-methods = {i+1: None for i in range(total_pages)}
-
-# 1) Try to read digital text from each page
-for i, page in enumerate(pdf_reader.pages, start=1):
-    try:
-        page_text = page.extract_text() or ""
-    except Exception:
-        page_text = ""
-    if page_text.strip():
-        methods[i] = "digital"
-        extracted_text[i-1] = page_text
+# Every upload, one or several, goes through the same pipeline (scheduler.py):
+# with several PDFs the next one is opened and classified while the pages of
+# the current one are OCRed. The limits are global: one CPU stage at a time
+# on the classification processes, one limiter for all OCR requests.
+single = len(uploads) == 1
+uses_remote = engine_name != "tesseract"
+uses_local = engine_name != "ocr.space"
+
+# Large-file mode: spool the uploads to temp files and memory-map them instead
+# of holding a copy in memory (see large_file.py)
+large_file = st.sidebar.checkbox(
+    "Large-file mode", value=any(upload.size > LARGE_FILE_THRESHOLD for upload in uploads),
+    help=f"On by default for uploads over {LARGE_FILE_THRESHOLD // (1024 * 1024)} MB. Keeps memory "
+         "bounded for very large scanned bundles."
+)
+max_documents = 1
+if not single:
+    max_documents = st.sidebar.number_input("Documents in flight", min_value=1, max_value=8, value=2,
+                                            help="Documents being classified or OCRed at the same time.")
+
+# 1) Digital text is read from each page (obvious scans are labelled by a
+#    cheap content-stream check; the rest are extracted on a process pool)
+classify_workers = st.sidebar.number_input("Classification worker processes", min_value=1,
+                                           max_value=os.cpu_count() or 1, value=os.cpu_count() or 1)
+# 2) Triage on low-DPI thumbnails: blank scans are skipped, digital pages that
+#    are mostly scanned ink (e.g. a scan with a typed header) are OCRed too
+triage = st.sidebar.checkbox("Triage pages on thumbnails", value=True,
+                             help="Skips blank pages and OCRs pages whose digital text covers little of "
+                                  "the inked area. Needs poppler.")
+# 3) Repeated forms, letterheads and charts are OCRed once; the copies reuse
+#    the representative's text (method "dedup_of:<page>")
+dedup = st.sidebar.checkbox("OCR duplicate pages only once", value=True,
+                            help="Groups exact copies; with a tolerance, also pages whose full-resolution "
+                                 "renders match pixel for pixel.")
+dedup_distance = DEFAULT_MAX_DISTANCE
+if dedup:
+    dedup_distance = st.sidebar.number_input("Near-duplicate tolerance (hash bits, 0 = exact copies only)",
+                                             min_value=0, max_value=32, value=DEFAULT_MAX_DISTANCE)
+
+# Pages are uploaded by a small thread pool; a shared limiter keeps the
+# request rate and the number of in-flight requests under control.
+# Throttled / transient failures are retried with jittered backoff.
+adaptive = False
+limiter = None
+max_in_flight = 0
+render_options = None
+page_budget = None
+if uses_remote:
+    adaptive = st.checkbox("Adapt request rate automatically", value=True,
+                           help="Raises the request rate until OCR.space starts throttling or slowing down, "
+                                "then backs off and pauses all uploads briefly (AIMD). Concurrency follows "
+                                "the rate, up to the maximum below.")
+    col_rate, col_workers = st.columns(2)
+    max_in_flight = col_workers.number_input("Max concurrent requests", min_value=1, max_value=16, value=4, step=1)
+    if adaptive:
+        limiter = AdaptiveLimiter(max_in_flight=max_in_flight)
+    else:
+        max_rps = col_rate.number_input("Max requests per second", min_value=0.1, max_value=20.0, value=1.25,
+                                        step=0.25)
+        limiter = TokenBucket(rate=max_rps, burst=1, max_in_flight=max_in_flight)
+
+    # Optional local render + compress stage (needs poppler for pdf2image);
+    # local Tesseract renders pages itself at its own DPI. Without rendering
+    # the budget still applies: single-page PDFs over it get their embedded
+    # images recompressed (page_split.py)
+    render_enabled = st.checkbox("Render pages to compressed grayscale images before upload", value=True,
+                                 help="Shrinks uploads under the byte budget; falls back to PDF if rendering "
+                                      "fails.")
+    col_dpi, col_budget = st.columns(2)
+    budget_kb = col_budget.number_input("Upload budget per page (KB)", min_value=100, max_value=5000, value=900, step=50)
+    page_budget = int(budget_kb) * 1024
+    if render_enabled:
+        render_dpi = col_dpi.number_input("Render DPI", min_value=72, max_value=400, value=DEFAULT_DPI, step=25)
+        render_options = {"dpi": int(render_dpi), "max_bytes": page_budget}
+
+# Names are numbered so two uploads with the same file name stay apart; in
+# large-file mode each upload is spooled once, not on every rerun
+documents = []
+for i, upload in enumerate(uploads, start=1):
+    name = upload.name if single else f"{i}. {upload.name}"
+    if large_file:
+        documents.append((name, None, spool.path(upload.file_id, upload)))
+    else:
+        documents.append((name, upload.getvalue(), None))
+
+tracer = Tracer()
+engine = make_engine(engine_name, api_keys, limiter=limiter, cache=cache, tracer=tracer,
+                     workers=local_workers, min_confidence=min_confidence, transport=transport)
+# Worker threads only wait on the engine: one per local process plus the uploads
+scheduler = DocumentScheduler(max_documents=int(max_documents),
+                              upload_workers=int(max_in_flight) + (local_workers if uses_local else 0))
+stage_stats = {name: {} for name, _, _ in documents}
+upload_sizes = {name: {} for name, _, _ in documents}
+split_sizes = {name: {} for name, _, _ in documents}
+records = {name: {} for name, _, _ in documents}
+# Page text is kept apart from the records: in large-file mode on disk in a
+# PageTextStore per document, so memory stays bounded. The stores live in the
+# session for the viewer and exports and are closed when the next run starts.
+for store in st.session_state.pop("text_stores", {}).values():
+    store.close()
+texts = {name: PageTextStore() if large_file else {} for name, _, _ in documents}
+if large_file:
+    st.session_state["text_stores"] = texts
+status = st.empty()
+table = st.empty()
+last_update = 0.0
+
+
+def throughput_rows():
+    return [{"document": name, "pages": stats["pages"], "OCR pages": stats["ocr_pages"],
+             "waiting for CPU (s)": round(stats.get("queued_seconds", 0.0), 2),
+             "classify (s)": round(stats.get("cpu_seconds", 0.0), 2),
+             "total (s)": round(stats["seconds"], 2) if "seconds" in stats else None,
+             "pages/s": round(stats["pages_per_second"], 2) if stats.get("pages_per_second") else None}
+            for name, stats in scheduler.stats.items()]
+
+
+# Results arrive out of order; each one is kept under its document and page
+for name, record in scheduler.run(documents, api_keys, limiter=limiter, cache=cache, engine=engine,
+                                  document_options={name: {"stats": stage_stats[name],
+                                                           "upload_sizes": upload_sizes[name],
+                                                           "split_sizes": split_sizes[name]}
+                                                    for name in records},
+                                  classify_workers=int(classify_workers), render_options=render_options,
+                                  page_budget=page_budget, dedup=dedup, dedup_distance=int(dedup_distance),
+                                  triage=triage, tracer=tracer):
+    if record["page"] is None:
+        st.error(f"Cannot read {name}: {record['error']}")
+        continue
+    page = record["page"]
+    if large_file:
+        texts[name][page - 1] = record.pop("text")
     else:
-        methods[i] = "needs_ocr"
-        extracted_text[i-1] = None
+        texts[name][page] = record.pop("text")
+    records[name][page] = record
+    if record.get("error"):
+        st.warning(f"{name}: {record['error']}")
+    if time.perf_counter() - last_update > 0.5:
+        last_update = time.perf_counter()
+        status.info(f"{sum(len(pages) for pages in records.values())} page(s) done"
+                    + (f" across {len(documents)} documents" if not single else "")
+                    + (f" — {limiter.limit} concurrent request(s)" if adaptive else "") + " ...")
+        if not single:
+            table.dataframe(throughput_rows())
+engine.close()
 
-needs_ocr_pages = [i for i, m in methods.items() if m == "needs_ocr"]
+summary = scheduler.summary()
+status.success(f"Finished {summary['documents']} document(s): {summary['pages']} pages in "
+               f"{summary['seconds']:.1f}s ({summary['pages_per_second'] or 0:.2f} pages/s"
+               + (f", {summary['overlap'] or 0:.1f} documents in flight on average" if not single else "")
+               + ").")
+if not single:
+    table.dataframe(throughput_rows())
 
-if not needs_ocr_pages:
+ocr_records = [record for pages in records.values() for record in pages.values()
+               if record["method"] not in ("digital", "blank")]
+if not ocr_records:
     st.success("All pages contained digital (extractable) text — no OCR required.")
 else:
-    st.warning(f"{len(needs_ocr_pages)} page(s) need OCR. We'll upload them one-by-one to OCR.space.")
-    key_to_use = (api_key.strip() or "helloworld")
-
-    # OCR.space endpoint
-    OCR_URL = "https://api.ocr.space/parse/image"
-
-    # Optional small delay between requests to be gentle on rate-limits
-    per_page_delay = st.number_input("Delay between page requests (seconds)", min_value=0.0, max_value=10.0, value=0.8, step=0.2)
-
-    progress = st.progress(0)
-    success_count = 0
-    for idx, page_num in enumerate(needs_ocr_pages, start=1):
-        progress.progress((idx-1) / len(needs_ocr_pages))
-        st.info(f"OCR: processing page {page_num} ({idx}/{len(needs_ocr_pages)}) ...")
-
-        # Create a single-page PDF in-memory
-        writer = PdfWriter()
-        try:
-            writer.add_page(pdf_reader.pages[page_num - 1])
-        except Exception as e:
-            st.error(f"Failed to extract page {page_num} for OCR: {e}")
-            methods[page_num] = "extract_failed"
-            extracted_text[page_num - 1] = ""
-            continue
-
-        single_page_io = io.BytesIO()
-        try:
-            writer.write(single_page_io)
-            single_page_io.seek(0)
-        except Exception as e:
-            st.error(f"Failed to write single-page PDF for page {page_num}: {e}")
-            methods[page_num] = "write_failed"
-            extracted_text[page_num - 1] = ""
-            continue
-
-        single_size = len(single_page_io.getvalue())
-        st.write(f"Single-page PDF size: {single_size/1024:.1f} KB")
-        # If the single page still exceeds 1MB, warn and continue (may still be rejected)
-        if single_size > 1024 * 1024:
-            st.warning(f"Page {page_num} single-page PDF is {single_size/1024:.1f} KB — may exceed OCR.space free limit.")
-
-        # Send to OCR.space
-        files = {"file": (f"page_{page_num}.pdf", single_page_io.getvalue())}
-        data = {
-            "apikey": key_to_use,
-            "language": "eng",
-            "isOverlayRequired": False,
-            "detectOrientation": True,
-            "OCREngine": 2
-        }
-
-        try:
-            resp = requests.post(OCR_URL, files=files, data=data, timeout=120)
-            resp.raise_for_status()
-            resp_json = resp.json()
-        except requests.exceptions.RequestException as re:
-            st.error(f"Network or request error on page {page_num}: {re}")
-            methods[page_num] = "network_error"
-            extracted_text[page_num - 1] = ""
-            # wait a little before next try
-            time.sleep(per_page_delay)
-            continue
-        except json.JSONDecodeError as je:
-            st.error(f"Invalid JSON response for page {page_num}: {je}")
-            methods[page_num] = "bad_json"
-            extracted_text[page_num - 1] = ""
-            time.sleep(per_page_delay)
-            continue
-
-        # Check API response for errors
-        if resp_json.get("IsErroredOnProcessing"):
-            err = resp_json.get("ErrorMessage") or resp_json.get("Error")
-            st.error(f"OCR.space returned error for page {page_num}: {err}")
-            methods[page_num] = "ocr_error"
-            extracted_text[page_num - 1] = ""
-        else:
-            parsed_results = resp_json.get("ParsedResults") or []
-            if parsed_results:
-                # Usually one object per page (since we uploaded single page)
-                parsed_text = parsed_results[0].get("ParsedText", "") or ""
-                if parsed_text.strip():
-                    methods[page_num] = "ocr.space"
-                    extracted_text[page_num - 1] = parsed_text
-                    success_count += 1
-                    st.success(f"OCR success for page {page_num} ({len(parsed_text)} chars).")
-                else:
-                    methods[page_num] = "ocr_empty"
-                    extracted_text[page_num - 1] = ""
-                    st.warning(f"OCR returned empty text for page {page_num}.")
-            else:
-                methods[page_num] = "no_parsed_results"
-                extracted_text[page_num - 1] = ""
-                st.error(f"No parsed results for page {page_num} from OCR.space.")
-
-        # small delay to avoid hitting rate limits
-        time.sleep(per_page_delay)
-
-    progress.progress(1.0)
-    st.success(f"Finished OCR pages. Successful OCR pages: {success_count}/{len(needs_ocr_pages)}")
-
-# Build final output text
-final_parts = []
-for i, content in enumerate(extracted_text, start=1):
-    method = methods.get(i, "unknown")
-    text_block = content if content else "[no text found]"
-    final_parts.append(f"--- Page {i} | method: {method} ---\n{text_block}\n")
-
-final_text = "\n".join(final_parts)
+    failed = sum(1 for record in ocr_records if record.get("error"))
+    copies = sum(1 for record in ocr_records if record["method"].startswith("dedup_of:"))
+    cache_hits = sum(1 for record in ocr_records if record["cached"])
+    retried_pages = sum(1 for record in ocr_records if record.get("attempts", 1) > 1)
+    st.success(f"Finished OCR pages with {ENGINE_LABELS[engine_name]}. Successful OCR pages: "
+               f"{len(ocr_records) - failed}/{len(ocr_records)}")
+    if engine_name == "tesseract+ocr.space":
+        st.info(f"{engine.escalated}/{len(ocr_records)} page(s) escalated to OCR.space "
+                f"(local confidence below {min_confidence} or no text).")
+    if adaptive or retried_pages:
+        st.info((f"Request rate settled at {limiter.rate:.1f}/s (peak {limiter.peak_rate:.1f}/s, up to "
+                 f"{limiter.peak_limit} concurrent, {limiter.throttled} throttled response(s)). "
+                 if adaptive else "")
+                + f"{retried_pages} page(s) needed retries.")
+    sizes = [size for pages in upload_sizes.values() for size in pages.values()]
+    if sizes:
+        pdf_total = sum(before for before, _, _ in sizes)
+        upload_total = sum(after for _, after, _ in sizes)
+        fallbacks = sum(1 for _, _, fmt in sizes if fmt == "pdf")
+        oversize = sum(1 for _, after, _ in sizes if after > FREE_PLAN_LIMIT)
+        st.info(f"Uploaded {upload_total/1024:.1f} KB for {len(sizes)} page(s) "
+                f"(single-page PDFs: {pdf_total/1024:.1f} KB).")
+        if render_options and fallbacks:
+            st.warning(f"{fallbacks} page(s) could not be rendered and were uploaded as PDF "
+                       "(is poppler installed?).")
+        if uses_remote and oversize:
+            st.warning(f"{oversize} page upload(s) exceeded the OCR.space free-plan limit "
+                       f"({FREE_PLAN_LIMIT // 1024} KB) and may have been rejected.")
+    if any(split_sizes.values()):
+        # Plain page copies vs minimal single-page PDFs (unused resources
+        # dropped, identical objects merged, oversize images recompressed)
+        plain_total = sum(before for pages in split_sizes.values() for before, _ in pages.values())
+        split_total = sum(after for pages in split_sizes.values() for _, after in pages.values())
+        st.info(f"Page split: {plain_total/1024:.1f} KB as plain page copies, "
+                f"{split_total/1024:.1f} KB as minimal single-page PDFs.")
+        with st.expander("Single-page PDF sizes"):
+            st.dataframe([{**({} if single else {"document": name}), "page": page,
+                           "plain KB": round(before / 1024, 1), "minimal KB": round(after / 1024, 1)}
+                          for name, pages in split_sizes.items()
+                          for page, (before, after) in sorted(pages.items())])
+    if cache is not None:
+        st.info(f"Cache hits: {cache_hits}/{len(ocr_records)} page(s) served from cache — "
+                f"{len(ocr_records) - cache_hits - copies} page(s) sent to the OCR engine.")
+show_key_usage()
+
+
+def show_stage_summary(stats, methods):
+    st.caption(
+        f"Open: {stats['open_seconds']:.2f}s · "
+        f"pre-check: {stats['precheck_seconds']:.2f}s "
+        f"({stats['precheck_scan_pages']} page(s) labelled as scans) · "
+        f"extract_text: {stats['extract_text_seconds']:.2f}s "
+        f"({stats['extract_text_pages']} page(s))"
+    )
+    if stats.get("triage_render_error"):
+        st.warning("Page triage needs poppler to render thumbnails; it was skipped.")
+    elif stats.get("triage_blank") or stats.get("triage_to_ocr"):
+        st.info(f"Triage ({stats['triage_pages']} page(s) in {stats['triage_seconds']:.1f}s): "
+                f"{stats['triage_blank']} blank page(s) skipped, {stats['triage_to_ocr']} "
+                "mostly-scanned digital page(s) sent to OCR.")
+    if stats.get("dedup_exact") or stats.get("dedup_near"):
+        st.info(f"{stats['dedup_exact'] + stats['dedup_near']} duplicate page(s) ({stats['dedup_exact']} "
+                f"exact, {stats['dedup_near']} near) reused another page's text.")
+    if dedup_distance and stats.get("dedup_render_error"):
+        st.warning("Near-duplicate detection needs poppler to render thumbnails; only exact copies "
+                   "were grouped.")
+    st.json(methods)
+
+
+results = {name: (texts[name] if large_file else
+                  [texts[name].get(n, "") for n in range(1, max(pages) + 1)],
+                  {n: pages[n]["method"] for n in sorted(pages)})
+           for name, pages in records.items() if pages}
 
 st.subheader("Extraction summary")
-st.json(methods)
+for name, (_, methods) in results.items():
+    with st.container() if single else st.expander(name):
+        show_stage_summary(stage_stats[name], methods)
 
-st.subheader("Extracted text (preview)")
-st.text_area("Full extracted text", final_text.strip(), height=480)
+# Per-stage spans: where did the time go (parsing, upload or API wait)?
+show_stage_timings(tracer, next(iter(results.values()))[1] if single and results else None)
 
-st.download_button("💾 Download extracted text", final_text, "extracted_text.txt")
+# Only the pages in view are rendered; exports are written page by page to a
+# temp file when a download button is clicked, never built as one string
+st.subheader("Extracted text")
+if single and results:
+    extracted_text, methods = next(iter(results.values()))
+    show_pages(extracted_text, methods)
+    export_buttons(extracted_text, methods)
+else:
+    show_documents(results)
 
 st.markdown("---")
 st.markdown(
-    "- This app first tries to extract digital text (fast). Pages without digital text are uploaded one-by-one to OCR.space.\n"
+    "- This app first tries to extract digital text (fast). Pages without digital text are OCRed one-by-one: uploaded to OCR.space, recognised locally with Tesseract, or both (Tesseract first, low-confidence pages escalated to OCR.space).\n"
     "- Single-page uploads are used to work around OCR.space free-plan limit (1 MB). If a single page still exceeds the limit, OCR.space may still reject it.\n"
-    "- If many pages are large or OCR.space keeps rejecting pages, consider: (A) using a paid OCR.space plan with larger upload limits, (B) using a different OCR API (Google Vision / Azure), or (C) rendering & downscaling images locally before OCR (requires installing rendering libraries)."
+    "- Rendering pages to compressed grayscale images (pdf2image + poppler) keeps most uploads under the limit. If OCR.space keeps rejecting pages, consider: (A) lowering the DPI / upload budget, (B) using a paid OCR.space plan with larger upload limits, or (C) using a different OCR API (Google Vision / Azure)."
 )
 
 
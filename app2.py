@@ -2,8 +2,20 @@
 # app.py
 import streamlit as st
 from google import genai
-from google.genai import types
 import json
+import os
+from functools import partial
+
+from exports import export_json
+from gemini_client import generate_many, remap_answer, split_trailing_json
+from hybrid import HybridDocument
+from job_panel import get_runner, remember_job, show_jobs
+from live_text import LiveText
+from prompts import general_medication_extraction_prompt
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from telemetry import Tracer
+from telemetry_panel import show_stage_timings
+from viewer import show_json_pages, show_sections
 
 st.set_page_config(page_title="PDF → Gemini (multi-prompt OCR)", layout="wide")
 st.title("📄 PDF → Gemini — multi-prompt extractor")
@@ -30,6 +42,45 @@ model_option = st.selectbox(
     help="Best OCR models: gemini-2.0-flash-exp, gemini-2.5-flash"
 )
 
+use_cache = st.sidebar.checkbox("Cache Gemini results on disk", value=True,
+                                help="Reuse answers for the same PDF, model and prompt (survives reruns).")
+cache_dir = st.sidebar.text_input("Cache directory", value=DEFAULT_CACHE_DIR)
+cache = ResultCache(cache_dir) if use_cache else None
+
+# Define all prompts dictionary - FIXED: Added opening brace
+prompts = {
+    "General medication extraction prompt": general_medication_extraction_prompt
+}
+
+# Upload the PDF once and run all prompts against that handle concurrently;
+# results are shown in the fixed order of `prompts`.
+use_context_cache = st.sidebar.checkbox("Use Gemini context caching", value=True,
+                                        help="Cache the uploaded document server-side when the model supports it.")
+max_concurrency = st.sidebar.number_input("Max concurrent prompts", min_value=1, max_value=16, value=4)
+stream_output = st.sidebar.checkbox("Stream output as it is generated", value=True,
+                                    help="Renders each prompt's answer as it arrives; prompts still run concurrently.")
+# Hybrid mode: typed pages are read locally and sent as text; only scanned /
+# handwritten pages go to Gemini as PDF (page references are mapped back)
+hybrid_mode = st.sidebar.checkbox("Send only scanned / handwritten pages as PDF", value=True,
+                                  help="Typed pages are extracted locally and sent as text, which is much "
+                                       "cheaper and faster than page images.")
+
+# Background mode: prompts keep running (each answer is saved as it
+# finishes) when the tab is closed or the script reruns
+background = st.sidebar.checkbox("Run as background job", value=False,
+                                 help="Submit the PDF as a job and follow its progress; interrupted jobs "
+                                      "resume with the prompts that are still missing.")
+if background:
+    runner = get_runner()
+    if uploaded and api_key.strip() and st.button("Submit background job"):
+        job_id = runner.submit_gemini(uploaded, uploaded.name, api_key, model_option, prompts,
+                                      use_context_cache=use_context_cache, hybrid=hybrid_mode,
+                                      cache_dir=cache_dir if use_cache else None)
+        remember_job(job_id)
+        st.success(f"Submitted job {job_id}.")
+    show_jobs(runner, "gemini", api_key.strip())
+    st.stop()
+
 if not uploaded:
     st.info("Upload a PDF to extract text.")
     st.stop()
@@ -40,6 +91,13 @@ if not api_key.strip():
 
 pdf_bytes = uploaded.read()
 
+hybrid = None
+if hybrid_mode:
+    with st.spinner("Reading typed pages locally..."):
+        hybrid = HybridDocument(pdf_bytes, workers=os.cpu_count() or 1)
+    st.info(f"Hybrid mode: {len(hybrid.scanned_pages)} scanned / handwritten page(s) sent as PDF, "
+            f"{len(hybrid.digital_pages)} typed page(s) sent as text.")
+
 # Initialize client
 try:
     client = genai.Client(api_key=api_key)
@@ -47,123 +105,42 @@ except Exception as e:
     st.error(f"Failed to initialize Gemini client: {e}")
     st.stop()
 
-# Define general medication extraction prompt
-general_medication_extraction_prompt = """You are a licensed medical practitioner and clinical reviewer.
-
-TASK (high level)
-From the provided medical document (may contain printed text, scanned pages, and handwriting), extract the following clinical information and return it in two outputs:
-
-A) Plain-text output (human-readable) in this exact order and formatting:
-   1) A single short paragraph labeled "Hospital Course" (one paragraph).
-   2) A named block labeled "Operative Notes:" containing five single-line fields:
-       Date: <Admission Date or NOT_FOUND>
-       Surgery: <Proposed/Performed Surgery or NOT_FOUND>
-       Surgeon: <Dr. Full Name or Dr. NOT_FOUND>
-       Anesthesia: <Anesthesia type or NOT_FOUND>
-       Anesthetist: <Dr. Full Name or Dr. NOT_FOUND>
-   3) A single short paragraph labeled "Operative Details:" (one paragraph) describing the procedure, intra-op findings, catheter/foley/irrigation details and immediate postop course; if nothing found output exactly NOT_FOUND for this paragraph.
-
-B) A single JSON block (exact schema below) after the plain-text block. The JSON must be the only JSON block returned (no extra commentary).
-
-IMPORTANT PRINCIPLES (in order)
-1. **Conservative extraction:** do NOT invent facts. If illegible or ambiguous, insert "NOT_FOUND".  
-2. **Preserve tokens:** preserve original words where readable; when merging fragmented handwritten lines, produce a concise medically sensible sentence using only source tokens.  
-3. **Name formatting & stripping:** Format person names as `Dr. First [Middle] Last`. Remove registration numbers, material codes, and parenthetical codes from names.  
-4. **Page numbers:** return the page number where the heading or main block appears. If not found, return -1. If content appears across pages, use the page containing the main heading; if heading absent, use the earliest page containing the related sentence(s).
-
-HOW TO LOCATE EACH ITEM
-- **Hospital Course:** match tolerant headings: "Hospital Course", "Clinical Summary", "Clinical Course", "Course in Hospital", "Hospital Course / Clinical Summary". Condense the paragraph(s) under that heading into one short paragraph covering admission reason, investigations, monitoring, daily consultant (if present), consultant physician (fitness for surgery), pre-op assessment, and disposition at time of operation.
-
-- **Operative Notes (fields):**
-  - **Date:** Prefer the Admission Date shown top-right/header on the first few pages. If not present there, search the document for "Admission Date", "Admit Date", or dates near the Hospital Course or header.
-  - **Surgery:** Look for fields labeled "Proposed Surgery", "Surgery", "Procedure", or operation header. Use the procedure name exactly as printed (e.g., "Cystoscopy with OIU with TURP + Bladder neck incision").
-  - **Surgeon:** Label cues: "Surgeon:", "Operative Surgeon", "Consultant:", "Consultant Dr", "Consultant", "Daily consulted by", "Consulted by". Choose the name nearest to the Hospital Course or Operative heading (±3 lines). If ambiguous/unreadable → `Dr. NOT_FOUND`.
-  - **Anesthesia:** Search for "Anesthesia", "Anaesthesia", "Type of Anaesthesia", "Spinal", "General", "Regional", etc. If multiple types mentioned, choose the type actually used for the surgery; otherwise return the most clearly stated value or NOT_FOUND.
-  - **Anesthetist:** Label cues: "Anesthetist:", "Anesthesiologist:", "Anaesthetist". Return `Dr. Full Name` or `Dr. NOT_FOUND`.
-
-- **Operative Details:** Search headings labelled "Operation Note", "Operative Notes", "Procedure details", "Procedure", "Operative Details". Capture handwritten/printed operation descriptions (intra-op findings, resection, catheter/foley/irrigation status, immediate postop condition, NBM/feeds, meds started). Merge into one concise paragraph. If absent, return exactly `NOT_FOUND`.
-
-ALLOWED MINOR OCR CORRECTIONS
-You may correct **single-word OCR errors** for common medical tokens only (examples):  
-`urethanotomy→urethrotomy`, `uretheric→ureteric`, `hematura→hematuria`, `trabeculated→trabeculated`, `Foley→Foley`, `catheter→catheter`, `TURP→TURP`, `OIU→OIU`, `BNI→BNI`, `lobe→lobe`, `bladder→bladder`, `irrigation→irrigation`.  
-Do NOT invent procedures, outcomes, dates, or timings. Corrections must be token-level and conservative.
-
-OUTPUT FORMAT (exact - plain text + JSON)
-Return EXACTLY the following plain-text structure (including labels and punctuation), then a blank line, then the JSON block (no extra text):
-
-Plain-text (example formatting — replace extracted text or NOT_FOUND):
-
-Hospital Course
-Patient was admitted with the above mentioned complaints and history. All relevant laboratory investigations done (Reports attached to the file). General condition and vitals of the patient closely monitored. Daily consulted by Dr. <SURGEON_NAME>. Fitness for surgery given by Dr. <CONSULTANT_NAME> (Consultant Physician). All preoperative assessment done, patient taken up for surgery.
-
-Operative Notes:
-Date: <DD-MM-YYYY or NOT_FOUND>
-Surgery: <Surgery name or NOT_FOUND>
-Surgeon: <Dr. Full Name or Dr. NOT_FOUND>
-Anesthesia: <Anesthesia type or NOT_FOUND>
-Anesthetist: <Dr. Full Name or Dr. NOT_FOUND>
-
-Operative Details:
-<One concise paragraph assembled from operative note or NOT_FOUND>
-
-After this (on a new line) output **only one** JSON object matching this exact schema:
-
-{
-  "hospital_course_text": "<Exact Hospital Course paragraph above>",
-  "hospital_course_page": <page_number_or_-1>,
-  "operative_notes": {
-    "date": "<DD-MM-YYYY or NOT_FOUND>",
-    "surgery": "<Surgery name or NOT_FOUND>",
-    "surgeon": "<Dr. Full Name or Dr. NOT_FOUND>",
-    "anesthesia": "<Anesthesia type or NOT_FOUND>",
-    "anesthetist": "<Dr. Full Name or Dr. NOT_FOUND>",
-    "page": <page_number_or_-1>
-  },
-  "operative_details_text": "<Exact Operative Details paragraph above or 'NOT_FOUND'>",
-  "operative_details_page": <page_number_or_-1>,
-  "surgeon_name": "<Dr. Full Name or Dr. NOT_FOUND>",
-  "consultant_physician_name": "<Dr. Full Name (Consultant Physician) or Dr. NOT_FOUND (Consultant Physician)>"
-}
-
-ADDITIONAL RULES & FALLBACKS
-- If multiple pages contain pieces of a section, set the section page to the page where the heading appears; if heading absent, set to earliest page where related sentences appear.
-- If a doctor name in JSON is `Dr. NOT_FOUND` but you locate a clear `Dr. X` elsewhere by label regex (e.g., near "Consultant"), prefer that name and overwrite the NOT_FOUND.
-- Do not return any other text, lists, confidence numbers, or debug info. The output must be exactly:
-  1) Plain-text block as described (Hospital Course, Operative Notes, Operative Details),
-  2) A blank line,
-  3) A single JSON object (strict schema).
-
-END TASK.
+combined_output = {}
+cache_hits = 0
+call_stats = {}
+tracer = Tracer()
+live_views = {}
 
-"""
 
-# Define all prompts dictionary - FIXED: Added opening brace
-prompts = {
-    "General medication extraction prompt": general_medication_extraction_prompt
-}
+def show_stream(section_name, text):
+    if section_name not in live_views:
+        live_views[section_name] = LiveText(st.empty())
+    live_views[section_name](text)
 
-# Process each prompt separately
-combined_output = {}
 
 with st.spinner("Processing document..."):
-    for section_name, prompt_text in prompts.items():
+    try:
+        results = generate_many(client, model_option, hybrid.pdf_bytes if hybrid else pdf_bytes, prompts,
+                                max_concurrency=int(max_concurrency), cache=cache,
+                                use_context_cache=use_context_cache,
+                                on_chunk=show_stream if stream_output else None, stats=call_stats,
+                                tracer=tracer, text_parts=hybrid.text_parts if hybrid else ())
+    except Exception as e:
+        # Upload itself failed: report it against every section
+        results = {name: ("", False, e) for name in prompts}
+    for view in live_views.values():
+        view.clear()
+
+    for section_name, (text, cached, error) in results.items():
         try:
-            # Create PDF part for this request
-            pdf_part = types.Part(
-                inline_data=types.Blob(
-                    mime_type="application/pdf",
-                    data=pdf_bytes
-                )
-            )
-            
-            # Call Gemini
-            response = client.models.generate_content(
-                model=f"models/{model_option}",
-                contents=[pdf_part, prompt_text]
-            )
-            
-            text = (response.text or "").strip() if response else ""
-            
+            if error is not None:
+                raise error
+            if cached:
+                cache_hits += 1
+            if hybrid is not None:
+                # Page references come back in the request's numbering
+                text = remap_answer(text, hybrid)
+
             if not text:
                 st.warning(f"No response for {section_name}")
                 combined_output[section_name] = "NOT_FOUND"
@@ -171,23 +148,32 @@ with st.spinner("Processing document..."):
             
             # Display section
             st.markdown(f"### 📋 {section_name.replace('_', ' ').title()}")
+            timing = call_stats.get(section_name)
+            if timing and timing.get("total_seconds") is not None:
+                ttft = timing.get("ttft_seconds")
+                st.caption((f"Time to first token: {ttft:.1f}s · " if ttft is not None else "")
+                           + f"Total: {timing['total_seconds']:.1f}s")
             
             # Show raw text
             with st.expander(f"View raw output - {section_name}"):
                 st.text_area(f"Raw ({section_name})", value=text, height=200, key=f"raw_{section_name}")
             
-            # Try parse JSON
+            # Parse the trailing JSON block (the prompt asks for plain text, then JSON)
             try:
-                parsed = json.loads(text)
-                st.json(parsed)
+                _, parsed = split_trailing_json(text)
+                if parsed is None:
+                    raise json.JSONDecodeError("no trailing JSON object", text, len(text))
+                # Long lists (e.g. hundreds of medications) are paged, not rendered at once
+                show_json_pages(parsed, key=f"json_{section_name}")
                 combined_output[section_name] = parsed
                 
-                # Download button
+                # Download button (JSON is written to a temp file on click)
                 st.download_button(
                     f"💾 Download {section_name}",
-                    data=json.dumps(parsed, indent=2),
+                    data=partial(export_json, parsed),
                     file_name=f"{section_name}.json",
                     mime="application/json",
+                    on_click="ignore",
                     key=f"download_{section_name}"
                 )
             except json.JSONDecodeError:
@@ -203,16 +189,23 @@ with st.spinner("Processing document..."):
 
 # Show combined results
 st.success(f"✅ Extraction completed using {model_option}!")
+if cache is not None:
+    st.info(f"Cache hits: {cache_hits}/{len(prompts)} prompt(s) served from cache — "
+            f"{len(prompts) - cache_hits} Gemini call(s) made.")
+
+# Per-stage spans (Gemini upload / calls): where did the time go?
+show_stage_timings(tracer)
 
 st.markdown("## 📊 Combined Results")
-st.json(combined_output)
+show_sections(combined_output, key="combined")
 
 # Download combined JSON
 st.download_button(
     "💾 Download All Results (Combined JSON)",
-    data=json.dumps(combined_output, indent=2),
+    data=partial(export_json, combined_output),
     file_name="combined_extracted_data.json",
     mime="application/json",
+    on_click="ignore",
     key="download_combined"
 )
 
@@ -1,6 +1,16 @@
+import os
+
 import streamlit as st
 from google import genai
-from google.genai import types
+
+from gemini_client import generate_chunked
+from hybrid import classify_for_hybrid
+from job_panel import get_runner, remember_job, show_jobs
+from live_text import LiveText
+from prompts import hospital_course_prompt
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from telemetry import Tracer
+from telemetry_panel import show_stage_timings
 
 st.set_page_config(page_title="PDF Text Extractor", layout="wide")
 st.title("📄 Simple PDF Text Extractor — Digital + Handwritten")
@@ -25,6 +35,41 @@ model_option = st.selectbox(
     index=0
 )
 
+use_cache = st.sidebar.checkbox("Cache Gemini results on disk", value=True,
+                                help="Reuse answers for the same PDF, model and prompt (survives reruns).")
+cache_dir = st.sidebar.text_input("Cache directory", value=DEFAULT_CACHE_DIR)
+cache = ResultCache(cache_dir) if use_cache else None
+
+# Long documents are split into overlapping page windows, extracted
+# concurrently and merged by a final call; short ones use a single request.
+chunked_mode = st.sidebar.checkbox("Chunked mode for long documents", value=True)
+chunk_pages = st.sidebar.number_input("Pages per chunk", min_value=2, max_value=200, value=20)
+chunk_overlap = st.sidebar.number_input("Overlap between chunks (pages)", min_value=0, max_value=20, value=2)
+chunk_concurrency = st.sidebar.number_input("Max concurrent chunk requests", min_value=1, max_value=16, value=4)
+stream_output = st.sidebar.checkbox("Stream output as it is generated", value=True)
+# Hybrid mode: typed pages are read locally and sent as text; only scanned /
+# handwritten pages go to Gemini as PDF
+hybrid_mode = st.sidebar.checkbox("Send only scanned / handwritten pages as PDF", value=True,
+                                  help="Typed pages are extracted locally and sent as text, which is much "
+                                       "cheaper and faster than page images.")
+
+# Background mode: the extraction keeps running when the tab is closed or the
+# script reruns; finished page windows are reused from the cache on resume
+background = st.sidebar.checkbox("Run as background job", value=False,
+                                 help="Submit the PDF as a job and follow its progress.")
+if background:
+    runner = get_runner()
+    if uploaded and api_key.strip() and st.button("Submit background job"):
+        chunked = {"window": int(chunk_pages), "overlap": min(int(chunk_overlap), int(chunk_pages) - 1)}
+        job_id = runner.submit_gemini(uploaded, uploaded.name, api_key, model_option,
+                                      {"Hospital course": hospital_course_prompt},
+                                      chunked=chunked if chunked_mode else None, hybrid=hybrid_mode,
+                                      cache_dir=cache_dir if use_cache else None)
+        remember_job(job_id)
+        st.success(f"Submitted job {job_id}.")
+    show_jobs(runner, "gemini", api_key.strip())
+    st.stop()
+
 if not uploaded:
     st.stop()
 
@@ -34,6 +79,14 @@ if not api_key.strip():
 
 pdf_bytes = uploaded.read()
 
+hybrid = None
+if hybrid_mode:
+    with st.spinner("Reading typed pages locally..."):
+        hybrid = classify_for_hybrid(pdf_bytes, workers=os.cpu_count() or 1)
+    scanned = sum(1 for text in hybrid[1].values() if text is None)
+    st.info(f"Hybrid mode: {scanned} scanned / handwritten page(s) sent as PDF, "
+            f"{len(hybrid[1]) - scanned} typed page(s) sent as text.")
+
 try:
     client = genai.Client(api_key=api_key)
 except Exception as e:
@@ -42,79 +95,26 @@ except Exception as e:
 
 st.success(f"✅ Using model: {model_option}")
 
-# Prompt for Gemini OCR
-hospital_course_prompt = """
-You are a licensed medical practitioner and clinical reviewer experienced with typed and handwritten clinical notes.
-
-GOAL
-Extract ALL clinically relevant text from target sections that collectively form the hospital course narrative, then merge into a single chronological record of the patient's hospitalization.
-
-TARGET SECTIONS (search in this order)
-1. Manual - Progress note / Progress Note / Doctor's Progress Notes (and variants)
-2. OT Note / Operation Note / Operative Note / Operative Details / Operation Report
-3. Anesthesia notes / Anaesthesia notes / Anesthetic Note / Anaesthesia Chart
-4. MDM sheet / MDM / Multidisciplinary Meeting / MDT / Case Discussion
-5. Diet sheet / Diet Orders / Dietary Chart
-
-ALGORITHM
-1) Page-by-page extraction:
-   - Locate exact or near-exact header variants (case-insensitive; allow small OCR errors)
-   - For each matched header, extract header line plus all verbatim readable text until next recognized header, explicit terminator, or end-of-page
-   - Preserve original line breaks and token order
-
-2) Focused fallback for missing sections:
-   - If any target section not found, search document for relevant keywords
-   - Extract nearest contiguous paragraphs and prepend appropriate header with "(AUTO-EXTRACT)"
-
-3) Content merging:
-   - Combine ALL extracted sections into ONE continuous narrative
-   - Arrange in chronological/document reading order
-   - Remove duplicate header lines but preserve chronological flow
-   - Maintain all clinically relevant content from progress notes, operative details, anesthesia records, MDM discussions, and diet information
-
-OUTPUT FORMAT (SIMPLE TEXT)
-Merge all extracted content into a single, continuous hospital course narrative that includes:
-- Diagnostic investigations and test results
-- Medical/surgical interventions  
-- Response to treatment
-- Complications (if any)
-- Overall progress
-- Patient condition
-- Clinical reasoning behind decisions
-
-Format as plain text with natural paragraph breaks. Do not include page numbers, JSON, or commentary.
-
-HANDWRITING/OCR GUIDELINES
-- Preserve readable tokens exactly
-- Use [ILLEGIBLE] for unreadable words
-- Allow minor conservative medical spelling corrections
-- Include both printed and handwritten text
-
-FINAL OUTPUT: Single merged hospital course text only.
-END.
-"""
-
-
-
-
 st.markdown("---")
 st.subheader("📑 Extracting Text...")
 
+# Streamed tokens of the final (single-shot or merge) request render here
+live = LiveText(st.empty()) if stream_output else None
+call_stats = {}
+tracer = Tracer()
+
 with st.spinner("Processing PDF with Gemini AI..."):
     try:
-        pdf_part = types.Part(
-            inline_data=types.Blob(
-                mime_type="application/pdf",
-                data=pdf_bytes
-            )
-        )
-
-        response = client.models.generate_content(
-            model=f"models/{model_option}",
-            contents=[pdf_part, hospital_course_prompt]
+        # A window larger than any document forces the single-shot path
+        extracted_text, parts, cache_hits = generate_chunked(
+            client, model_option, pdf_bytes, hospital_course_prompt,
+            window=int(chunk_pages) if chunked_mode else float("inf"),
+            overlap=min(int(chunk_overlap), int(chunk_pages) - 1),
+            max_concurrency=int(chunk_concurrency), cache=cache,
+            on_chunk=live, stats=call_stats, tracer=tracer, hybrid=hybrid
         )
-
-        extracted_text = (response.text or "").strip()
+        if live is not None:
+            live.clear()
 
         if not extracted_text:
             st.error("❌ No text returned from Gemini.")
@@ -125,11 +125,33 @@ with st.spinner("Processing PDF with Gemini AI..."):
         st.stop()
 
 st.success("✅ Text extraction complete!")
+if len(parts) > 1:
+    st.info(f"Chunked mode: {len(parts)} page windows merged by a final call "
+            f"({len(parts) + 1} Gemini requests, {cache_hits} served from cache).")
+elif cache_hits:
+    st.info("Cache hit: result served from the local cache — no Gemini call made.")
+if call_stats:
+    ttft = call_stats["ttft_seconds"]
+    st.caption(
+        (f"Time to first token: {ttft:.1f}s · " if ttft is not None else "")
+        + f"{'Final request' if len(parts) > 1 else 'Request'} time: {call_stats['total_seconds']:.1f}s"
+    )
 
 # Display output
 st.subheader("📜 Extracted Text")
 st.text_area("Full Text Output", value=extracted_text, height=500)
 
+if len(parts) > 1:
+    # Which pages fed which part of the narrative
+    with st.expander("Partial narratives by page range"):
+        for i, part in enumerate(parts, start=1):
+            start, end = part["pages"]
+            st.markdown(f"**Part {i} — pages {start}-{end}**")
+            st.text(part["text"] or "NOT_FOUND")
+
+# Per-stage spans (Gemini upload / calls): where did the time go?
+show_stage_timings(tracer)
+
 # Download button
 st.download_button(
     label="📥 Download Extracted Text",
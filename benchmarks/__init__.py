@@ -0,0 +1 @@
+# benchmarks: offline throughput harness (python -m benchmarks.run)
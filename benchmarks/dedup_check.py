@@ -0,0 +1,60 @@
+# benchmarks/dedup_check.py
+# Checks the exact page fingerprint used by dedup.py.
+#
+# Builds scanned PDFs whose pages paint their image through a form XObject
+# ("/Fm0 Do", as many scanners write them) or as an inline image and checks
+# that
+#   - pages with different images are never grouped, and
+#   - separate copies of the same pages are:
+#
+#   python -m benchmarks.dedup_check
+#
+# Exits non-zero when either check fails.
+import io
+import sys
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+
+from benchmarks.synthetic import make_pdf
+from dedup import find_duplicates
+
+
+def _check(label, pdf_bytes, expected):
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    found = find_duplicates(reader, range(1, len(reader.pages) + 1), pdf_source=pdf_bytes)
+    ok = found == expected
+    print(f"{label}: {found} (expected {expected}) -> {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def _inline_pdf(shades):
+    """One page per grey level in `shades`, each painting an 8 x 8 inline image."""
+    writer = PdfWriter()
+    for shade in shades:
+        page = writer.add_blank_page(612, 792)
+        content = DecodedStreamObject()
+        content.set_data(b"q 612 0 0 792 0 0 cm BI /W 8 /H 8 /CS /G /BPC 8 ID " + bytes([shade]) * 64
+                         + b" EI Q")
+        page[NameObject("/Contents")] = writer._add_object(content)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def main():
+    ok = _check("form-wrapped pages", make_pdf("form", 3), {})
+
+    # The same two pages twice, as separate objects
+    writer = PdfWriter()
+    for _ in range(2):
+        writer.append(PdfReader(io.BytesIO(make_pdf("form", 2))))
+    out = io.BytesIO()
+    writer.write(out)
+    ok &= _check("form-wrapped copies", out.getvalue(), {3: 1, 4: 2})
+    ok &= _check("inline images", _inline_pdf([0x20, 0x40, 0x20]), {3: 1})
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
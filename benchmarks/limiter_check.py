@@ -0,0 +1,75 @@
+# benchmarks/limiter_check.py
+# Checks that AdaptiveLimiter reacts to load, not to jitter.
+#
+# Drives the limiter from worker threads with simulated request latencies
+# (no network, no throttling) and checks that
+#   - jittered but steady latency never lowers the request rate, and
+#   - a sustained latency rise does:
+#
+#   python -m benchmarks.limiter_check --seconds 8
+#
+# Exits non-zero when either check fails.
+import argparse
+import random
+import sys
+import threading
+import time
+
+from ratelimit import AdaptiveLimiter
+
+
+def drive(limiter, latency, seconds, workers=8, seed=0):
+    """Send requests through `limiter` for `seconds`; `latency(elapsed, rng)`
+    gives each request's simulated round trip. Returns the lowest rate seen
+    after the first second."""
+    stop = time.monotonic() + seconds
+    started = time.monotonic()
+    lowest = [limiter.rate]
+    lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        while time.monotonic() < stop:
+            limiter.acquire()
+            try:
+                sent = time.monotonic()
+                time.sleep(latency(sent - started, rng))
+                limiter.record("ok", time.monotonic() - sent)
+            finally:
+                limiter.release()
+            with lock:
+                lowest[0] = min(lowest[0], limiter.rate)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return lowest[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AdaptiveLimiter jitter / latency-rise check")
+    parser.add_argument("--seconds", type=float, default=8.0)
+    args = parser.parse_args(argv)
+    failed = False
+
+    # 0.02 +- 0.02 s: the average is always well above the fastest response
+    limiter = AdaptiveLimiter(max_in_flight=8, initial_rate=2.0)
+    lowest = drive(limiter, lambda elapsed, rng: rng.uniform(0.0, 0.04), args.seconds)
+    ok = lowest >= 2.0 and limiter.rate > 2.0
+    failed |= not ok
+    print(f"jitter only: rate {limiter.rate:.1f}/s, lowest {lowest:.1f}/s -> {'ok' if ok else 'FAIL'}")
+
+    # Latency jumps tenfold halfway through and stays there
+    limiter = AdaptiveLimiter(max_in_flight=8, initial_rate=2.0, max_rate=20.0)
+    half = args.seconds / 2
+    drive(limiter, lambda elapsed, rng: rng.uniform(0.0, 0.04) * (10 if elapsed > half else 1), args.seconds)
+    ok = limiter.rate < limiter.peak_rate
+    failed |= not ok
+    print(f"latency rise: rate {limiter.rate:.1f}/s, peak {limiter.peak_rate:.1f}/s -> {'ok' if ok else 'FAIL'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# benchmarks/memory_check.py
+# Checks the large-file mode memory target documented in large_file.py.
+#
+# Writes a large scanned PDF to disk, runs the OCR pipeline over it in
+# large-file mode against the local OCR.space mock and samples the worker's
+# private (anonymous) memory while it runs:
+#
+#   python -m benchmarks.memory_check --pages 400 --page-kb 1000
+#
+# Exits non-zero when the peak is above the target.
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.mock_servers import MockBehaviour, MockServer
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+
+def write_scanned_pdf(path, pages, page_kb, seed=0):
+    """Stream a `pages`-page PDF with one incompressible ~page_kb image per
+    page straight to `path`, so the parent never holds the file in memory."""
+    rng = random.Random(seed)
+    side = int((page_kb * 1024) ** 0.5)
+    offsets = {}
+    with open(path, "wb") as f:
+        def obj(num, body, stream=None):
+            offsets[num] = f.tell()
+            f.write(f"{num} 0 obj\n".encode() + body)
+            if stream is not None:
+                f.write(b"\nstream\n" + stream + b"\nendstream")
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        kids = " ".join(f"{3 + 3 * i} 0 R" for i in range(pages))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, f"<< /Type /Pages /Count {pages} /Kids [{kids}] >>".encode())
+        content = f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im1 Do Q".encode()
+        for i in range(pages):
+            page, contents, image = 3 + 3 * i, 4 + 3 * i, 5 + 3 * i
+            obj(page, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                       f"/Resources << /XObject << /Im1 {image} 0 R >> >> "
+                       f"/Contents {contents} 0 R >>").encode())
+            obj(contents, f"<< /Length {len(content)} >>".encode(), content)
+            obj(image, (f"<< /Type /XObject /Subtype /Image /Width {side} /Height {side} "
+                        f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Length {side * side} >>").encode(),
+                rng.randbytes(side * side))
+
+        xref = f.tell()
+        count = 3 + 3 * pages
+        f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode())
+        for num in range(1, count):
+            f.write(f"{offsets[num]:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def _rss_anon_mb():
+    with open("/proc/self/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _check_process(spec, conn):
+    """Runs in a fresh (spawned) interpreter so the baseline is clean."""
+    os.environ["OCR_SPACE_URL"] = spec["ocr_url"]
+    from extraction import extract_pdf_pages
+    from large_file import MappedPdf
+    from ocr_space import single_page_pdf
+    from ratelimit import TokenBucket
+
+    peak = [_rss_anon_mb()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.02):
+            peak[0] = max(peak[0], _rss_anon_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    limiter = TokenBucket(rate=spec["rps"], burst=1, max_in_flight=spec["in_flight"])
+    methods = {}
+    for record in extract_pdf_pages(None, "memcheck", limiter=limiter, max_workers=spec["in_flight"],
+                                    pdf_path=spec["path"]):
+        methods[record["method"]] = methods.get(record["method"], 0) + 1
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    peak[0] = max(peak[0], _rss_anon_mb())
+
+    # Every page carries the same image size, so page 1 is the largest payload
+    with MappedPdf(spec["path"]) as mapped:
+        largest = len(single_page_pdf(mapped.reader, 1))
+
+    conn.send({"peak_anon_mb": peak[0], "largest_payload": largest,
+               "seconds": elapsed, "methods": methods})
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the large-file mode memory target.")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--page-kb", type=int, default=1000, help="Image bytes per scanned page (KB)")
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=200.0)
+    parser.add_argument("--latency", type=float, default=0.01, help="Mock mean latency (s)")
+    parser.add_argument("--keep", help="Write the test PDF here and keep it")
+    args = parser.parse_args(argv)
+
+    from large_file import LARGE_FILE_BASE_MB
+
+    path = args.keep or tempfile.mkstemp(suffix=".pdf")[1]
+    try:
+        write_scanned_pdf(path, args.pages, args.page_kb)
+        file_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{args.pages} pages, {file_mb:.0f} MB on disk", flush=True)
+
+        with MockServer("ocr", MockBehaviour(latency=args.latency, jitter=0.0)) as ocr_server:
+            spec = {"path": path, "rps": args.rps, "in_flight": args.in_flight,
+                    "ocr_url": ocr_server.url + "/parse/image"}
+            ctx = multiprocessing.get_context("spawn")
+            parent_conn, child_conn = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_check_process, args=(spec, child_conn))
+            process.start()
+            child_conn.close()
+            result = parent_conn.recv()
+            process.join()
+    finally:
+        if not args.keep:
+            os.remove(path)
+
+    largest_mb = result["largest_payload"] / (1024 * 1024)
+    target_mb = LARGE_FILE_BASE_MB + args.in_flight * 3 * largest_mb
+    ok = result["peak_anon_mb"] <= target_mb
+    print(f"pages: {result['methods']}  {result['seconds']:.1f}s")
+    print(f"peak anonymous memory {result['peak_anon_mb']:.0f} MB, target {target_mb:.0f} MB "
+          f"({LARGE_FILE_BASE_MB} + {args.in_flight} x 3 x {largest_mb:.2f} MB): {'OK' if ok else 'FAIL'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# benchmarks/mock_servers.py
+# Local stand-ins for the OCR.space parse endpoint and the Gemini generate
+# endpoint, so pipeline throughput can be measured without spending quota.
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockBehaviour:
+    """Latency / failure profile shared by both mocks.
+
+    latency:      mean seconds before answering
+    jitter:       +/- uniform jitter around `latency`
+    error_rate:   probability of an API-level error (OCR.space:
+                  IsErroredOnProcessing, Gemini: HTTP 500)
+    rate_limit:   requests per second accepted before answering 429
+                  (0 disables), enforced with a 1-second sliding window
+    key_rate_limit: the same, per OCR.space API key
+    bad_keys:       OCR.space API keys answered with 403 (invalid key)
+    """
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, rate_limit=0, seed=None,
+                 key_rate_limit=0, bad_keys=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.key_rate_limit = key_rate_limit
+        self.bad_keys = set(bad_keys)
+        self._key_windows = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = []
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.connections = 0
+        self.key_requests = {}
+
+    def reset_counters(self):
+        with self._lock:
+            self._window.clear()
+            self._key_windows.clear()
+            self.requests = self.throttled = self.errors = self.bytes_received = self.connections = 0
+            self.key_requests = {}
+
+    def connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def admit(self, size, key=None):
+        """Record one request; returns "ok", "throttled", "error" or "bad_key"."""
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += size
+            now = time.monotonic()
+            if key is not None:
+                self.key_requests[key] = self.key_requests.get(key, 0) + 1
+                if key in self.bad_keys:
+                    return "bad_key"
+                if self.key_rate_limit:
+                    window = [t for t in self._key_windows.get(key, []) if now - t < 1.0]
+                    self._key_windows[key] = window
+                    if len(window) >= self.key_rate_limit:
+                        self.throttled += 1
+                        return "throttled"
+                    window.append(now)
+            if self.rate_limit:
+                self._window = [t for t in self._window if now - t < 1.0]
+                if len(self._window) >= self.rate_limit:
+                    self.throttled += 1
+                    return "throttled"
+                self._window.append(now)
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                return "error"
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+        return "ok"
+
+    def counters(self):
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled,
+                    "errors": self.errors, "bytes_received": self.bytes_received,
+                    "connections": self.connections, "key_requests": dict(self.key_requests)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    behaviour = None
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # One handler instance per TCP connection (requests on it are kept
+        # alive). Headers and body are written separately: without
+        # TCP_NODELAY, Nagle + delayed ACK would stall every reused connection.
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.behaviour.connected()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_API_KEY_FIELD = re.compile(rb'name="apikey"\r\n\r\n([^\r]*)\r\n')
+
+
+class _OcrSpaceHandler(_Handler):
+    def do_POST(self):
+        body = self._read_body()
+        match = _API_KEY_FIELD.search(body)
+        outcome = self.behaviour.admit(len(body), key=match.group(1).decode("latin-1") if match else None)
+        if outcome == "bad_key":
+            self._send_json(403, {"ErrorMessage": ["The API key is invalid"]})
+        elif outcome == "throttled":
+            self._send_json(429, {"ErrorMessage": ["Rate limit exceeded"]})
+        elif outcome == "error":
+            self._send_json(200, {"IsErroredOnProcessing": True,
+                                  "ErrorMessage": ["E500: mock processing error"]})
+        else:
+            self._send_json(200, {
+                "ParsedResults": [{"ParsedText": f"mock OCR text ({len(body)} bytes)\r\n",
+                                   "FileParseExitCode": 1}],
+                "OCRExitCode": 1,
+                "IsErroredOnProcessing": False,
+                "ProcessingTimeInMilliseconds": str(int(self.behaviour.latency * 1000))
+            })
+
+
+class _GeminiHandler(_Handler):
+    def do_POST(self):
+        body = self._read_body()
+        outcome = self.behaviour.admit(len(body))
+        if outcome == "throttled":
+            self._send_json(429, {"error": {"code": 429, "message": "Resource exhausted",
+                                            "status": "RESOURCE_EXHAUSTED"}})
+            return
+        if outcome == "error":
+            self._send_json(500, {"error": {"code": 500, "message": "mock internal error",
+                                            "status": "INTERNAL"}})
+            return
+
+        response = {
+            "candidates": [{
+                "content": {"role": "model",
+                            "parts": [{"text": f"Mock hospital course ({len(body)} request bytes)."}]},
+                "finishReason": "STOP"
+            }],
+            "usageMetadata": {"promptTokenCount": len(body) // 4, "candidatesTokenCount": 8}
+        }
+        if ":streamGenerateContent" in self.path:
+            payload = ("data: " + json.dumps(response) + "\r\n\r\n").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self._send_json(200, response)
+
+
+class MockServer:
+    """Runs one mock on 127.0.0.1 in a background thread.
+
+        with MockServer("ocr", MockBehaviour(latency=0.1)) as server:
+            os.environ["OCR_SPACE_URL"] = server.url + "/parse/image"
+    """
+
+    def __init__(self, kind, behaviour):
+        handler = _OcrSpaceHandler if kind == "ocr" else _GeminiHandler
+        handler_class = type(f"{handler.__name__}Bound", (handler,), {"behaviour": behaviour})
+        self.behaviour = behaviour
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
@@ -0,0 +1,250 @@
+# benchmarks/run.py
+# Offline throughput benchmark for the extraction pipelines.
+#
+# Starts local OCR.space / Gemini mocks, drives the real pipeline code over
+# synthetic digital, scanned and mixed PDFs and writes the metrics as JSON so
+# runs can be compared between versions:
+#
+#   python -m benchmarks.run --label main -o bench_main.json
+#   python -m benchmarks.run --label branch -o bench_branch.json --compare bench_main.json
+#
+# Transport / key sharding: --bare-transport opens a connection per request
+# (the old requests.post behaviour) and --keys N shards pages over N keys
+# against a per-key mock limit:
+#
+#   python -m benchmarks.run --pipelines ocr --kinds scanned --bare-transport -o bare.json
+#   python -m benchmarks.run --pipelines ocr --kinds scanned -o pooled.json --compare bare.json
+#   python -m benchmarks.run --pipelines ocr --kinds scanned --key-rate-limit 5 --keys 3 --bad-keys 1
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+
+from benchmarks.mock_servers import MockBehaviour, MockServer
+from benchmarks.synthetic import make_pdf
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / scale
+
+
+def _run_ocr(spec, pdf_bytes):
+    from extraction import extract_pdf_pages
+    from ocr_engines import make_engine
+    from ratelimit import AdaptiveLimiter, TokenBucket
+    from transport import KeyPool, Transport
+
+    if spec["adaptive"]:
+        limiter = AdaptiveLimiter(max_in_flight=spec["in_flight"])
+    else:
+        limiter = TokenBucket(rate=spec["rps"], burst=1, max_in_flight=spec["in_flight"])
+    methods = {}
+    latencies = []
+    local_workers = os.cpu_count() or 1
+    keys = [f"bench-{i}" for i in range(1, spec["keys"] + 1)]
+    api_key = KeyPool(keys, rate=spec["key_rps"]) if len(keys) > 1 or spec["key_rps"] else keys[0]
+    transport = Transport(pool_size=spec["in_flight"], keep_alive=not spec["bare_transport"])
+    with transport, make_engine(spec["ocr_engine"], api_key, limiter=limiter, workers=local_workers,
+                                transport=transport) as engine:
+        for record in extract_pdf_pages(pdf_bytes, api_key, limiter=limiter, cache=None,
+                                        max_workers=spec["in_flight"] + local_workers,
+                                        classify_workers=spec["classify_workers"], engine=engine):
+            methods[record["method"]] = methods.get(record["method"], 0) + 1
+            if record.get("seconds") is not None:
+                latencies.append(record["seconds"])
+    if isinstance(api_key, KeyPool):
+        methods["keys"] = api_key.stats()
+    return methods, latencies, "per_page"
+
+
+def _run_gemini(spec, pdf_bytes):
+    from google import genai
+
+    from gemini_client import generate_chunked
+    from hybrid import classify_for_hybrid
+
+    client = genai.Client(api_key="bench")
+    latencies = []
+    generate = client.models.generate_content
+
+    def timed_generate(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return generate(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    client.models.generate_content = timed_generate
+    try:
+        text, parts, _ = generate_chunked(client, "gemini-2.5-flash", pdf_bytes, "Benchmark prompt",
+                                          window=spec["window"], overlap=2,
+                                          max_concurrency=spec["in_flight"],
+                                          hybrid=classify_for_hybrid(pdf_bytes) if spec["hybrid"] else None)
+        methods = {"gemini": len(parts)}
+    except Exception as e:
+        methods = {"failed": 1, "error": str(e)}
+    return methods, latencies, "per_request"
+
+
+def _scenario_process(spec, conn):
+    """Runs in a fresh (spawned) interpreter so peak RSS is per scenario."""
+    os.environ["OCR_SPACE_URL"] = spec["ocr_url"]
+    os.environ["GOOGLE_GEMINI_BASE_URL"] = spec["gemini_url"]
+    pdf_bytes = make_pdf(spec["kind"], spec["pages"])
+
+    started = time.perf_counter()
+    runner = _run_ocr if spec["pipeline"] == "ocr" else _run_gemini
+    methods, latencies, latency_kind = runner(spec, pdf_bytes)
+    elapsed = time.perf_counter() - started
+
+    conn.send({
+        "pdf_bytes": len(pdf_bytes),
+        "seconds": elapsed,
+        "pages_per_second": spec["pages"] / elapsed if elapsed else None,
+        "latency_kind": latency_kind,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "latency_mean": statistics.fmean(latencies) if latencies else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "methods": methods,
+    })
+    conn.close()
+
+
+def run_scenario(spec, ocr_server, gemini_server):
+    ocr_server.behaviour.reset_counters()
+    gemini_server.behaviour.reset_counters()
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_scenario_process, args=(spec, child_conn))
+    process.start()
+    child_conn.close()
+    result = parent_conn.recv()
+    process.join()
+
+    server = ocr_server if spec["pipeline"] == "ocr" else gemini_server
+    counters = server.behaviour.counters()
+    result.update({
+        "bytes_uploaded": counters["bytes_received"],
+        "api_requests": counters["requests"],
+        "api_throttled": counters["throttled"],
+        "api_errors": counters["errors"],
+        "api_connections": counters["connections"],
+        "api_key_requests": counters["key_requests"],
+    })
+    return dict({k: spec[k] for k in ("pipeline", "kind", "pages")}, **result)
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    index = {(s["pipeline"], s["kind"], s["pages"]): s for s in baseline["scenarios"]}
+    print(f"\nvs {baseline.get('label') or baseline_path}:")
+    for s in current["scenarios"]:
+        old = index.get((s["pipeline"], s["kind"], s["pages"]))
+        if old is None or not old.get("pages_per_second"):
+            continue
+        change = (s["pages_per_second"] / old["pages_per_second"] - 1) * 100
+        print(f"  {s['pipeline']:6} {s['kind']:8} {s['pages']:5}p  "
+              f"{old['pages_per_second']:9.1f} -> {s['pages_per_second']:9.1f} pages/s ({change:+.1f}%)  "
+              f"peak RSS {old['peak_rss_mb']:.0f} -> {s['peak_rss_mb']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark against local API mocks.")
+    parser.add_argument("--pipelines", default="ocr,gemini", help="Comma list: ocr, gemini")
+    parser.add_argument("--kinds", default="digital,scanned,mixed", help="Comma list: digital, scanned, mixed, shared, form")
+    parser.add_argument("--sizes", default="10,200,2000", help="Comma list of page counts")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock mean latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Mock latency jitter (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock API error probability")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Mock requests/sec before 429 (0 = off)")
+    parser.add_argument("--rps", type=float, default=100.0, help="Client OCR requests per second")
+    parser.add_argument("--in-flight", type=int, default=8, help="Client concurrent requests")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="OCR: AIMD request rate with --in-flight as the upper bound (--rps is ignored)")
+    parser.add_argument("--classify-workers", type=int, default=1)
+    parser.add_argument("--bare-transport", action="store_true",
+                        help="New connection per OCR request instead of the keep-alive pool")
+    parser.add_argument("--keys", type=int, default=1, help="OCR API keys to shard pages over")
+    parser.add_argument("--bad-keys", type=int, default=0,
+                        help="How many of the --keys the mock rejects as invalid (403)")
+    parser.add_argument("--key-rps", type=float, default=None, help="Client requests/sec per key")
+    parser.add_argument("--key-rate-limit", type=int, default=0,
+                        help="Mock requests/sec per key before 429 (0 = off)")
+    parser.add_argument("--ocr-engine", default="ocr.space",
+                        help="OCR: ocr.space, tesseract or tesseract+ocr.space (see ocr_engines.py)")
+    parser.add_argument("--window", type=int, default=20, help="Gemini chunk window (pages)")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Gemini: send only scanned pages as PDF, typed pages as text")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="Free-form label stored in the output (e.g. a git ref)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    behaviour = dict(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     rate_limit=args.rate_limit, seed=args.seed, key_rate_limit=args.key_rate_limit,
+                     bad_keys=[f"bench-{i}" for i in range(1, args.bad_keys + 1)])
+    results = {
+        "label": args.label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "scenarios": [],
+    }
+
+    with MockServer("ocr", MockBehaviour(**behaviour)) as ocr_server, \
+            MockServer("gemini", MockBehaviour(**behaviour)) as gemini_server:
+        for pipeline in args.pipelines.split(","):
+            for kind in args.kinds.split(","):
+                for pages in (int(n) for n in args.sizes.split(",")):
+                    spec = {
+                        "pipeline": pipeline, "kind": kind, "pages": pages,
+                        "rps": args.rps, "in_flight": args.in_flight, "adaptive": args.adaptive,
+                        "classify_workers": args.classify_workers, "window": args.window,
+                        "hybrid": args.hybrid,
+                        "ocr_engine": args.ocr_engine,
+                        "bare_transport": args.bare_transport, "keys": args.keys, "key_rps": args.key_rps,
+                        "ocr_url": ocr_server.url + "/parse/image",
+                        "gemini_url": gemini_server.url,
+                    }
+                    scenario = run_scenario(spec, ocr_server, gemini_server)
+                    results["scenarios"].append(scenario)
+                    p95 = scenario["latency_p95"]
+                    print(f"{pipeline:6} {kind:8} {pages:5}p  {scenario['pages_per_second']:9.1f} pages/s  "
+                          f"p95 {p95 * 1000 if p95 is not None else float('nan'):7.1f} ms  "
+                          f"RSS {scenario['peak_rss_mb']:6.0f} MB  "
+                          f"up {scenario['bytes_uploaded'] / 1024:9.1f} KB  "
+                          f"conn {scenario['api_connections']:5}", flush=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {len(results['scenarios'])} scenario(s) to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# benchmarks/synthetic.py
+# Synthetic digital / scanned / mixed PDFs for the benchmark harness.
+import io
+import zlib
+
+from pypdf import PdfWriter
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, NameObject,
+                           NumberObject, StreamObject)
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+# Scan image size: small enough that 2,000-page files stay manageable, large
+# enough that per-page payloads are realistic for the upload path
+SCAN_WIDTH = 850
+SCAN_HEIGHT = 1100
+
+
+def _font(writer):
+    return writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+
+
+def _scan_image(writer, page_num):
+    # Ruled "form" lines with a page-dependent offset: compresses like a real
+    # mostly-white scan and keeps every page's image distinct
+    row_white = b"\xff" * SCAN_WIDTH
+    row_ink = b"\xff" * 80 + b"\x20" * (SCAN_WIDTH - 160) + b"\xff" * 80
+    rows = [row_ink if (y + page_num * 7) % 37 < 3 else row_white for y in range(SCAN_HEIGHT)]
+    image = StreamObject()
+    image._data = zlib.compress(b"".join(rows))
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(SCAN_WIDTH),
+        NameObject("/Height"): NumberObject(SCAN_HEIGHT),
+        NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+        NameObject("/Filter"): NameObject("/FlateDecode"),
+    })
+    return writer._add_object(image)
+
+
+def make_pdf(kind, pages):
+    """Build a PDF of `pages` pages. kind: "digital", "scanned", "mixed"
+    (mixed alternates two digital pages with one scanned page), "shared"
+    (scanned pages that all point at one /Resources dictionary listing every
+    page's image, as some scanners and merge tools write them) or "form"
+    (scanned pages that paint a form XObject wrapping the page's image)."""
+    writer = PdfWriter()
+    font = _font(writer)
+    shared = None
+    if kind == "shared":
+        shared = writer._add_object(DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject(f"/Im{n}"): _scan_image(writer, n)
+                                                      for n in range(1, pages + 1)}),
+            NameObject("/ProcSet"): ArrayObject([NameObject("/PDF"), NameObject("/ImageB")]),
+        }))
+    for page_num in range(1, pages + 1):
+        scanned = kind in ("scanned", "form") or (kind == "mixed" and page_num % 3 == 0)
+        page = writer.add_blank_page(PAGE_WIDTH, PAGE_HEIGHT)
+        content = DecodedStreamObject()
+        if shared is not None:
+            page[NameObject("/Resources")] = shared
+            content.set_data(f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im{page_num} Do Q".encode())
+        elif kind == "form":
+            form = StreamObject()
+            form._data = f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im0 Do Q".encode()
+            form.update({
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Form"),
+                NameObject("/BBox"): ArrayObject([NumberObject(0), NumberObject(0),
+                                                  NumberObject(PAGE_WIDTH), NumberObject(PAGE_HEIGHT)]),
+                NameObject("/Resources"): DictionaryObject({
+                    NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): _scan_image(writer, page_num)}),
+                }),
+            })
+            page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({NameObject("/Fm0"): writer._add_object(form)}),
+            })
+            content.set_data(b"/Fm0 Do")
+        elif scanned:
+            page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({NameObject("/Im1"): _scan_image(writer, page_num)}),
+                NameObject("/ProcSet"): ArrayObject([NameObject("/PDF"), NameObject("/ImageB")]),
+            })
+            content.set_data(f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im1 Do Q".encode())
+        else:
+            page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+            })
+            lines = " ".join(
+                f"(Progress note line {n} on page {page_num}) Tj T*" for n in range(1, 41)
+            )
+            content.set_data(f"BT /F1 10 Tf 12 TL 50 740 Td {lines} ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
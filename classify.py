@@ -0,0 +1,209 @@
+# classify.py
+# Digital vs needs_ocr page classification for large PDFs.
+#
+# Stage 1 (pre-check) looks at page resources and the raw content stream to
+# label obvious scans without running pypdf's text extraction. Stage 2 runs
+# `extract_text` for the remaining pages, fanned out over a process pool when
+# the document is large enough to be worth it.
+import io
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+from large_file import MappedPdf, release_object_cache
+
+# Text-showing operators: Tj, TJ, ' and "
+_TEXT_OPS = re.compile(rb"(?:\)|\]|>)\s*(?:Tj|TJ|'|\")")
+# "a b c d e f cm /Name Do" — an image/form painted with an explicit matrix
+_NUM = rb"(-?\d*\.?\d+)"
+_CM_DO = re.compile(rb"\s+".join([_NUM] * 6) + rb"\s+cm\s*/([^\s/]+)\s+Do")
+
+# Below this many pages, process start-up costs more than it saves
+MIN_PAGES_FOR_POOL = 32
+
+# Fraction of the page an image must cover to count as a full-page scan
+FULL_PAGE_COVERAGE = 0.8
+
+
+def _resolve(obj):
+    return obj.get_object() if obj is not None else None
+
+
+def precheck_page(page):
+    """Cheap classification of one page without text extraction.
+
+    Returns "scan" when the page draws no text itself (no text-showing
+    operators) and has nothing else that could carry text, or is a full-page
+    image without fonts. Anything else is "unknown" and still goes through
+    `extract_text`.
+    """
+    try:
+        resources = _resolve(page.get("/Resources")) or {}
+        fonts = _resolve(resources.get("/Font")) or {}
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b""
+    except Exception:
+        return "unknown"
+
+    if _TEXT_OPS.search(data):
+        return "unknown"
+
+    # No text drawn by the page itself. A full-page image with no fonts is a
+    # plain scan even if small form XObjects (stamps, logos) are present.
+    if not fonts and _has_full_page_image(page, resources, data):
+        return "scan"
+    # Otherwise text can still hide in form XObjects; only trust "scan" without them
+    xobjects = _resolve(resources.get("/XObject")) or {}
+    for xobj in xobjects.values():
+        if _resolve(xobj).get("/Subtype") == "/Form":
+            return "unknown"
+    return "scan"
+
+
+def _has_full_page_image(page, resources, data):
+    return _largest_image_fraction(page, resources, data) >= FULL_PAGE_COVERAGE
+
+
+def _largest_image_fraction(page, resources, data):
+    xobjects = _resolve(resources.get("/XObject")) or {}
+    if not xobjects:
+        return 0.0
+    box = page.mediabox
+    page_area = float(box.width) * float(box.height)
+    if page_area <= 0:
+        return 0.0
+    largest = 0.0
+    for match in _CM_DO.finditer(data):
+        a, b, c, d = (float(v) for v in match.groups()[:4])
+        name = "/" + match.group(7).decode("latin-1")
+        xobj = xobjects.get(name)
+        if xobj is None or _resolve(xobj).get("/Subtype") != "/Image":
+            continue
+        largest = max(largest, abs(a * d - b * c) / page_area)
+    return largest
+
+
+def image_coverage(page):
+    """Fraction of the page covered by its largest directly painted image
+    (0.0 for none), e.g. a scanned or handwritten insert on a digital page."""
+    try:
+        resources = _resolve(page.get("/Resources")) or {}
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b""
+    except Exception:
+        return 0.0
+    return _largest_image_fraction(page, resources, data)
+
+
+def _extract_text(page):
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+
+
+# Worker-process state: each worker parses the PDF once, then extracts pages
+_worker_reader = None
+_worker_release_cache = False
+
+
+def _init_worker(pdf_source):
+    # `pdf_source` is the PDF bytes, or a file path in large-file mode
+    global _worker_reader, _worker_release_cache
+    if isinstance(pdf_source, str):
+        _worker_reader = MappedPdf(pdf_source).reader
+        _worker_release_cache = True
+    else:
+        _worker_reader = PdfReader(io.BytesIO(pdf_source))
+
+
+def _timed_extract(page):
+    started = time.perf_counter()
+    text = _extract_text(page)
+    return text, time.perf_counter() - started
+
+
+def _extract_chunk(page_nums):
+    results = []
+    for n in page_nums:
+        results.append((n,) + _timed_extract(_worker_reader.pages[n - 1]))
+        if _worker_release_cache:
+            release_object_cache(_worker_reader)
+    return results
+
+
+def classify_pages(pdf_reader, pdf_bytes=None, workers=1, stats=None, tracer=None,
+                   pdf_path=None, text_store=None):
+    """Try to read digital text from each page.
+
+    Returns (extracted_text, methods): a list of page texts (None for pages
+    that need OCR) and a {page_num: method} dict with "digital" / "needs_ocr".
+    With `workers` > 1 and the original `pdf_bytes`, text extraction is run
+    in a process pool. Stage timings and page counts are stored in `stats`;
+    a telemetry.Tracer gets per-page "precheck" and "classify" spans.
+
+    Large-file mode: pass `pdf_path` (the mapped file, used by pool workers)
+    instead of `pdf_bytes` and a large_file.PageTextStore as `text_store`;
+    pypdf's object cache is then released after every page.
+    """
+    total_pages = len(pdf_reader.pages)
+    extracted_text = text_store if text_store is not None else [None] * total_pages
+    methods = {i+1: None for i in range(total_pages)}
+    large_file = pdf_path is not None
+    pdf_source = pdf_path if large_file else pdf_bytes
+
+    started = time.perf_counter()
+    to_extract = []
+    for i, page in enumerate(pdf_reader.pages, start=1):
+        page_started = time.perf_counter()
+        label = precheck_page(page)
+        if tracer is not None:
+            tracer.add("precheck", time.perf_counter() - page_started, page=i,
+                       outcome="scan" if label == "scan" else "ok")
+        if label == "scan":
+            methods[i] = "needs_ocr"
+        else:
+            to_extract.append(i)
+        if large_file:
+            release_object_cache(pdf_reader)
+    precheck_done = time.perf_counter()
+
+    def extract_serial():
+        for n in to_extract:
+            yield (n,) + _timed_extract(pdf_reader.pages[n - 1])
+            if large_file:
+                release_object_cache(pdf_reader)
+
+    executor = None
+    if workers > 1 and pdf_source is not None and len(to_extract) >= MIN_PAGES_FOR_POOL:
+        # Contiguous chunks keep pypdf's per-worker object cache warm
+        chunk_size = max(1, -(-len(to_extract) // (workers * 4)))
+        chunks = [to_extract[i:i + chunk_size] for i in range(0, len(to_extract), chunk_size)]
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(pdf_source,))
+        results = (triple for chunk in executor.map(_extract_chunk, chunks) for triple in chunk)
+    else:
+        results = extract_serial()
+
+    try:
+        for page_num, page_text, seconds in results:
+            if tracer is not None:
+                tracer.add("classify", seconds, page=page_num, bytes_out=len(page_text))
+            if page_text.strip():
+                methods[page_num] = "digital"
+                extracted_text[page_num - 1] = page_text
+            else:
+                methods[page_num] = "needs_ocr"
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    extract_done = time.perf_counter()
+
+    if stats is not None:
+        stats["precheck_seconds"] = precheck_done - started
+        stats["extract_text_seconds"] = extract_done - precheck_done
+        stats["precheck_scan_pages"] = total_pages - len(to_extract)
+        stats["extract_text_pages"] = len(to_extract)
+    return extracted_text, methods
@@ -0,0 +1,259 @@
+# cli.py
+# Headless batch extraction: stream a directory / glob of PDFs through the
+# same pipeline as the Streamlit apps and write per-page results as JSONL.
+#
+#   python cli.py scans/ "archive/**/*.pdf" -o results.jsonl --workers 8
+#   python cli.py scans/ --engine tesseract+ocr.space --min-confidence 70
+#   python cli.py scans/ --api-key "$KEY_A,$KEY_B" --key-rps 1 --key-quota 500
+#   python cli.py scans/ --engine gemini --api-key $GEMINI_KEY --prompt hospital_course
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dedup import DEFAULT_MAX_DISTANCE
+from extraction import extract_pdf_pages, extract_with_gemini
+from large_file import LARGE_FILE_THRESHOLD
+from ocr_engines import DEFAULT_MIN_CONFIDENCE, ENGINES, make_engine
+from prompts import PROMPTS
+from ratelimit import AdaptiveLimiter, RetryPolicy, TokenBucket
+from render import DEFAULT_DPI, DEFAULT_MAX_BYTES
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, Transport, key_source
+
+_DONE = "__done__"
+
+# Global OCR.space requests per second without --adaptive
+DEFAULT_RPS = 1.25
+
+
+def find_pdfs(inputs):
+    """Expand files, directories (recursive) and glob patterns into PDF paths."""
+    seen = set()
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True)
+        elif os.path.isfile(item):
+            matches = [item]
+        else:
+            matches = glob.glob(item, recursive=True)
+        for path in sorted(matches):
+            if path.lower().endswith(".pdf") and path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+# Limiter, retry policy, API keys and transport of this worker process,
+# shared by every document it handles (set by _init_worker)
+_worker = {}
+
+
+def _init_worker(options):
+    """Process-pool initializer: build the per-process request state once, so
+    key quotas and rates hold over the whole batch (each process gets its
+    share) and keep-alive connections carry over from one document to the
+    next. The transport's sockets close when the process exits."""
+    if options["engine"] == "gemini":
+        return
+    # Each worker process gets its share of the global request rate
+    # (adaptive limiters find their share, under --rps if given)
+    if options["adaptive"]:
+        limiter = AdaptiveLimiter(max_in_flight=options["in_flight"], max_rate=options["rps"])
+    else:
+        limiter = TokenBucket(rate=options["rps"], burst=1, max_in_flight=options["in_flight"])
+    _worker.update(
+        limiter=limiter,
+        retry=RetryPolicy(max_attempts=options["retries"]),
+        # Several comma-separated keys are sharded, each with its share of
+        # the per-key rate and quota
+        api_key=key_source(options["api_key"], rate=options["key_rps"], quota=options["key_quota"]),
+        transport=Transport(options["pool_size"], options["connect_timeout"], options["read_timeout"]),
+    )
+
+
+def _process_document(path, options, queue):
+    """Worker-process entry point: extract one PDF and push records to `queue`."""
+    cache = ResultCache(options["cache_dir"]) if options["cache_dir"] else None
+    try:
+        if options["engine"] == "gemini":
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+            record = extract_with_gemini(pdf_bytes, options["api_key"], options["model"],
+                                         PROMPTS[options["prompt"]], cache=cache, hybrid=options["hybrid"])
+            queue.put(dict(record, file=path))
+        else:
+            # Big files are memory-mapped instead of read (large-file mode)
+            large_file = options["large_file"] or os.path.getsize(path) > LARGE_FILE_THRESHOLD
+            pdf_bytes = None
+            if not large_file:
+                with open(path, "rb") as f:
+                    pdf_bytes = f.read()
+            limiter, retry, api_key, transport = (_worker[name] for name in
+                                                  ("limiter", "retry", "api_key", "transport"))
+            with make_engine(options["engine"], api_key, limiter=limiter, cache=cache, retry=retry,
+                             workers=options["ocr_processes"], min_confidence=options["min_confidence"],
+                             transport=transport) as engine:
+                # Threads only wait on the engine: enough for every local process plus the uploads
+                max_workers = options["in_flight"] + (0 if options["engine"] == "ocr.space"
+                                                      else options["ocr_processes"])
+                for record in extract_pdf_pages(pdf_bytes, api_key, limiter=limiter,
+                                                cache=cache, max_workers=max_workers,
+                                                classify_workers=options["classify_workers"],
+                                                render_options=options["render_options"],
+                                                pdf_path=path if large_file else None,
+                                                retry=retry, engine=engine, dedup=options["dedup"],
+                                                dedup_distance=options["dedup_distance"],
+                                                triage=options["triage"], page_budget=options["page_budget"]):
+                    queue.put(dict(record, file=path))
+    except Exception as e:
+        queue.put({"file": path, "page": None, "method": "failed", "text": "", "error": str(e)})
+    finally:
+        if cache is not None:
+            cache.close()
+        queue.put({"file": path, _DONE: True})
+
+
+def run_batch(paths, out, options, workers):
+    """Fan documents out to a process pool and write records to `out` as they arrive."""
+    manager = multiprocessing.Manager()
+    queue = manager.Queue()
+    counts = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as executor:
+        futures = [executor.submit(_process_document, path, options, queue) for path in paths]
+        remaining = len(futures)
+        while remaining:
+            record = queue.get()
+            if record.get(_DONE):
+                remaining -= 1
+                continue
+            counts[record["method"]] = counts.get(record["method"], 0) + 1
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+        for future in futures:
+            future.result()
+    manager.shutdown()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch PDF text extraction (digital text + OCR / Gemini).")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--engine", choices=list(ENGINES) + ["gemini"], default="ocr.space",
+                        help="OCR engine for scanned pages (tesseract runs locally; tesseract+ocr.space "
+                             "escalates low-confidence pages), or gemini for whole documents")
+    parser.add_argument("--api-key", default=os.environ.get("OCR_API_KEY", "helloworld"),
+                        help="OCR.space or Gemini API key (default: $OCR_API_KEY or 'helloworld'); several "
+                             "comma-separated OCR.space keys are sharded by headroom")
+    parser.add_argument("--key-rps", type=float, default=None,
+                        help="Max requests per second per OCR.space key (shared across --workers)")
+    parser.add_argument("--key-quota", type=int, default=None,
+                        help="Max requests per OCR.space key per day (shared across --workers)")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE,
+                        help="Keep-alive HTTP connections per worker process, reused across its documents "
+                             "(up to --workers x this open in total)")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help="OCR.space connect timeout (s)")
+    parser.add_argument("--read-timeout", type=float, default=DEFAULT_READ_TIMEOUT,
+                        help="OCR.space read timeout (s)")
+    parser.add_argument("--model", default="gemini-2.5-flash", help="Gemini model (engine=gemini)")
+    parser.add_argument("--prompt", choices=sorted(PROMPTS), default="hospital_course",
+                        help="Gemini prompt (engine=gemini)")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Send only scanned / handwritten pages to Gemini as PDF, typed pages as text "
+                             "(engine=gemini)")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help="Mean Tesseract word confidence (0-100) below which a page is sent to "
+                             "OCR.space (engine=tesseract+ocr.space)")
+    parser.add_argument("--ocr-processes", type=int, default=None,
+                        help="Tesseract processes per document (default: cores / --workers)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of documents processed in parallel")
+    parser.add_argument("--classify-workers", type=int, default=1,
+                        help="Processes per document for digital-text extraction (useful with --workers 1)")
+    parser.add_argument("--rps", type=float, default=None,
+                        help=f"Global max OCR.space requests per second (default {DEFAULT_RPS}; "
+                             "with --adaptive, no limit)")
+    parser.add_argument("--in-flight", type=int, default=4, help="Max concurrent OCR.space requests per document")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Find the request rate automatically (AIMD on 429s and latency, concurrency "
+                             "follows it); --in-flight and --rps become upper bounds")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="Max attempts per page for transient OCR.space failures (throttled requests "
+                             "are retried until throttling has lasted 10 minutes)")
+    parser.add_argument("--render", action="store_true",
+                        help="Render scan pages to compressed grayscale images before upload (needs poppler)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="Render DPI (with --render)")
+    parser.add_argument("--max-upload-kb", type=int, default=DEFAULT_MAX_BYTES // 1024,
+                        help="Per-page upload budget in KB: rendered images are compressed under it; "
+                             "without --render, larger single-page PDFs get their images recompressed")
+    parser.add_argument("--dedup", action="store_true",
+                        help="OCR duplicate scan pages once and reuse the text "
+                             "(method dedup_of:<page>)")
+    parser.add_argument("--dedup-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="Max perceptual-hash distance in bits for near-duplicate candidates, confirmed by a "
+                             "full-resolution pixel diff (default 0 = exact copies only)")
+    parser.add_argument("--triage", action="store_true",
+                        help="Skip blank scan pages and OCR digital pages that are mostly scanned ink "
+                             "(renders thumbnails, needs poppler)")
+    parser.add_argument("--large-file", action="store_true",
+                        help="Force large-file mode (memory-mapped input) for every file; "
+                             f"files over {LARGE_FILE_THRESHOLD // (1024 * 1024)} MB always use it")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk result cache")
+    args = parser.parse_args(argv)
+
+    paths = find_pdfs(args.inputs)
+    if not paths:
+        parser.error("no PDF files found")
+
+    workers = max(1, min(args.workers, len(paths)))
+    rps = args.rps if args.rps is not None else (None if args.adaptive else DEFAULT_RPS)
+    options = {
+        "engine": args.engine,
+        "api_key": args.api_key,
+        "model": args.model,
+        "prompt": args.prompt,
+        "hybrid": args.hybrid,
+        "min_confidence": args.min_confidence,
+        "ocr_processes": args.ocr_processes or max(1, (os.cpu_count() or 1) // workers),
+        "rps": rps / workers if rps else None,
+        "key_rps": args.key_rps / workers if args.key_rps else None,
+        "key_quota": max(1, args.key_quota // workers) if args.key_quota else None,
+        "pool_size": args.pool_size,
+        "connect_timeout": args.connect_timeout,
+        "read_timeout": args.read_timeout,
+        "in_flight": args.in_flight,
+        "adaptive": args.adaptive,
+        "retries": args.retries,
+        "classify_workers": args.classify_workers,
+        "render_options": {"dpi": args.dpi, "max_bytes": args.max_upload_kb * 1024} if args.render else None,
+        "page_budget": args.max_upload_kb * 1024,
+        "large_file": args.large_file,
+        "dedup": args.dedup,
+        "dedup_distance": args.dedup_distance,
+        "triage": args.triage,
+        "cache_dir": None if args.no_cache else args.cache_dir,
+    }
+
+    started = time.monotonic()
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        counts = run_batch(paths, out, options, workers)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Processed {len(paths)} file(s) in {elapsed:.1f}s — {json.dumps(counts)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# dedup.py
+# Duplicate and near-duplicate page detection before OCR.
+#
+# Hospital bundles repeat the same blank forms, letterheads, consent pages
+# and charts many times. Pages are grouped by an exact fingerprint (content
+# stream + raw image / form data, including images nested in forms) and,
+# when a hash distance is allowed, by a difference hash of a low-resolution
+# render confirmed by a pixel diff of full-resolution renders; only the first
+# page of each group is OCRed and its text is reused for the others (method
+# "dedup_of:<page>").
+import hashlib
+import os
+import tempfile
+import time
+
+from PIL import Image, ImageChops
+
+from large_file import release_object_cache
+from render import DEFAULT_DPI, render_thumbnails
+
+# Difference hash of a (HASH_SIZE + 1) x HASH_SIZE grayscale thumbnail: 64 bits
+HASH_SIZE = 8
+
+# Pages whose hashes differ in at most this many bits are near-duplicate
+# candidates; 0 (the default) groups exact copies only, without rendering.
+# A thumbnail hash cannot tell a blank form from the same form with a few
+# handwritten entries, so candidates must pass the pixel check below.
+DEFAULT_MAX_DISTANCE = 0
+
+# A candidate is confirmed only if its render at CONFIRM_DPI (the OCR render
+# resolution) and its representative's differ by more than PIXEL_DIFF grey
+# levels in at most MAX_CHANGED_PIXELS pixels: isolated specks, never a
+# pen stroke or a filled-in field.
+CONFIRM_DPI = DEFAULT_DPI
+PIXEL_DIFF = 64
+MAX_CHANGED_PIXELS = 25
+
+
+def _resolve(obj):
+    return obj.get_object() if obj is not None else None
+
+
+# Stream dictionary entries that change how the same data is painted
+_PAINT_KEYS = ("/Subtype", "/Width", "/Height", "/BitsPerComponent", "/Filter", "/Decode", "/ImageMask",
+               "/BBox", "/Matrix")
+
+
+def _hash_resources(digest, resources, seen):
+    """Hash the raw (still encoded) data of every image, form and pattern in
+    `resources`, recursing into the resources of forms and patterns: scanners
+    often wrap each page's image in a form, and the page itself only says
+    "/Fm0 Do". Inline images are part of the content streams hashed here."""
+    resources = _resolve(resources) or {}
+    for category in ("/XObject", "/Pattern"):
+        entries = _resolve(resources.get(category)) or {}
+        for name in sorted(entries):
+            obj = _resolve(entries[name])
+            digest.update(name.encode("latin-1"))
+            if obj is None or id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            for key in _PAINT_KEYS:
+                value = obj.get(key) if hasattr(obj, "get") else None
+                if value is not None:
+                    digest.update(f"{key}={_resolve(value)}".encode("latin-1", "replace"))
+            digest.update(getattr(obj, "_data", b"") or b"")
+            if hasattr(obj, "get") and "/Resources" in obj:
+                _hash_resources(digest, obj["/Resources"], seen)
+
+
+def page_fingerprint(page):
+    """SHA-256 over a page's size, rotation, content stream and the raw
+    (still encoded) data of the images, forms and patterns it paints,
+    including those nested inside forms."""
+    digest = hashlib.sha256()
+    digest.update(repr([float(v) for v in page.mediabox]).encode("ascii"))
+    digest.update(str(page.get("/Rotate", 0)).encode("ascii"))
+    contents = page.get_contents()
+    digest.update(contents.get_data() if contents is not None else b"")
+    _hash_resources(digest, page.get("/Resources"), set())
+    return digest.hexdigest()
+
+
+def dhash(image, size=HASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent pixel pair of the
+    image shrunk to (size + 1) x size, set where the left one is brighter."""
+    pixels = list(image.convert("L").resize((size + 1, size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def changed_pixels(image, other):
+    """Pixels whose grey levels differ by more than PIXEL_DIFF; None if the
+    images differ in size."""
+    if image.size != other.size:
+        return None
+    diff = ImageChops.difference(image.convert("L"), other.convert("L"))
+    return sum(diff.histogram()[PIXEL_DIFF + 1:])
+
+
+def _same_pixels(pdf_source, page_num, representative):
+    """Render both pages at CONFIRM_DPI and compare them pixel by pixel."""
+    images = dict(render_thumbnails(pdf_source, (page_num, representative), dpi=CONFIRM_DPI))
+    changed = changed_pixels(images[page_num], images[representative])
+    return changed is not None and changed <= MAX_CHANGED_PIXELS
+
+
+def find_duplicates(pdf_reader, page_nums, pdf_source=None, max_distance=DEFAULT_MAX_DISTANCE,
+                    stats=None, tracer=None, release_cache=False):
+    """Group `page_nums` into duplicates; returns {duplicate: representative}.
+
+    The representative is the first page of its group. Exact copies are found
+    from the PDF structure alone. With `max_distance` > 0, near-duplicates
+    need `pdf_source` (PDF bytes or file path) and poppler: thumbnails whose
+    hashes are within `max_distance` bits are rendered again at CONFIRM_DPI
+    and grouped only if they match pixel for pixel (MAX_CHANGED_PIXELS). If
+    rendering fails, only exact copies are grouped. `stats` receives
+    "dedup_exact", "dedup_near", "dedup_seconds" and "dedup_render_error".
+    """
+    started = time.perf_counter()
+    duplicates = {}
+    representatives = {}
+    for page_num in page_nums:
+        try:
+            fingerprint = page_fingerprint(pdf_reader.pages[page_num - 1])
+        except Exception:
+            continue
+        finally:
+            if release_cache:
+                release_object_cache(pdf_reader)
+        if fingerprint in representatives:
+            duplicates[page_num] = representatives[fingerprint]
+        else:
+            representatives[fingerprint] = page_num
+    exact = len(duplicates)
+
+    render_error = None
+    if max_distance and pdf_source is not None:
+        hashed = []
+        spooled = None
+        if not isinstance(pdf_source, str):
+            # Written once for the thumbnails and every confirming render
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                f.write(pdf_source)
+            pdf_source = spooled = f.name
+        try:
+            for page_num, image in render_thumbnails(pdf_source, sorted(representatives.values())):
+                bits = dhash(image)
+                match = next((rep for rep, rep_bits in hashed
+                              if (bits ^ rep_bits).bit_count() <= max_distance
+                              and _same_pixels(pdf_source, page_num, rep)), None)
+                if match is None:
+                    hashed.append((page_num, bits))
+                else:
+                    duplicates[page_num] = match
+        except Exception as e:
+            # No poppler / unrenderable page: keep the exact groups
+            render_error = str(e)
+        finally:
+            if spooled is not None:
+                os.unlink(spooled)
+        # Exact copies of a near-duplicate point at its representative too
+        duplicates = {page: duplicates.get(rep, rep) for page, rep in duplicates.items()}
+
+    seconds = time.perf_counter() - started
+    if tracer is not None:
+        tracer.add("dedup", seconds, outcome="ok" if render_error is None else "render_error")
+    if stats is not None:
+        stats.update(dedup_exact=exact, dedup_near=len(duplicates) - exact, dedup_seconds=seconds,
+                     dedup_render_error=render_error)
+    return duplicates
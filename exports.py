@@ -0,0 +1,77 @@
+# exports.py
+# Streamed exports of extraction results. Pages are written one at a time to
+# a temporary file (JSONL, TXT or XLSX through openpyxl's write-only mode)
+# instead of being joined into one string, so a 1,000-page document costs
+# one page of memory rather than two copies of the whole output.
+import io
+import json
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from extraction import iter_final_text
+
+# {format: (file extension, MIME type)}
+EXPORT_FORMATS = {
+    "txt": ("txt", "text/plain"),
+    "jsonl": ("jsonl", "application/x-ndjson"),
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Excel's limit on the characters in one cell; longer pages continue on the
+# next row with the same page number
+XLSX_CELL_LIMIT = 32767
+
+
+def iter_records(extracted_text, methods):
+    """Yield one {"page", "method", "text"} record per page."""
+    for i, text in enumerate(extracted_text, start=1):
+        yield {"page": i, "method": methods.get(i, "unknown"), "text": text or ""}
+
+
+def write_txt(extracted_text, methods, f):
+    for piece in iter_final_text(extracted_text, methods):
+        f.write(piece.encode("utf-8"))
+
+
+def write_jsonl(extracted_text, methods, f):
+    for record in iter_records(extracted_text, methods):
+        f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def write_xlsx(extracted_text, methods, f):
+    # Write-only workbooks stream rows to disk instead of keeping cell objects
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Pages")
+    sheet.append(["page", "method", "part", "text"])
+    for record in iter_records(extracted_text, methods):
+        text = ILLEGAL_CHARACTERS_RE.sub("", record["text"])
+        parts = [text[i:i + XLSX_CELL_LIMIT] for i in range(0, len(text), XLSX_CELL_LIMIT)] or [""]
+        for part_num, part in enumerate(parts, start=1):
+            sheet.append([record["page"], record["method"], part_num, part])
+    workbook.save(f)
+
+
+_WRITERS = {"txt": write_txt, "jsonl": write_jsonl, "xlsx": write_xlsx}
+
+
+def export_file(fmt, extracted_text, methods):
+    """Write the per-page results in `fmt` (a key of EXPORT_FORMATS) to a
+    temporary file and return it, rewound, for st.download_button or a copy."""
+    f = tempfile.TemporaryFile()
+    _WRITERS[fmt](extracted_text, methods, f)
+    f.seek(0)
+    return f
+
+
+def export_json(data):
+    """Temporary file holding `data` as indented JSON, encoded incrementally."""
+    f = tempfile.TemporaryFile()
+    writer = io.TextIOWrapper(f, encoding="utf-8")
+    for chunk in json.JSONEncoder(indent=2, ensure_ascii=False).iterencode(data):
+        writer.write(chunk)
+    writer.flush()
+    writer.detach()
+    f.seek(0)
+    return f
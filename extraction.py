@@ -0,0 +1,292 @@
+# extraction.py
+# Headless extraction core: digital text extraction, per-page OCR (OCR.space
+# or a local engine, see ocr_engines.py) and whole-document Gemini calls. The
+# Streamlit apps and cli.py are thin front-ends over these functions.
+import io
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from pypdf import PdfReader
+
+from classify import classify_pages
+from dedup import DEFAULT_MAX_DISTANCE, find_duplicates
+from large_file import MappedPdf, PageTextStore, release_object_cache
+from ocr_engines import OcrSpaceEngine
+from ocr_space import DEFAULT_RETRY, FREE_PLAN_LIMIT, OcrResult, single_page_pdf
+from page_split import split_page
+from render import render_page
+from triage import triage_pages
+
+
+def open_pdf(pdf_bytes):
+    return PdfReader(io.BytesIO(pdf_bytes))
+
+
+def ocr_pages(pdf_reader, page_nums, api_key, limiter=None, cache=None,
+              max_workers=4, on_oversize=None, render_options=None, render_workers=2,
+              upload_sizes=None, tracer=None, release_cache=False, retry=DEFAULT_RETRY,
+              executor=None, engine=None, duplicates=None, page_budget=None, split_sizes=None,
+              stop=None):
+    """OCR `page_nums` and yield OcrResults as they finish.
+
+    Minimal single-page PDFs (page_split.py) are built on the calling thread
+    (pypdf objects are not shared with workers) while uploads run on a
+    thread pool, so results come back out of page order. Pages over
+    `page_budget` bytes get their embedded images recompressed (the vector
+    upload, and the fallback when rendering fails). `split_sizes` collects
+    {page_num: (plain add_page bytes, minimal bytes)}. `on_oversize(page_num,
+    size)` is called for pages above the OCR.space free-plan limit.
+
+    With `render_options` (keyword arguments for render.render_page), pages
+    are rendered and compressed on a process pool first; each upload starts
+    as soon as its page is rendered, so rendering overlaps the network. Pages
+    that fail to render are uploaded as PDF. `upload_sizes` collects
+    {page_num: (pdf_bytes, uploaded_bytes, format)}. A telemetry.Tracer
+    receives single-page write, render and request spans. `release_cache`
+    drops pypdf's object cache after each page (large-file mode). `retry` is
+    the ratelimit.RetryPolicy for throttled / transient failures; with a
+    ratelimit.AdaptiveLimiter, `max_workers` should be its max_in_flight.
+    Pass a shared ThreadPoolExecutor as `executor` to run the uploads there
+    instead of on a pool of `max_workers` threads (jobs.JobRunner).
+
+    Pages are recognised by `engine` (an ocr_engines.OcrEngine; the caller
+    closes it). By default that is OCR.space with `api_key`, `limiter`,
+    `cache`, `tracer` and `retry`. For a local engine, `max_workers` should
+    be at least its number of worker processes.
+
+    `duplicates` ({page: representative}, see dedup.find_duplicates) pages
+    are not OCRed; each gets a copy of its representative's result with
+    method "dedup_of:<page>", yielded right after it.
+
+    Setting `stop` (a threading.Event) ends the run early: no further pages
+    are sent and pending ones are cancelled.
+    """
+    if engine is None:
+        engine = OcrSpaceEngine(api_key, limiter=limiter, cache=cache, tracer=tracer, retry=retry)
+    copies = {}
+    for page_num, representative in (duplicates or {}).items():
+        copies.setdefault(representative, []).append(page_num)
+    page_nums = [n for n in page_nums if n not in (duplicates or {})]
+    render_pool = ProcessPoolExecutor(max_workers=render_workers) if render_options else None
+    pending = {}
+    # Backpressure: only this many pages may be built but not yet finished,
+    # so payloads of a 1,000-page scan are never all in memory at once
+    max_pending = 2 * (max_workers + (render_workers if render_pool is not None else 0))
+
+    def split(page_num):
+        try:
+            payload, info = split_page(pdf_reader, page_num, max_bytes=page_budget,
+                                       measure=split_sizes is not None)
+        except Exception:
+            # Unusual page structure: fall back to a plain copy of the page
+            payload = single_page_pdf(pdf_reader, page_num)
+            info = {"bytes_before": len(payload), "bytes_after": len(payload)}
+        if split_sizes is not None:
+            split_sizes[page_num] = (info.get("bytes_before"), info["bytes_after"])
+        return payload, info
+
+    def submit_upload(page_num, payload, filename, original_size, fmt):
+        if upload_sizes is not None:
+            upload_sizes[page_num] = (original_size, len(payload), fmt)
+        if on_oversize is not None and engine.remote and len(payload) > FREE_PLAN_LIMIT:
+            on_oversize(page_num, len(payload))
+        future = executor.submit(engine.recognize, page_num, payload, filename)
+        pending[future] = ("upload", page_num, None)
+
+    def with_copies(result):
+        yield result
+        for page_num in copies.get(result.page_num, ()):
+            message = f"Page {page_num} duplicates page {result.page_num}; reused its result. " + result.message
+            yield result._replace(page_num=page_num, method=f"dedup_of:{result.page_num}", cached=False,
+                                  elapsed=0.0, attempts=0, message=message)
+
+    def drain():
+        # Wait for at least one future; yield finished uploads, chain renders into uploads
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, page_num, payload = pending.pop(future)
+            if future.cancelled():
+                continue
+            if kind == "upload":
+                yield from with_copies(future.result())
+                continue
+            try:
+                image_bytes, ext, info = future.result()
+                if tracer is not None:
+                    tracer.add("render", info["seconds"], page=page_num,
+                               bytes_in=len(payload), bytes_out=len(image_bytes))
+                submit_upload(page_num, image_bytes, f"page_{page_num}.{ext}",
+                              len(payload), info["format"].lower())
+            except Exception:
+                # No poppler / unrenderable page: fall back to the PDF payload
+                submit_upload(page_num, payload, None, len(payload), "pdf")
+
+    try:
+        with nullcontext(executor) if executor is not None else \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for page_num in page_nums:
+                if stop is not None and stop.is_set():
+                    break
+                while len(pending) >= max_pending:
+                    yield from drain()
+                try:
+                    if tracer is not None:
+                        with tracer.span("single_page_write", page=page_num) as span:
+                            payload, info = split(page_num)
+                            span.bytes_in = info.get("bytes_before", 0)
+                            span.bytes_out = len(payload)
+                    else:
+                        payload, _ = split(page_num)
+                except Exception as e:
+                    yield from with_copies(OcrResult(page_num, "extract_failed", "", "error",
+                                                     f"Failed to extract page {page_num} for OCR: {e}"))
+                    continue
+                finally:
+                    if release_cache:
+                        release_object_cache(pdf_reader)
+
+                if render_pool is not None:
+                    # memoryviews cannot be pickled for the worker process
+                    future = render_pool.submit(render_page, bytes(payload), **render_options)
+                    pending[future] = ("render", page_num, payload)
+                else:
+                    submit_upload(page_num, payload, None, len(payload), "pdf")
+
+            while pending and not (stop is not None and stop.is_set()):
+                yield from drain()
+    finally:
+        for future in pending:
+            future.cancel()
+        if render_pool is not None:
+            render_pool.shutdown(cancel_futures=True)
+
+
+def iter_final_text(extracted_text, methods):
+    """Yield the combined page-by-page output text in pieces, so large
+    documents can be written out without building one giant string."""
+    for i, content in enumerate(extracted_text, start=1):
+        method = methods.get(i, "unknown")
+        text_block = content if content else "[no text found]"
+        yield ("\n" if i > 1 else "") + f"--- Page {i} | method: {method} ---\n{text_block}\n"
+
+
+def build_final_text(extracted_text, methods):
+    return "".join(iter_final_text(extracted_text, methods))
+
+
+def extract_pdf_pages(pdf_bytes, api_key, limiter=None, cache=None, max_workers=4,
+                      classify_workers=1, render_options=None, pdf_path=None, retry=DEFAULT_RETRY,
+                      engine=None, dedup=False, dedup_distance=DEFAULT_MAX_DISTANCE, triage=False,
+                      executor=None, cpu_slot=None, page_budget=None, stats=None, tracer=None,
+                      upload_sizes=None, split_sizes=None, on_oversize=None, stop=None):
+    """Run digital extraction + OCR over one PDF.
+
+    Yields one record per page as soon as it is known: digital pages first,
+    then OCR pages in completion order. Pass `pdf_path` instead of
+    `pdf_bytes` for large-file mode (memory-mapped input, page text kept on
+    disk, object cache released per page; see large_file.py). `engine` is
+    passed to ocr_pages (default: OCR.space). With `dedup`, duplicate scan
+    pages are OCRed once (see dedup.py; `dedup_distance` 0 = exact copies).
+    With `triage`, blank scan pages are skipped (method "blank") and digital
+    pages that are mostly scanned ink are OCRed as well (see triage.py).
+    `executor` is a shared upload pool passed to ocr_pages; `cpu_slot` is a
+    context manager held for the CPU stage (classify, triage, dedup) so a
+    scheduler can bound how many documents run it at once (scheduler.py).
+    `page_budget`, `upload_sizes`, `split_sizes` and `on_oversize` are
+    passed to ocr_pages, and so is `stop` (a threading.Event that ends the
+    run early). Stage timings and counts ("open_seconds" and those of
+    classify, triage and dedup) are stored in `stats`; a telemetry.Tracer
+    gets the spans of every stage.
+    """
+    options = dict(api_key=api_key, limiter=limiter, cache=cache, max_workers=max_workers,
+                   classify_workers=classify_workers, render_options=render_options, retry=retry,
+                   engine=engine, dedup_distance=dedup_distance if dedup else None, triage=triage,
+                   executor=executor, cpu_slot=cpu_slot, page_budget=page_budget, stats=stats,
+                   tracer=tracer, upload_sizes=upload_sizes, split_sizes=split_sizes,
+                   on_oversize=on_oversize, stop=stop)
+    started = time.perf_counter()
+    if pdf_path is None:
+        with tracer.span("pdf_open", bytes_in=len(pdf_bytes)) if tracer is not None else nullcontext():
+            pdf_reader = open_pdf(pdf_bytes)
+        if stats is not None:
+            stats["open_seconds"] = time.perf_counter() - started
+        yield from _extract_pages(pdf_reader, pdf_bytes, None, **options)
+        return
+    with tracer.span("pdf_open", bytes_in=os.path.getsize(pdf_path)) if tracer is not None else nullcontext():
+        mapped = MappedPdf(pdf_path)
+    with mapped:
+        if stats is not None:
+            stats["open_seconds"] = time.perf_counter() - started
+        yield from _extract_pages(mapped.reader, None, pdf_path, **options)
+
+
+def _extract_pages(pdf_reader, pdf_bytes, pdf_path, api_key, limiter, cache, max_workers,
+                   classify_workers, render_options, retry, engine, dedup_distance, triage,
+                   executor, cpu_slot, page_budget, stats, tracer, upload_sizes, split_sizes,
+                   on_oversize, stop):
+    large_file = pdf_path is not None
+    text_store = PageTextStore(len(pdf_reader.pages)) if large_file else None
+    try:
+        with cpu_slot if cpu_slot is not None else nullcontext():
+            extracted_text, methods = classify_pages(pdf_reader, pdf_bytes=pdf_bytes,
+                                                     workers=classify_workers, stats=stats, tracer=tracer,
+                                                     pdf_path=pdf_path, text_store=text_store)
+            if triage:
+                methods.update(triage_pages(pdf_reader, methods, pdf_path or pdf_bytes, stats=stats,
+                                            tracer=tracer, release_cache=large_file))
+            needs_ocr = [i for i, m in methods.items() if m == "needs_ocr"]
+            duplicates = None
+            if dedup_distance is not None:
+                duplicates = find_duplicates(pdf_reader, needs_ocr, pdf_source=pdf_path or pdf_bytes,
+                                             max_distance=dedup_distance, stats=stats, tracer=tracer,
+                                             release_cache=large_file)
+
+        for page_num, method in methods.items():
+            if method == "digital":
+                yield {"page": page_num, "method": method, "text": extracted_text[page_num - 1],
+                       "cached": False}
+            elif method == "blank":
+                yield {"page": page_num, "method": method, "text": "", "cached": False}
+
+        for result in ocr_pages(pdf_reader, needs_ocr, api_key, limiter=limiter, cache=cache,
+                                max_workers=max_workers, on_oversize=on_oversize,
+                                render_options=render_options, upload_sizes=upload_sizes, tracer=tracer,
+                                release_cache=large_file, retry=retry, engine=engine,
+                                duplicates=duplicates, executor=executor, page_budget=page_budget,
+                                split_sizes=split_sizes, stop=stop):
+            # Triage may send digital pages to OCR: keep their text if OCR finds none
+            text = result.text or extracted_text[result.page_num - 1] or ""
+            record = {"page": result.page_num, "method": result.method, "text": text,
+                      "cached": result.cached, "seconds": result.elapsed, "attempts": result.attempts}
+            if result.confidence is not None:
+                record["confidence"] = round(result.confidence, 1)
+            if result.level == "error":
+                record["error"] = result.message
+            yield record
+    finally:
+        if text_store is not None:
+            text_store.close()
+
+
+def extract_with_gemini(pdf_bytes, api_key, model_option, prompt_text, cache=None, hybrid=False):
+    """Send the whole PDF to Gemini with one prompt; returns one document record.
+
+    With `hybrid`, only scanned / handwritten pages are sent as PDF and typed
+    pages as text (see hybrid.py); page references are mapped back.
+    """
+    from google import genai
+
+    from gemini_client import generate_text, remap_answer
+    from hybrid import HybridDocument
+
+    client = genai.Client(api_key=api_key)
+    if hybrid:
+        document = HybridDocument(pdf_bytes)
+        text, cached = generate_text(client, model_option, document.pdf_bytes, prompt_text, cache=cache,
+                                     text_parts=document.text_parts)
+        text = remap_answer(text, document)
+    else:
+        text, cached = generate_text(client, model_option, pdf_bytes, prompt_text, cache=cache)
+    return {"page": None, "method": f"gemini:{model_option}", "text": text, "cached": cached}
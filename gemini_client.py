@@ -0,0 +1,417 @@
+# gemini_client.py
+# Helpers shared by the Gemini front-ends (app2.py, app3.py).
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from google.genai import types
+from pypdf import PdfReader, PdfWriter
+
+from hybrid import HybridDocument
+from prompts import chunk_note_template, hospital_course_reduce_prompt, hybrid_chunk_note_template
+from result_cache import gemini_key
+
+# generate_many relays streamed text to the calling thread at most this often
+STREAM_INTERVAL = 0.15
+
+
+def pdf_part(pdf_bytes):
+    return types.Part(
+        inline_data=types.Blob(
+            mime_type="application/pdf",
+            data=pdf_bytes
+        )
+    )
+
+
+def _call(client, model_option, contents, config=None, on_chunk=None, stats=None, tracer=None,
+          bytes_in=0):
+    """One generate request. With `on_chunk`, the streaming API is used and
+    `on_chunk(text)` is called with the text received so far each time a
+    piece arrives (one growing string, so the sink keeps no copy of it).
+    `stats` receives time-to-first-token and total seconds; a Tracer gets a
+    "gemini_call" span."""
+    if tracer is None:
+        return _call_untraced(client, model_option, contents, config, on_chunk, stats)
+    with tracer.span("gemini_call", bytes_in=bytes_in) as span:
+        text = _call_untraced(client, model_option, contents, config, on_chunk, stats)
+        span.bytes_out = len(text.encode("utf-8"))
+        if not text:
+            span.outcome = "empty"
+    return text
+
+
+def _call_untraced(client, model_option, contents, config, on_chunk, stats):
+    started = time.perf_counter()
+    if on_chunk is None:
+        response = client.models.generate_content(
+            model=f"models/{model_option}", contents=contents, config=config
+        )
+        text = (response.text or "").strip() if response else ""
+        first_token = None
+    else:
+        text = ""
+        first_token = None
+        for chunk in client.models.generate_content_stream(
+            model=f"models/{model_option}", contents=contents, config=config
+        ):
+            delta = chunk.text or ""
+            if not delta:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            text += delta
+            on_chunk(text)
+        text = text.strip()
+
+    if stats is not None:
+        stats["ttft_seconds"] = first_token
+        stats["total_seconds"] = time.perf_counter() - started
+        stats["streamed"] = on_chunk is not None
+    return text
+
+
+def _key_text(prompt_text, text_parts):
+    # Cache keys cover the text parts too; without any the key is the prompt alone
+    return "\n\n".join(list(text_parts) + [prompt_text])
+
+
+def generate_text(client, model_option, pdf_bytes, prompt_text, cache=None, on_chunk=None,
+                  stats=None, tracer=None, text_parts=()):
+    """Send the PDF plus one prompt to Gemini and return (text, cached).
+
+    `pdf_bytes` may be None for a text-only request; `text_parts` are sent as
+    plain text parts between the PDF and the prompt (hybrid mode). With a
+    ResultCache, the answer is keyed by PDF hash, model and prompt so a rerun
+    with the same inputs does not call the API again. `on_chunk` / `stats`
+    are passed to the request (see `_call`); a cache hit is delivered as a
+    single chunk.
+    """
+    key = None
+    if cache is not None:
+        key = gemini_key(pdf_bytes or b"", model_option, _key_text(prompt_text, text_parts))
+        hit = cache.get(key)
+        if hit is not None:
+            if on_chunk is not None:
+                on_chunk(hit["text"])
+            return hit["text"], True
+
+    contents = ([pdf_part(pdf_bytes)] if pdf_bytes is not None else []) + list(text_parts) + [prompt_text]
+    text = _call(client, model_option, contents, on_chunk=on_chunk, stats=stats, tracer=tracer,
+                 bytes_in=len(pdf_bytes or b"") + len(_key_text(prompt_text, text_parts).encode("utf-8")))
+
+    if key is not None and text:
+        cache.put(key, {"text": text})
+    return text, False
+
+
+def split_trailing_json(text):
+    """Split a response into (plain_text, parsed_json) at its trailing JSON object.
+
+    Handles a bare JSON response, plain text followed by a JSON block, and
+    ```json fences. Returns (text, None) when there is no trailing object.
+    """
+    body = text.rstrip()
+    if body.endswith("```"):
+        body = body[:-3].rstrip()
+    decoder = json.JSONDecoder()
+    start = body.find("{")
+    while start != -1:
+        try:
+            parsed, end = decoder.raw_decode(body, start)
+        except json.JSONDecodeError:
+            parsed, end = None, -1
+        if isinstance(parsed, dict) and not body[end:].strip():
+            plain = body[:start].rstrip()
+            if plain.endswith("```json") or plain.endswith("```"):
+                plain = plain.rsplit("```", 1)[0].rstrip()
+            return plain, parsed
+        start = body.find("{", start + 1)
+    return text, None
+
+
+def remap_answer(text, document):
+    """Rewrite page references in a response's trailing JSON object from a
+    HybridDocument's numbering to original page numbers."""
+    plain, parsed = split_trailing_json(text)
+    if parsed is None:
+        return text
+    remapped = json.dumps(document.remap(parsed), indent=2, ensure_ascii=False)
+    return f"{plain}\n\n{remapped}" if plain else remapped
+
+
+def page_windows(total, window, overlap):
+    """1-based, inclusive (start, end) page ranges of `window` pages
+    overlapping by `overlap`."""
+    step = max(1, window - overlap)
+    windows = []
+    for start in range(0, total, step):
+        end = min(start + window, total)
+        windows.append((start + 1, end))
+        if end == total:
+            break
+    return windows
+
+
+def split_pdf(pdf_bytes, window, overlap):
+    """Split a PDF into page windows of `window` pages overlapping by `overlap`.
+
+    Returns a list of (start_page, end_page, chunk_bytes) with 1-based,
+    inclusive page numbers.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    chunks = []
+    for start, end in page_windows(len(reader.pages), window, overlap):
+        writer = PdfWriter()
+        for i in range(start - 1, end):
+            writer.add_page(reader.pages[i])
+        out = io.BytesIO()
+        writer.write(out)
+        chunks.append((start, end, out.getvalue()))
+    return chunks
+
+
+def generate_chunked(client, model_option, pdf_bytes, prompt_text, window=20, overlap=2,
+                     max_concurrency=4, cache=None, reduce_prompt=hospital_course_reduce_prompt,
+                     on_chunk=None, stats=None, tracer=None, executor=None, hybrid=None):
+    """Map-reduce extraction for long PDFs.
+
+    Each page window is sent with `prompt_text` concurrently (at most
+    `max_concurrency` requests at a time); a final text-only call merges the
+    partial narratives in page order. Documents that fit in one window use the
+    single-shot path. `on_chunk` / `stats` apply to the final (reduce or
+    single-shot) request, which is the one the user sees. A shared
+    ThreadPoolExecutor passed as `executor` runs the page windows instead of
+    a private pool. With `hybrid` (the result of hybrid.classify_for_hybrid)
+    each request carries only its window's scanned pages as PDF and the
+    typed pages as text.
+
+    Returns (text, parts, cache_hits) where parts is a list of
+    {"pages": (start, end), "text": ...} in page order.
+    """
+    total = len(hybrid[0].pages) if hybrid is not None else len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+    if total <= window:
+        if hybrid is not None:
+            document = HybridDocument(pdf_bytes, classified=hybrid)
+            text, cached = generate_text(client, model_option, document.pdf_bytes, prompt_text, cache=cache,
+                                         on_chunk=on_chunk, stats=stats, tracer=tracer,
+                                         text_parts=document.text_parts)
+        else:
+            text, cached = generate_text(client, model_option, pdf_bytes, prompt_text, cache=cache,
+                                         on_chunk=on_chunk, stats=stats, tracer=tracer)
+        return text, [{"pages": (1, total), "text": text}], int(cached)
+
+    if hybrid is not None:
+        chunks = [(start, end, None) for start, end in page_windows(total, window, overlap)]
+    elif tracer is not None:
+        with tracer.span("pdf_split", bytes_in=len(pdf_bytes)) as span:
+            chunks = split_pdf(pdf_bytes, window, overlap)
+            span.bytes_out = sum(len(c[2]) for c in chunks)
+    else:
+        chunks = split_pdf(pdf_bytes, window, overlap)
+
+    def run_chunk(chunk):
+        start, end, chunk_bytes = chunk
+        if hybrid is not None:
+            note = hybrid_chunk_note_template.format(start=start, end=end, total=total)
+            document = HybridDocument(pdf_bytes, start, end, classified=hybrid)
+            return generate_text(client, model_option, document.pdf_bytes, note + prompt_text, cache=cache,
+                                 tracer=tracer, text_parts=document.text_parts)
+        note = chunk_note_template.format(start=start, end=end, total=total)
+        return generate_text(client, model_option, chunk_bytes, note + prompt_text, cache=cache,
+                             tracer=tracer)
+
+    if executor is not None:
+        results = list(executor.map(run_chunk, chunks))
+    else:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            results = list(executor.map(run_chunk, chunks))
+
+    parts = [{"pages": (start, end), "text": text}
+             for (start, end, _), (text, _) in zip(chunks, results)]
+    cache_hits = sum(1 for _, cached in results if cached)
+
+    labelled = "\n\n".join(
+        f"[Part {i} — pages {p['pages'][0]}-{p['pages'][1]}]\n{p['text'] or 'NOT_FOUND'}"
+        for i, p in enumerate(parts, start=1)
+    )
+    text, cached = generate_text(client, model_option, None,
+                                 reduce_prompt.format(parts=labelled), cache=cache,
+                                 on_chunk=on_chunk, stats=stats, tracer=tracer)
+    return text, parts, cache_hits + int(cached)
+
+
+class UploadedDocument:
+    """A PDF uploaded once to the Gemini Files API and reused across prompts.
+
+    When `use_context_cache` is set, an explicit context cache holding the
+    document is created as well so its tokens are not re-processed per
+    prompt; models or documents that do not support caching (e.g. below the
+    minimum token count) silently fall back to the file handle alone. Use as a
+    context manager so the upload and cache are deleted afterwards.
+    """
+
+    def __init__(self, client, model_option, pdf_bytes, use_context_cache=True, ttl="900s",
+                 poll_timeout=60, tracer=None):
+        self.client = client
+        self.model_option = model_option
+        self.tracer = tracer
+        upload_started = time.perf_counter()
+        self.file = client.files.upload(
+            file=io.BytesIO(pdf_bytes),
+            config=types.UploadFileConfig(mime_type="application/pdf")
+        )
+        # Large PDFs can take a moment to become usable
+        deadline = time.monotonic() + poll_timeout
+        while str(getattr(self.file, "state", "")).endswith("PROCESSING") and time.monotonic() < deadline:
+            time.sleep(1)
+            self.file = client.files.get(name=self.file.name)
+
+        if tracer is not None:
+            tracer.add("gemini_upload", time.perf_counter() - upload_started, bytes_in=len(pdf_bytes))
+        self.part = types.Part.from_uri(file_uri=self.file.uri, mime_type="application/pdf")
+        self.cached_content = None
+        if use_context_cache:
+            try:
+                self.cached_content = client.caches.create(
+                    model=f"models/{model_option}",
+                    config=types.CreateCachedContentConfig(contents=[self.part], ttl=ttl)
+                )
+            except Exception:
+                self.cached_content = None
+
+    def generate(self, prompt_text, on_chunk=None, stats=None, text_parts=()):
+        bytes_in = len(_key_text(prompt_text, text_parts).encode("utf-8"))
+        if self.cached_content is not None:
+            return _call(self.client, self.model_option, list(text_parts) + [prompt_text],
+                         config=types.GenerateContentConfig(cached_content=self.cached_content.name),
+                         on_chunk=on_chunk, stats=stats, tracer=self.tracer, bytes_in=bytes_in)
+        return _call(self.client, self.model_option, [self.part] + list(text_parts) + [prompt_text],
+                     on_chunk=on_chunk, stats=stats, tracer=self.tracer, bytes_in=bytes_in)
+
+    def close(self):
+        try:
+            if self.cached_content is not None:
+                self.client.caches.delete(name=self.cached_content.name)
+            self.client.files.delete(name=self.file.name)
+        except Exception:
+            pass  # uploads expire on their own
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class _TextOnlyDocument:
+    """Stand-in for UploadedDocument when there is no PDF to send (every
+    page of a hybrid document was typed text)."""
+
+    def __init__(self, client, model_option, tracer=None):
+        self.client = client
+        self.model_option = model_option
+        self.tracer = tracer
+
+    def generate(self, prompt_text, on_chunk=None, stats=None, text_parts=()):
+        return _call(self.client, self.model_option, list(text_parts) + [prompt_text],
+                     on_chunk=on_chunk, stats=stats, tracer=self.tracer,
+                     bytes_in=len(_key_text(prompt_text, text_parts).encode("utf-8")))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def generate_many(client, model_option, pdf_bytes, prompts, max_concurrency=4, cache=None,
+                  use_context_cache=True, on_chunk=None, stats=None, tracer=None, on_result=None,
+                  executor=None, text_parts=()):
+    """Run several prompts against one PDF, uploading the document only once.
+
+    Returns {name: (text, cached, error)} in the order of `prompts`; `error`
+    is the exception raised for that prompt, if any. Cached answers are
+    served before anything is uploaded, so a fully cached run makes no calls.
+    `on_result(name, text, cached, error)` is called as each prompt finishes,
+    and a shared ThreadPoolExecutor passed as `executor` replaces the private
+    pool of `max_concurrency` threads. `text_parts` are sent with every
+    prompt (hybrid mode); `pdf_bytes` may then be None for text-only calls.
+
+    With `on_chunk(name, text)` responses are streamed; the prompts still
+    run concurrently, and the calling thread passes each prompt's text so
+    far to the callback (at most every STREAM_INTERVAL seconds), so it can
+    update the UI. `stats` collects {name: timing dict}.
+    """
+    results = {}
+    misses = []
+    for name, prompt_text in prompts.items():
+        key = gemini_key(pdf_bytes or b"", model_option, _key_text(prompt_text, text_parts))
+        hit = cache.get(key) if cache is not None else None
+        if hit is not None:
+            results[name] = (hit["text"], True, None)
+            if on_result is not None:
+                on_result(name, hit["text"], True, None)
+        else:
+            misses.append(name)
+
+    if misses:
+        # A context cache only pays off when the document is reused
+        if pdf_bytes is not None:
+            document = UploadedDocument(client, model_option, pdf_bytes,
+                                        use_context_cache=use_context_cache and len(misses) > 1,
+                                        tracer=tracer)
+        else:
+            document = _TextOnlyDocument(client, model_option, tracer)
+        with document:
+            streamed = {}
+
+            def relay(name):
+                # Keeps a reference to the text only once per interval, so the
+                # client can keep growing its string in place in between
+                last = [0.0]
+
+                def on_text(text):
+                    now = time.monotonic()
+                    if now - last[0] >= STREAM_INTERVAL:
+                        last[0] = now
+                        streamed[name] = text
+                return on_text
+
+            def run(name):
+                prompt_stats = {}
+                if stats is not None:
+                    stats[name] = prompt_stats
+                try:
+                    text, error = document.generate(prompts[name], stats=prompt_stats,
+                                                    on_chunk=relay(name) if on_chunk is not None else None,
+                                                    text_parts=text_parts), None
+                except Exception as e:
+                    text, error = "", e
+                if cache is not None and text:
+                    cache.put(gemini_key(pdf_bytes or b"", model_option, _key_text(prompts[name], text_parts)),
+                              {"text": text})
+                results[name] = (text, False, error)
+                if on_result is not None:
+                    on_result(name, text, False, error)
+
+            pool = executor or ThreadPoolExecutor(max_workers=max_concurrency)
+            try:
+                futures = [pool.submit(run, name) for name in misses]
+                pending = futures
+                shown = {}
+                while pending:
+                    _, pending = wait(pending, timeout=STREAM_INTERVAL if on_chunk is not None else None)
+                    for name, text in list(streamed.items()):
+                        if shown.get(name) is not text:
+                            shown[name] = text
+                            on_chunk(name, text)
+                for future in futures:
+                    future.result()
+            finally:
+                if executor is None:
+                    pool.shutdown()
+
+    return {name: results[name] for name in prompts}
@@ -0,0 +1,109 @@
+# hybrid.py
+# Hybrid Gemini input: only pages that need OCR / handwriting recognition are
+# sent as PDF; text that pypdf can read locally is sent as plain text parts,
+# which costs far fewer tokens than page images.
+import io
+
+from pypdf import PdfReader, PdfWriter
+
+from classify import classify_pages, image_coverage
+from prompts import hybrid_note_template
+
+# Digital pages with an image covering at least this much of the page
+# (scanned inserts, handwriting on a printed form) are still sent as PDF
+IMAGE_PAGE_COVERAGE = 0.25
+
+
+def classify_for_hybrid(pdf_bytes, workers=1):
+    """Returns (reader, local): `local` maps every page to its locally
+    extracted text, or None when Gemini has to read the page."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    texts, methods = classify_pages(reader, pdf_bytes=pdf_bytes, workers=workers)
+    local = {}
+    for page_num, method in methods.items():
+        readable = method == "digital" and image_coverage(reader.pages[page_num - 1]) < IMAGE_PAGE_COVERAGE
+        local[page_num] = texts[page_num - 1] if readable else None
+    return reader, local
+
+
+def _runs(numbers):
+    """Ascending runs joined: [1, 2, 3, 4, 9, 5, 6] -> "1-4, 9, 5-6"."""
+    runs = []
+    for n in numbers:
+        if runs and n == runs[-1][1] + 1:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in runs)
+
+
+def _is_page_key(key):
+    # Page references in the prompts' JSON schemas: "page", "hospital_course_page", ...
+    return key in ("page", "pages") or key.endswith("_page")
+
+
+class HybridDocument:
+    """Pages `start`-`end` of a PDF as a reduced PDF plus text parts.
+
+    Gemini sees one numbering: the reduced PDF holds pages 1..k (the pages it
+    has to read), and the typed pages follow in document order as text parts
+    tagged [Page k+1] ... The note sent first lists the request's numbers in
+    original page order so the model can follow the chronology. `page_map`
+    maps these numbers back to the original document and `remap()` rewrites
+    page references in parsed JSON output.
+    Pass `classified` (from classify_for_hybrid) to split several page
+    ranges of one document without classifying it again.
+    """
+
+    def __init__(self, pdf_bytes, start=1, end=None, workers=1, classified=None):
+        reader, local = classified if classified is not None else classify_for_hybrid(pdf_bytes, workers)
+        end = end or len(reader.pages)
+        pages = range(start, end + 1)
+        self.scanned_pages = [p for p in pages if local[p] is None]
+        self.digital_pages = [p for p in pages if local[p] is not None]
+        self.page_map = dict(enumerate(self.scanned_pages + self.digital_pages, start=1))
+
+        self.pdf_bytes = None
+        if self.scanned_pages:
+            writer = PdfWriter()
+            for p in self.scanned_pages:
+                writer.add_page(reader.pages[p - 1])
+            out = io.BytesIO()
+            writer.write(out)
+            self.pdf_bytes = out.getvalue()
+
+        k, count = len(self.scanned_pages), len(self.page_map)
+        layout = []
+        if k:
+            layout.append(f"pages 1-{k} are the attached PDF (scanned or handwritten pages)")
+        if self.digital_pages:
+            layout.append(f"pages {k + 1}-{count} were typed and are given below as text, "
+                          f"each tagged [Page N]")
+        order = _runs(sorted(self.page_map, key=self.page_map.get))
+        self.text_parts = [hybrid_note_template.format(count=count, layout="; ".join(layout), order=order)]
+        self.text_parts += [f"[Page {k + i}]\n{local[p]}" for i, p in enumerate(self.digital_pages, start=1)]
+
+    def original_page(self, number):
+        """Original page number for a page number in the request's numbering
+        (-1 and unknown numbers are returned unchanged)."""
+        return self.page_map.get(number, number)
+
+    def remap(self, value):
+        """Copy of parsed JSON output with page references mapped back."""
+        if isinstance(value, dict):
+            return {key: self._remap_page(item) if _is_page_key(key) else self.remap(item)
+                    for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.remap(item) for item in value]
+        return value
+
+    def _remap_page(self, value):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int):
+            return self.original_page(value)
+        if isinstance(value, str) and value.strip().isdigit():
+            return str(self.original_page(int(value)))
+        if isinstance(value, list):
+            return [self._remap_page(item) for item in value]
+        return self.remap(value)
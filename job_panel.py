@@ -0,0 +1,80 @@
+# job_panel.py
+# Streamlit side of the background job runner (jobs.py): one runner per
+# server process and a self-refreshing list of jobs with their progress.
+# The runner is shared by every visitor, so a session only lists the jobs it
+# submitted or opened by id (job ids are random).
+import os
+
+import streamlit as st
+
+from jobs import ACTIVE_STATES, JobRunner, JobStore, is_resumable, job_text
+
+
+@st.cache_resource
+def get_runner():
+    """Process-wide JobRunner: survives reruns and closed tabs. The result
+    cache is chosen per job (submit_ocr / submit_gemini `cache_dir`)."""
+    return JobRunner(JobStore())
+
+
+def remember_job(job_id):
+    """Add `job_id` to the jobs listed in this browser session."""
+    job_ids = st.session_state.setdefault("job_ids", [])
+    if job_id not in job_ids:
+        job_ids.insert(0, job_id)
+
+
+def _forget_job(job_id):
+    job_ids = st.session_state.get("job_ids", [])
+    if job_id in job_ids:
+        job_ids.remove(job_id)
+
+
+@st.fragment(run_every=2)
+def show_jobs(runner, kind, api_key, limit=10):
+    """List this session's latest jobs of `kind` with progress, cancel /
+    resume / delete buttons and their output. A job from another session
+    (e.g. after the tab was closed) can be opened by its id. Refreshes
+    itself every 2 seconds."""
+    lookup = st.text_input("Open a job by id", key=f"{kind}_job_lookup").strip()
+    if lookup:
+        found = runner.store.job(lookup)
+        if found is not None and found["kind"] == kind:
+            remember_job(lookup)
+        else:
+            st.caption(f"No {kind} job with id `{lookup}`.")
+    jobs = [job for job in map(runner.store.job, st.session_state.get("job_ids", []))
+            if job is not None and job["kind"] == kind][:limit]
+    if not jobs:
+        st.caption("No background jobs in this session yet.")
+        return
+    unit = "pages" if kind == "ocr" else "prompts"
+    for job in jobs:
+        job_id = job["id"]
+        with st.container(border=True):
+            st.markdown(f"**{job['filename']}** · job `{job_id}` · {job['status']}")
+            st.progress(job["done"] / job["total"] if job["total"] else 1.0,
+                        text=f"{job['done']}/{job['total']} {unit} done")
+            if job["error"]:
+                st.error(job["error"])
+
+            col_action, col_delete, col_show = st.columns(3)
+            if job["status"] in ACTIVE_STATES:
+                if col_action.button("Cancel", key=f"cancel_{job_id}"):
+                    runner.cancel(job_id)
+            else:
+                if is_resumable(job) and col_action.button("Resume", key=f"resume_{job_id}"):
+                    if not api_key:
+                        st.warning("Enter the API key to resume this job.")
+                    else:
+                        runner.resume(job_id, api_key)
+                if col_delete.button("Delete", key=f"delete_{job_id}"):
+                    runner.store.delete(job_id)
+                    _forget_job(job_id)
+                    st.rerun(scope="fragment")
+
+            if job["done"] and col_show.toggle("Show output", key=f"show_{job_id}"):
+                text = job_text(runner.store, job_id)
+                st.text_area("Output", text, height=300, key=f"output_{job_id}")
+                stem = os.path.splitext(job["filename"] or "document")[0]
+                st.download_button("💾 Download", text, f"{stem}_{job_id}.txt", key=f"download_{job_id}")
@@ -0,0 +1,439 @@
+# jobs.py
+# Background extraction jobs with per-page checkpoints.
+#
+# The OCR loop and the Gemini calls used to run inside the Streamlit script,
+# so closing the tab, a rerun or a crash lost all finished work. A job is the
+# submitted PDF (copied into the jobs directory) plus its options; a
+# JobRunner works through jobs on background threads and checkpoints every
+# finished page (OCR) or prompt (Gemini) to SQLite as it completes. An
+# interrupted job resumes with only the pages / prompts that are still
+# missing. All jobs share one bounded I/O pool and one request limiter.
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from classify import classify_pages
+from dedup import find_duplicates
+from extraction import build_final_text, ocr_pages
+from large_file import MappedPdf, PageTextStore, spool_upload
+from ocr_engines import DEFAULT_MIN_CONFIDENCE, make_engine
+from ratelimit import AdaptiveLimiter
+from render import DEFAULT_MAX_BYTES
+from triage import triage_pages
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+
+DEFAULT_JOBS_DIR = os.path.join(DEFAULT_CACHE_DIR, "jobs")
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+RESUMABLE_STATES = (INTERRUPTED, FAILED, CANCELLED)
+
+# Finished pages: anything classified and not an error. Pages still marked
+# needs_ocr, or whose OCR failed, are redone when a job resumes.
+_DONE_PAGE = "method != 'needs_ocr' AND COALESCE(level, '') != 'error'"
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """SQLite store for jobs and their checkpointed pages / sections.
+
+    API keys are never written here; the runner keeps them in memory, so a
+    job interrupted by a restart needs the key again to resume.
+    """
+
+    def __init__(self, jobs_dir=DEFAULT_JOBS_DIR):
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.jobs_dir = jobs_dir
+        self.path = os.path.join(jobs_dir, "jobs.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, filename TEXT, pdf_path TEXT NOT NULL,"
+            " options TEXT NOT NULL, status TEXT NOT NULL, total INTEGER NOT NULL, error TEXT,"
+            " owner INTEGER, created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " job_id TEXT NOT NULL, page INTEGER NOT NULL, method TEXT NOT NULL, text TEXT, level TEXT,"
+            " PRIMARY KEY (job_id, page));"
+            "CREATE TABLE IF NOT EXISTS sections ("
+            " job_id TEXT NOT NULL, name TEXT NOT NULL, position INTEGER NOT NULL, text TEXT, error TEXT,"
+            " PRIMARY KEY (job_id, name));"
+        )
+        self._conn.commit()
+
+    def create(self, kind, filename, pdf_path, options, total):
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, filename, pdf_path, options, status, total, owner, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, filename, pdf_path, json.dumps(options), QUEUED, total, os.getpid(), now, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, owner = ?, updated = ? WHERE id = ?",
+                (status, error, os.getpid(), time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _rows(self, where="", params=()):
+        done = ("CASE j.kind WHEN 'ocr' THEN"
+                f" (SELECT COUNT(*) FROM pages p WHERE p.job_id = j.id AND {_DONE_PAGE})"
+                " ELSE (SELECT COUNT(*) FROM sections s WHERE s.job_id = j.id AND s.error IS NULL) END")
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT j.id, j.kind, j.filename, j.pdf_path, j.options, j.status, j.total, j.error,"
+                f" j.owner, j.created, j.updated, {done} FROM jobs j {where} ORDER BY j.created DESC",
+                params
+            )
+            rows = cursor.fetchall()
+        keys = ("id", "kind", "filename", "pdf_path", "options", "status", "total", "error",
+                "owner", "created", "updated", "done")
+        jobs = [dict(zip(keys, row)) for row in rows]
+        for job in jobs:
+            job["options"] = json.loads(job["options"])
+        return jobs
+
+    def job(self, job_id):
+        """{"id", "kind", "status", "total", "done", ...} or None."""
+        rows = self._rows("WHERE j.id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def jobs(self, kind=None):
+        """All jobs (newest first), optionally of one kind."""
+        return self._rows("WHERE j.kind = ?", (kind,)) if kind else self._rows()
+
+    def _exists(self, job_id):
+        return self._conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def save_pages(self, job_id, rows):
+        """Checkpoint (page, method, text, level) rows; False if the job was deleted."""
+        with self._lock:
+            if not self._exists(job_id):
+                return False
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (job_id, page, method, text, level) VALUES (?, ?, ?, ?, ?)",
+                [(job_id,) + tuple(row) for row in rows]
+            )
+            self._conn.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+        return True
+
+    def pages(self, job_id):
+        """{page: (method, text, level)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, method, text, level FROM pages WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {page: (method, text, level) for page, method, text, level in rows}
+
+    def save_section(self, job_id, name, position, text, error=None):
+        """False if the job was deleted."""
+        with self._lock:
+            if not self._exists(job_id):
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sections (job_id, name, position, text, error) VALUES (?, ?, ?, ?, ?)",
+                (job_id, name, position, text, error)
+            )
+            self._conn.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+        return True
+
+    def sections(self, job_id):
+        """[(name, text, error)] in prompt order."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT name, text, error FROM sections WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+
+    def mark_orphans(self):
+        """Flag queued / running jobs whose owning process has died as interrupted."""
+        orphans = [job["id"] for job in self._rows("WHERE j.status IN (?, ?)", ACTIVE_STATES)
+                   if job["owner"] != os.getpid() and not _pid_alive(job["owner"])]
+        for job_id in orphans:
+            self.set_status(job_id, INTERRUPTED)
+        return orphans
+
+    def delete(self, job_id):
+        job = self.job(job_id)
+        if job is None:
+            return
+        with self._lock:
+            for table, column in (("pages", "job_id"), ("sections", "job_id"), ("jobs", "id")):
+                self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (job_id,))
+            self._conn.commit()
+        if os.path.exists(job["pdf_path"]):
+            os.remove(job["pdf_path"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def is_resumable(job):
+    return job["status"] in RESUMABLE_STATES or (job["status"] == DONE and job["done"] < job["total"])
+
+
+def job_text(store, job_id):
+    """Combined output of a job, with placeholders for unfinished pages."""
+    job = store.job(job_id)
+    if job["kind"] == "ocr":
+        pages = store.pages(job_id)
+        methods = {page: method for page, (method, _, _) in pages.items()}
+        texts = [pages[page][1] if page in pages else None for page in range(1, job["total"] + 1)]
+        return build_final_text(texts, methods)
+    return "\n\n".join(f"### {name}\n{text if error is None else '[error] ' + error}"
+                       for name, text, error in store.sections(job_id))
+
+
+class JobRunner:
+    """Runs jobs from a JobStore on background threads.
+
+    At most `max_jobs` jobs run at once; their page uploads / Gemini calls
+    share one pool of `pool_size` threads and one limiter (by default an
+    AdaptiveLimiter bounded by the pool size), so several jobs together
+    never exceed the same request budget as one. Each job opens the result
+    cache in its own `cache_dir` (None = no cache) while it runs. Jobs left
+    queued or running by a process that has died are marked interrupted on
+    start-up.
+
+        runner = JobRunner(JobStore())
+        job_id = runner.submit_ocr(open("scan.pdf", "rb"), "scan.pdf", api_key)
+        runner.store.job(job_id)["done"]
+    """
+
+    def __init__(self, store=None, pool_size=8, max_jobs=2, limiter=None):
+        self.store = store if store is not None else JobStore()
+        self.pool_size = pool_size
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter(max_in_flight=pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="job-io")
+        self._jobs = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+        self._api_keys = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self.store.mark_orphans()
+
+    def _spool(self, fileobj):
+        path = spool_upload(fileobj, directory=self.store.jobs_dir)
+        with MappedPdf(path) as mapped:
+            return path, len(mapped.reader.pages)
+
+    def submit_ocr(self, fileobj, filename, api_key, render_options=None, classify_workers=1,
+                   engine="ocr.space", min_confidence=DEFAULT_MIN_CONFIDENCE, dedup_distance=None,
+                   triage=False, cache_dir=None):
+        """Queue digital extraction + OCR for one PDF; returns the job id.
+
+        `engine` and `min_confidence` select the OCR backend (see
+        ocr_engines.make_engine). With `dedup_distance` (0 = exact copies),
+        duplicate scan pages are OCRed once (see dedup.py). `triage` skips
+        blank pages and OCRs mostly-scanned digital pages (see triage.py).
+        Results are cached in `cache_dir` (None = no cache).
+        """
+        path, total = self._spool(fileobj)
+        options = {"render_options": render_options, "classify_workers": classify_workers,
+                   "engine": engine, "min_confidence": min_confidence, "dedup_distance": dedup_distance,
+                   "triage": triage, "cache_dir": cache_dir}
+        job_id = self.store.create("ocr", filename, path, options, total)
+        self._start(job_id, api_key)
+        return job_id
+
+    def submit_gemini(self, fileobj, filename, api_key, model_option, prompts, chunked=None,
+                      use_context_cache=True, hybrid=False, cache_dir=None):
+        """Queue Gemini prompts ({name: prompt text}) for one PDF; returns the job id.
+
+        `chunked` ({"window", "overlap"}) runs each prompt through
+        gemini_client.generate_chunked; finished page windows are then reused
+        from the result cache when the job resumes. `hybrid` sends typed
+        pages as text (see hybrid.py). Answers are cached in `cache_dir`
+        (None = no cache).
+        """
+        path, _ = self._spool(fileobj)
+        options = {"model": model_option, "prompts": prompts, "chunked": chunked,
+                   "use_context_cache": use_context_cache, "hybrid": hybrid, "cache_dir": cache_dir}
+        job_id = self.store.create("gemini", filename, path, options, len(prompts))
+        self._start(job_id, api_key)
+        return job_id
+
+    def resume(self, job_id, api_key):
+        """Restart an interrupted, failed or cancelled job from its checkpoints
+        (or a finished one that still has failed pages / prompts)."""
+        job = self.store.job(job_id)
+        if job is None or not is_resumable(job):
+            return False
+        self.store.set_status(job_id, QUEUED)
+        self._start(job_id, api_key)
+        return True
+
+    def cancel(self, job_id):
+        """Stop a job after its in-flight pages finish; it can be resumed later."""
+        with self._lock:
+            self._cancelled.add(job_id)
+
+    def _is_cancelled(self, job_id):
+        with self._lock:
+            return job_id in self._cancelled
+
+    def _start(self, job_id, api_key):
+        with self._lock:
+            self._api_keys[job_id] = api_key
+            self._cancelled.discard(job_id)
+        self._jobs.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        job = self.store.job(job_id)
+        with self._lock:
+            api_key = self._api_keys.pop(job_id, None)
+        if job is None:
+            # Deleted before it started
+            return
+        if self._is_cancelled(job_id):
+            self.store.set_status(job_id, CANCELLED)
+            return
+        self.store.set_status(job_id, RUNNING)
+        cache_dir = job["options"].get("cache_dir")
+        cache = None
+        try:
+            cache = ResultCache(cache_dir) if cache_dir else None
+            if job["kind"] == "ocr":
+                finished = self._run_ocr(job, api_key, cache)
+            else:
+                finished = self._run_gemini(job, api_key, cache)
+            if self.store.job(job_id) is None:
+                return
+            self.store.set_status(job_id, DONE if finished else CANCELLED)
+        except Exception as e:
+            # Deleting a running job removes its PDF and rows under the worker
+            if self.store.job(job_id) is None:
+                return
+            self.store.set_status(job_id, FAILED, error=str(e))
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def _run_ocr(self, job, api_key, cache):
+        job_id, options = job["id"], job["options"]
+        with MappedPdf(job["pdf_path"]) as mapped:
+            reader = mapped.reader
+            pages = self.store.pages(job_id)
+            if not pages:
+                text_store = PageTextStore(job["total"])
+                try:
+                    texts, methods = classify_pages(reader, workers=options["classify_workers"],
+                                                    pdf_path=job["pdf_path"], text_store=text_store)
+                    if options.get("triage"):
+                        methods.update(triage_pages(reader, methods, job["pdf_path"], release_cache=True))
+                    if not self.store.save_pages(job_id, [
+                        (page, method, "" if method == "blank" else texts[page - 1],
+                         None if method == "needs_ocr" else "success")
+                        for page, method in methods.items()
+                    ]):
+                        return False
+                finally:
+                    text_store.close()
+                pages = self.store.pages(job_id)
+
+            todo = sorted(page for page, (method, _, level) in pages.items()
+                          if method == "needs_ocr" or level == "error")
+            duplicates = None
+            if options.get("dedup_distance") is not None:
+                duplicates = find_duplicates(reader, todo, pdf_source=job["pdf_path"],
+                                             max_distance=options["dedup_distance"], release_cache=True)
+            with make_engine(options.get("engine", "ocr.space"), api_key, limiter=self.limiter,
+                             cache=cache,
+                             min_confidence=options.get("min_confidence", DEFAULT_MIN_CONFIDENCE)) as engine:
+                results = ocr_pages(reader, todo, api_key, max_workers=self.pool_size,
+                                    render_options=options["render_options"], release_cache=True,
+                                    executor=self.executor, engine=engine, duplicates=duplicates,
+                                    page_budget=(options["render_options"] or {}).get("max_bytes", DEFAULT_MAX_BYTES))
+                try:
+                    for result in results:
+                        # Digital pages sent to OCR by triage keep their text if OCR finds none
+                        text = result.text or pages[result.page_num][1] or ""
+                        saved = self.store.save_pages(job_id, [(result.page_num, result.method, text, result.level)])
+                        if not saved or self._is_cancelled(job_id):
+                            return False
+                finally:
+                    results.close()
+        return True
+
+    def _run_gemini(self, job, api_key, cache):
+        from google import genai
+
+        from gemini_client import generate_chunked, generate_many, remap_answer
+        from hybrid import HybridDocument, classify_for_hybrid
+
+        job_id, options = job["id"], job["options"]
+        prompts = options["prompts"]
+        positions = {name: i for i, name in enumerate(prompts)}
+        finished = {name for name, _, error in self.store.sections(job_id) if error is None}
+        remaining = {name: text for name, text in prompts.items() if name not in finished}
+        if not remaining:
+            return True
+
+        client = genai.Client(api_key=api_key)
+        with open(job["pdf_path"], "rb") as f:
+            pdf_bytes = f.read()
+
+        classified = classify_for_hybrid(pdf_bytes) if options.get("hybrid") else None
+        document = None
+
+        def checkpoint(name, text, cached, error):
+            if document is not None and text:
+                text = remap_answer(text, document)
+            return self.store.save_section(job_id, name, positions[name], text,
+                                           None if error is None else str(error))
+
+        chunked = options["chunked"]
+        if chunked is None:
+            if classified is not None:
+                document = HybridDocument(pdf_bytes, classified=classified)
+            generate_many(client, options["model"], document.pdf_bytes if document else pdf_bytes, remaining,
+                          cache=cache, use_context_cache=options["use_context_cache"],
+                          on_result=checkpoint, executor=self.executor,
+                          text_parts=document.text_parts if document else ())
+            return True
+        for name, prompt_text in remaining.items():
+            if self._is_cancelled(job_id):
+                return False
+            try:
+                text, _, _ = generate_chunked(client, options["model"], pdf_bytes, prompt_text,
+                                              window=chunked["window"], overlap=chunked["overlap"],
+                                              cache=cache, executor=self.executor, hybrid=classified)
+                saved = checkpoint(name, text, False, None)
+            except Exception as e:
+                saved = checkpoint(name, "", False, e)
+            if not saved:
+                return False
+        return True
+
+    def shutdown(self, wait=False):
+        self._jobs.shutdown(wait=wait, cancel_futures=True)
+        self.executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,167 @@
+# large_file.py
+# Memory-bounded handling of very large PDFs (hundreds of MB of scans).
+#
+# In large-file mode the PDF lives in a temp file that is memory-mapped
+# instead of being held as one Python bytes object, pypdf's object cache is
+# released after every page, single-page payloads are passed around as
+# memoryviews and page text is kept in an on-disk store.
+#
+# Memory target (verified by `python -m benchmarks.memory_check`): peak
+# private (anonymous) memory stays below
+#     LARGE_FILE_BASE_MB + in_flight x 3 x largest single-page payload
+# independent of the total file size. File-backed pages of the memory map are
+# page cache the kernel can drop, so they are not counted.
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+from pypdf import PdfReader
+
+# Uploads above this size switch the apps / CLI to large-file mode
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+
+# Fixed part of the memory target: interpreter, libraries and bookkeeping
+LARGE_FILE_BASE_MB = 128
+
+SPOOL_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def spool_upload(fileobj, directory=None):
+    """Copy a file-like upload to a named temp file in chunks; returns its path."""
+    fileobj.seek(0)
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(fileobj, out, SPOOL_CHUNK_SIZE)
+    return path
+
+
+def _unlink_all(paths):
+    for path in paths.values():
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    paths.clear()
+
+
+class UploadSpool:
+    """Spooled copies of uploads, keyed by upload id.
+
+        spool = UploadSpool()
+        spool.retain([upload.file_id for upload in uploads])
+        path = spool.path(upload.file_id, upload)
+
+    Each upload is spooled once. retain() deletes the files of uploads that
+    are gone; the rest are deleted by close(), when the spool is garbage
+    collected (e.g. with the session that holds it) or at interpreter exit.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._paths = {}
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _unlink_all, self._paths)
+
+    def path(self, key, fileobj):
+        """Path of the spooled copy of `fileobj`, spooling it on first use."""
+        with self._lock:
+            if key not in self._paths:
+                self._paths[key] = spool_upload(fileobj, directory=self.directory)
+            return self._paths[key]
+
+    def retain(self, keys):
+        """Delete the spooled copies of every upload not in `keys`."""
+        keys = set(keys)
+        with self._lock:
+            _unlink_all({key: self._paths.pop(key) for key in list(self._paths) if key not in keys})
+
+    def close(self):
+        self._finalizer()
+
+
+class MappedPdf:
+    """A PdfReader over a memory-mapped file.
+
+        with MappedPdf(path) as mapped:
+            reader = mapped.reader
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reader = PdfReader(self._map)
+
+    def close(self):
+        self.reader = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def release_object_cache(pdf_reader):
+    """Drop pypdf's resolved-object cache.
+
+    pypdf keeps every object it has parsed (including image streams) for the
+    lifetime of the reader, so walking a scanned file page by page would
+    otherwise end up holding the whole file in memory. Objects are re-read
+    from the file if needed again.
+    """
+    pdf_reader.resolved_objects.clear()
+
+
+class PageTextStore:
+    """List-like page text container backed by a temp file.
+
+    Indexing mirrors the `extracted_text` list used by the apps: 0-based,
+    None for pages without text yet; assigning past the end grows the store
+    (for pages that arrive before the page count is known). Only offsets
+    stay in memory. Safe to read from a download thread while the script
+    writes.
+    """
+
+    def __init__(self, total_pages=0, directory=None):
+        self._file = tempfile.TemporaryFile(mode="w+b", dir=directory)
+        self._index = [None] * total_pages
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __setitem__(self, i, text):
+        if i >= len(self._index):
+            self._index.extend([None] * (i + 1 - len(self._index)))
+        if text is None:
+            self._index[i] = None
+            return
+        data = text.encode("utf-8")
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            self._index[i] = (self._file.tell(), len(data))
+            self._file.write(data)
+
+    def __getitem__(self, i):
+        entry = self._index[i]
+        if entry is None:
+            return None
+        offset, length = entry
+        with self._lock:
+            self._file.seek(offset)
+            data = self._file.read(length)
+        return data.decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self._index)):
+            yield self[i]
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,24 @@
+# live_text.py
+# Incremental rendering of streamed model output into a Streamlit placeholder.
+import time
+
+
+class LiveText:
+    """Callable `on_chunk` target that re-renders `placeholder` (an
+    `st.empty()`) with the text streamed so far at most every `interval`
+    seconds. The client owns the growing text; nothing is copied or
+    re-joined here."""
+
+    def __init__(self, placeholder, interval=0.15):
+        self.placeholder = placeholder
+        self.interval = interval
+        self._last_render = 0.0
+
+    def __call__(self, text):
+        now = time.monotonic()
+        if now - self._last_render >= self.interval:
+            self._last_render = now
+            self.placeholder.text(text)
+
+    def clear(self):
+        self.placeholder.empty()
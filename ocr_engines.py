@@ -0,0 +1,229 @@
+# ocr_engines.py
+# OCR backends behind one interface. The page loop (extraction.ocr_pages)
+# calls engine.recognize() from its worker threads and gets an OcrResult:
+#   OcrSpaceEngine  - the OCR.space client (ocr_space.ocr_page)
+#   TesseractEngine - local Tesseract on rendered pages, on a process pool
+#   RoutedEngine    - local engine first; low-confidence pages go to OCR.space
+# Tesseract needs the `tesseract` binary (see packages.txt) and pytesseract.
+import importlib.util
+import io
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ocr_space import DEFAULT_RETRY, OcrResult, ocr_page
+from result_cache import ocr_key
+
+# Engine names accepted by make_engine (and the CLI / app selectors)
+ENGINES = ("ocr.space", "tesseract", "tesseract+ocr.space")
+
+# Pages whose mean Tesseract word confidence (0-100) is below this are
+# escalated to OCR.space by RoutedEngine
+DEFAULT_MIN_CONFIDENCE = 70
+
+# Tesseract is most accurate around 300 DPI; rendered uploads (render.py)
+# are accepted as they are
+TESSERACT_DPI = 300
+
+_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def tesseract_available():
+    """True if pytesseract and the tesseract binary are installed."""
+    return importlib.util.find_spec("pytesseract") is not None and shutil.which("tesseract") is not None
+
+
+def tesseract_page(payload, filename, dpi, lang):
+    """OCR one page image or single-page PDF with Tesseract.
+
+    Returns (text, mean word confidence or None, seconds). Runs in a worker
+    process; the text is rebuilt from Tesseract's word boxes so each page is
+    recognised only once.
+    """
+    import pytesseract
+    from PIL import Image
+
+    started = time.perf_counter()
+    if filename and filename.lower().endswith(_IMAGE_EXTENSIONS):
+        image = Image.open(io.BytesIO(payload))
+    else:
+        from pdf2image import convert_from_bytes
+        image = convert_from_bytes(payload, dpi=dpi, grayscale=True)[0]
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+
+    blocks = {}
+    confidences = []
+    for word, conf, block, par, line in zip(data["text"], data["conf"], data["block_num"],
+                                            data["par_num"], data["line_num"]):
+        if not word.strip() or float(conf) < 0:
+            continue
+        confidences.append(float(conf))
+        blocks.setdefault(block, {}).setdefault((par, line), []).append(word)
+    text = "\n\n".join("\n".join(" ".join(words) for words in lines.values()) for lines in blocks.values())
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return text, confidence, time.perf_counter() - started
+
+
+class OcrEngine:
+    """One OCR backend. recognize() is called from worker threads and must
+    not raise for per-page failures; they are reported in the OcrResult.
+    `remote` tells whether pages are uploaded (free-plan size limits apply).
+    """
+
+    name = None
+    remote = False
+
+    def recognize(self, page_num, payload, filename=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class OcrSpaceEngine(OcrEngine):
+    """OCR.space through ocr_space.ocr_page (rate limits, retries, cache).
+
+    `api_key` may be a transport.KeyPool; `transport` defaults to the shared
+    pooled session.
+    """
+
+    name = "ocr.space"
+    remote = True
+
+    def __init__(self, api_key, limiter=None, cache=None, tracer=None, retry=DEFAULT_RETRY, timeout=None,
+                 transport=None):
+        self.api_key = api_key
+        self.transport = transport
+        self.limiter = limiter
+        self.cache = cache
+        self.tracer = tracer
+        self.retry = retry
+        self.timeout = timeout
+
+    def recognize(self, page_num, payload, filename=None):
+        return ocr_page(page_num, payload, self.api_key, self.limiter, timeout=self.timeout,
+                        cache=self.cache, filename=filename, tracer=self.tracer, retry=self.retry,
+                        transport=self.transport)
+
+
+class TesseractEngine(OcrEngine):
+    """Local Tesseract on a pool of `workers` processes (default: one per core).
+
+    PDF payloads are rendered at `dpi`; image payloads (render_options in
+    ocr_pages) are recognised as they are. Results carry the mean word
+    confidence and are cached like OCR.space answers.
+    """
+
+    name = "tesseract"
+
+    def __init__(self, workers=None, dpi=TESSERACT_DPI, lang="eng", cache=None, tracer=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.dpi = dpi
+        self.lang = lang
+        self.cache = cache
+        self.tracer = tracer
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def recognize(self, page_num, payload, filename=None):
+        started = time.perf_counter()
+        result = self._recognize(page_num, payload, filename)
+        return result._replace(elapsed=time.perf_counter() - started)
+
+    def _recognize(self, page_num, payload, filename):
+        key = None
+        if self.cache is not None:
+            key = ocr_key(payload, {"language": self.lang, "OCREngine": f"tesseract@{self.dpi}"})
+            hit = self.cache.get(key)
+            if hit is not None:
+                return OcrResult(page_num, hit["method"], hit["text"], hit["level"],
+                                 f"Cached local OCR result for page {page_num} ({len(hit['text'])} chars).",
+                                 cached=True, confidence=hit["confidence"])
+
+        try:
+            # memoryviews cannot be pickled for the worker process
+            text, confidence, seconds = self.pool.submit(tesseract_page, bytes(payload), filename,
+                                                         self.dpi, self.lang).result()
+        except Exception as e:
+            return OcrResult(page_num, "tesseract_error", "", "error",
+                             f"Local OCR failed for page {page_num}: {e!r}")
+        if self.tracer is not None:
+            self.tracer.add("local_ocr", seconds, page=page_num, bytes_in=len(payload),
+                            bytes_out=len(text.encode("utf-8")))
+
+        if text.strip():
+            result = OcrResult(page_num, "tesseract", text, "success",
+                               f"Local OCR for page {page_num} ({len(text)} chars, "
+                               f"confidence {confidence:.0f}).", confidence=confidence)
+        else:
+            result = OcrResult(page_num, "tesseract_empty", "", "warning",
+                               f"Local OCR found no text on page {page_num}.")
+        if key is not None:
+            self.cache.put(key, {"method": result.method, "text": result.text, "level": result.level,
+                                 "confidence": result.confidence})
+        return result
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class RoutedEngine(OcrEngine):
+    """Try `local` first and escalate to `fallback` when the local result is
+    an error, empty or below `min_confidence`. If the escalation fails too,
+    the local text (if any) is kept. `escalated` counts escalated pages.
+    """
+
+    name = "routed"
+
+    def __init__(self, local, fallback, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.local = local
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self.remote = fallback.remote
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    def recognize(self, page_num, payload, filename=None):
+        first = self.local.recognize(page_num, payload, filename)
+        if first.level == "success" and (first.confidence or 0) >= self.min_confidence:
+            return first
+
+        reason = (f"confidence {first.confidence:.0f} < {self.min_confidence}"
+                  if first.level == "success" else first.method)
+        with self._lock:
+            self.escalated += 1
+        result = self.fallback.recognize(page_num, payload, filename)
+        elapsed = (first.elapsed or 0) + (result.elapsed or 0)
+        if result.level != "success" and first.level == "success":
+            return first._replace(level="warning", elapsed=elapsed,
+                                  message=f"{first.message} Escalation failed: {result.message}")
+        return result._replace(elapsed=elapsed, message=f"{result.message} (escalated from {self.local.name}: "
+                                                        f"{reason})")
+
+    def close(self):
+        self.local.close()
+        self.fallback.close()
+
+
+def make_engine(name, api_key=None, limiter=None, cache=None, tracer=None, retry=DEFAULT_RETRY,
+                workers=None, min_confidence=DEFAULT_MIN_CONFIDENCE, transport=None):
+    """Build the engine called `name` (one of ENGINES)."""
+    if name == "ocr.space":
+        return OcrSpaceEngine(api_key, limiter=limiter, cache=cache, tracer=tracer, retry=retry,
+                              transport=transport)
+    if name == "tesseract":
+        return TesseractEngine(workers=workers, cache=cache, tracer=tracer)
+    if name == "tesseract+ocr.space":
+        return RoutedEngine(TesseractEngine(workers=workers, cache=cache, tracer=tracer),
+                            OcrSpaceEngine(api_key, limiter=limiter, cache=cache, tracer=tracer, retry=retry,
+                                           transport=transport),
+                            min_confidence=min_confidence)
+    raise ValueError(f"Unknown OCR engine: {name!r} (expected one of {', '.join(ENGINES)})")
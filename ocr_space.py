@@ -0,0 +1,310 @@
+# ocr_space.py
+# Single-page OCR.space client shared by the Streamlit app and worker threads.
+# Requests go through a pooled keep-alive transport and, with several API
+# keys, a KeyPool that picks the key for each attempt (transport.py).
+import io
+import json
+import os
+import re
+import time
+from collections import namedtuple
+
+import requests
+from pypdf import PdfWriter
+
+from ratelimit import RetryPolicy
+from result_cache import ocr_key
+from transport import KeyPool, default_transport
+
+# OCR.space endpoint (overridable, e.g. to point the benchmark at a local mock)
+OCR_URL = os.environ.get("OCR_SPACE_URL", "https://api.ocr.space/parse/image")
+
+# Free-plan upload limit
+FREE_PLAN_LIMIT = 1024 * 1024
+
+# Outcome of one page: `method` is the tag shown in the extraction summary,
+# `level` is "success" / "warning" / "error" for the UI message.
+# `cached` is True when the result came from the local result cache,
+# `elapsed` is the wall time spent in ocr_page (including rate-limit waits and
+# retries) and `attempts` the number of requests made. `confidence` is the
+# engine's mean word confidence (0-100) where it reports one (ocr_engines.py).
+OcrResult = namedtuple("OcrResult",
+                       ["page_num", "method", "text", "level", "message", "cached", "elapsed", "attempts",
+                        "confidence"],
+                       defaults=[False, None, 1, None])
+
+# Failure classes: throttling is retried and slows the limiter down,
+# transient failures are retried, permanent ones are reported at once
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# OCR.space reports quota / rate limits as plain-text 403s or error messages
+_THROTTLE_MESSAGE = re.compile(r"rate limit|too many|maximum \d+ number of times", re.IGNORECASE)
+# HTTP statuses that reject the API key itself rather than the page
+_KEY_REJECTED = (401, 403)
+# E101: timed out waiting for results, E500: generic server error
+_TRANSIENT_MESSAGE = re.compile(r"\bE101\b|\bE500\b|timed? ?out|busy|try again|temporar", re.IGNORECASE)
+
+# Default retry policy for ocr_page
+DEFAULT_RETRY = RetryPolicy()
+
+
+def single_page_pdf(pdf_reader, page_num):
+    """Return a one-page PDF holding `page_num` (1-based).
+
+    The result is a memoryview over the writer's buffer: it is built once
+    and handed to hashing and the upload without further copies.
+    """
+    writer = PdfWriter()
+    writer.add_page(pdf_reader.pages[page_num - 1])
+    single_page_io = io.BytesIO()
+    writer.write(single_page_io)
+    return single_page_io.getbuffer()
+
+
+def ocr_params(api_key):
+    return {
+        "apikey": api_key,
+        "language": "eng",
+        "isOverlayRequired": False,
+        "detectOrientation": True,
+        "OCREngine": 2
+    }
+
+
+class _TimedBody(io.BytesIO):
+    """Request body that notes when the HTTP client has read all of it,
+    i.e. when the upload finished and the wait for the API began."""
+
+    finished = None
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and self.finished is None:
+            self.finished = time.perf_counter()
+        return data
+
+
+def _post(page_num, files, data, timeout, tracer=None, transport=None):
+    """POST one page through `transport` (default: the shared pooled
+    Transport) and return the decoded JSON response.
+
+    With a Tracer, the request is split into "upload", "api_wait" and
+    "json_decode" spans.
+    """
+    transport = transport or default_transport()
+    if tracer is None:
+        resp = transport.post(OCR_URL, files=files, data=data, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    prepared = requests.Request("POST", OCR_URL, files=files, data=data).prepare()
+    body = _TimedBody(prepared.body)
+    prepared.body = body
+    size = len(body.getbuffer())
+    started = time.perf_counter()
+    try:
+        resp = transport.send(prepared, timeout=timeout)
+    except requests.exceptions.RequestException:
+        tracer.add("upload", time.perf_counter() - started, page=page_num, bytes_in=size,
+                   outcome="error", start=started - tracer.origin)
+        raise
+    received = time.perf_counter()
+    uploaded = body.finished or received
+
+    tracer.add("upload", uploaded - started, page=page_num, bytes_in=size, start=started - tracer.origin)
+    tracer.add("api_wait", received - uploaded, page=page_num, bytes_out=len(resp.content),
+               outcome="ok" if resp.ok else f"http_{resp.status_code}", start=uploaded - tracer.origin)
+    resp.raise_for_status()
+    with tracer.span("json_decode", page=page_num, bytes_in=len(resp.content)):
+        return resp.json()
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_exception(exc):
+    """Return (failure class, Retry-After seconds or None) for a request error."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        # Connection errors and timeouts
+        return TRANSIENT, None
+    status = response.status_code
+    if status == 429 or (status == 403 and _THROTTLE_MESSAGE.search(response.text or "")):
+        return THROTTLED, _retry_after(response)
+    if status >= 500 or status == 408:
+        return TRANSIENT, _retry_after(response)
+    return PERMANENT, None
+
+
+def classify_result(result):
+    """Failure class of a parsed OcrResult, or None if it is a final answer."""
+    if result.method in ("ocr.space", "ocr_empty"):
+        return None
+    if result.method == "no_parsed_results":
+        return TRANSIENT
+    if _THROTTLE_MESSAGE.search(result.message):
+        return THROTTLED
+    if _TRANSIENT_MESSAGE.search(result.message):
+        return TRANSIENT
+    return PERMANENT
+
+
+def ocr_page(page_num, payload, api_key, limiter=None, timeout=None, cache=None, filename=None,
+             tracer=None, retry=DEFAULT_RETRY, transport=None):
+    """Upload one single-page PDF to OCR.space and parse the response.
+
+    Never raises for request/API failures; they are reported through the
+    returned OcrResult so callers can run this from a thread pool. When a
+    ResultCache is given, parsed results are looked up / stored by page hash.
+    A telemetry.Tracer receives rate-limit wait, request and backoff spans.
+
+    Throttled and transient failures are retried following `retry` (a
+    ratelimit.RetryPolicy; None for a single attempt): transient ones up to
+    its max_attempts, throttled ones until its throttle_timeout. Every
+    response is reported to `limiter.record()` so an AdaptiveLimiter can
+    adjust.
+
+    `api_key` is one key or a transport.KeyPool; with a pool every attempt
+    goes to the key with the most headroom, and a page whose key is
+    rejected (401 / 403) is retried on another. `timeout` defaults to the
+    transport's (connect, read) timeouts.
+    """
+    started = time.perf_counter()
+    result = _ocr_page(page_num, payload, api_key, limiter, timeout, cache, filename, tracer, retry,
+                       transport)
+    return result._replace(elapsed=time.perf_counter() - started)
+
+
+def _ocr_page(page_num, payload, api_key, limiter, timeout, cache, filename, tracer, retry, transport):
+    files = {"file": (filename or f"page_{page_num}.pdf", payload)}
+
+    key = None
+    if cache is not None:
+        # The key itself is not part of the cache key
+        key = ocr_key(payload, ocr_params(None))
+        hit = cache.get(key)
+        if hit is not None:
+            return OcrResult(page_num, hit["method"], hit["text"], hit["level"],
+                             f"Cached OCR result for page {page_num} ({len(hit['text'])} chars).",
+                             cached=True)
+
+    max_attempts = retry.max_attempts if retry is not None else 1
+    attempt = failures = throttles = 0
+    throttled_since = None
+    while True:
+        attempt += 1
+        if limiter is not None:
+            wait_started = time.perf_counter()
+            limiter.acquire()
+            if tracer is not None:
+                tracer.add("rate_limit_wait", time.perf_counter() - wait_started, page=page_num)
+            try:
+                sent = time.perf_counter()
+                result, failure, retry_after = _keyed_attempt(page_num, files, api_key, timeout, tracer,
+                                                              transport)
+                limiter.record(failure or "ok", time.perf_counter() - sent, retry_after)
+            finally:
+                limiter.release()
+        else:
+            result, failure, retry_after = _keyed_attempt(page_num, files, api_key, timeout, tracer, transport)
+
+        if failure is None or failure == PERMANENT or retry is None:
+            break
+        if failure == THROTTLED:
+            # Throttling is the provider asking us to slow down, not a fault
+            # of the page: keep retrying until it has gone on too long
+            throttles += 1
+            throttled_since = throttled_since or time.perf_counter()
+            if time.perf_counter() - throttled_since >= retry.throttle_timeout:
+                break
+            delay = retry.delay(throttles, retry_after)
+        else:
+            failures += 1
+            if failures >= max_attempts:
+                break
+            delay = retry.delay(failures, retry_after)
+        if tracer is not None:
+            tracer.add("retry_backoff", delay, page=page_num, outcome=failure)
+        time.sleep(delay)
+
+    if failure == THROTTLED:
+        result = result._replace(method="rate_limited",
+                                 message=f"OCR.space kept throttling page {page_num}: {result.message}")
+    if attempt > 1:
+        result = result._replace(message=f"{result.message} (after {attempt} attempts)")
+    result = result._replace(attempts=attempt)
+
+    # Only cache answers the API actually produced; request failures are retried next run
+    if key is not None and failure is None:
+        cache.put(key, {"method": result.method, "text": result.text, "level": result.level})
+    return result
+
+
+def _keyed_attempt(page_num, files, api_key, timeout, tracer, transport):
+    """_attempt with the key (or a key picked from a KeyPool) filled in."""
+    if not isinstance(api_key, KeyPool):
+        return _attempt(page_num, files, ocr_params(api_key), timeout, tracer, transport)[:3]
+    key = api_key.acquire()
+    if key is None:
+        return (OcrResult(page_num, "quota_exhausted", "", "error",
+                          f"Every API key has used up its quota; page {page_num} was not sent."),
+                PERMANENT, None)
+    try:
+        result, failure, retry_after, status = _attempt(page_num, files, ocr_params(key), timeout, tracer,
+                                                        transport)
+        # Only throttling and a rejected key (401 / 403) count against the
+        # key; the page is retried on another one. Page-level errors (400,
+        # 413, ...) and server or network trouble say nothing about the key.
+        if failure == PERMANENT and status in _KEY_REJECTED:
+            failure = TRANSIENT
+            api_key.record(key, "rejected")
+        else:
+            api_key.record(key, failure if failure == THROTTLED else None, retry_after)
+        return result, failure, retry_after
+    finally:
+        api_key.release(key)
+
+
+def _attempt(page_num, files, data, timeout, tracer, transport=None):
+    """One request: returns (OcrResult, failure class or None, Retry-After,
+    HTTP error status or None)."""
+    try:
+        resp_json = _post(page_num, files, data, timeout, tracer, transport)
+    except requests.exceptions.RequestException as re:
+        failure, retry_after = classify_exception(re)
+        status = re.response.status_code if getattr(re, "response", None) is not None else None
+        return (OcrResult(page_num, "network_error", "", "error",
+                          f"Network or request error on page {page_num}: {re}"), failure, retry_after, status)
+    except json.JSONDecodeError as je:
+        return (OcrResult(page_num, "bad_json", "", "error",
+                          f"Invalid JSON response for page {page_num}: {je}"), TRANSIENT, None, None)
+
+    result = parse_response(page_num, resp_json)
+    return result, classify_result(result), None, None
+
+
+def parse_response(page_num, resp_json):
+    # Check API response for errors
+    if resp_json.get("IsErroredOnProcessing"):
+        err = resp_json.get("ErrorMessage") or resp_json.get("Error")
+        return OcrResult(page_num, "ocr_error", "", "error",
+                         f"OCR.space returned error for page {page_num}: {err}")
+
+    parsed_results = resp_json.get("ParsedResults") or []
+    if not parsed_results:
+        return OcrResult(page_num, "no_parsed_results", "", "error",
+                         f"No parsed results for page {page_num} from OCR.space.")
+
+    # Usually one object per page (since we uploaded single page)
+    parsed_text = parsed_results[0].get("ParsedText", "") or ""
+    if parsed_text.strip():
+        return OcrResult(page_num, "ocr.space", parsed_text, "success",
+                         f"OCR success for page {page_num} ({len(parsed_text)} chars).")
+    return OcrResult(page_num, "ocr_empty", "", "warning",
+                     f"OCR returned empty text for page {page_num}.")
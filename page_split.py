@@ -0,0 +1,205 @@
+# page_split.py
+# Minimal single-page PDFs for per-page OCR uploads.
+#
+# PdfWriter().add_page() copies everything the page points at. Scanner and
+# merge tools often give every page one shared (or inherited) /Resources
+# dictionary listing the fonts and images of the whole document, and widget
+# or link annotations can pull in the form tree and other pages, so a
+# one-page file can carry most of the document and balloon past OCR.space's
+# 1 MB limit. split_page() keeps only the resources the page's content
+# streams name, drops what OCR never sees (thumbnails, links, piece info),
+# merges identical objects and, for pages still over a byte budget,
+# recompresses the embedded images. The page stays a vector PDF, for when
+# rendering to an image (render.py) is not wanted or poppler is missing.
+import io
+import re
+
+from PIL import Image
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject
+
+from ocr_space import single_page_pdf
+
+# Page entries OCR never needs; /Resources and /Annots are rebuilt
+DROPPED_PAGE_KEYS = ("/Resources", "/Annots", "/Thumb", "/PieceInfo", "/Metadata", "/B",
+                     "/StructParents", "/Tabs")
+
+# Resource categories whose entries are referenced by name from content streams
+RESOURCE_CATEGORIES = ("/Font", "/XObject", "/ExtGState", "/ColorSpace", "/Pattern", "/Shading",
+                       "/Properties")
+
+# Annotations that draw nothing on the page; links and replies also point at
+# other pages and objects
+DROPPED_ANNOTATIONS = ("/Link", "/Popup")
+ANNOTATION_REFERENCES = ("/P", "/Parent", "/Popup", "/IRT", "/Dest", "/A")
+
+# Recompression steps (JPEG quality, scale) tried in turn on pages over the
+# budget; images are converted to grayscale, which OCR does not need colour for
+IMAGE_STEPS = ((75, 1.0), (55, 1.0), (40, 0.75), (30, 0.5))
+
+# Content streams shorter than this are not worth a Flate filter
+MIN_COMPRESSED_CONTENT = 1024
+
+# Images smaller than this are left alone
+MIN_IMAGE_BYTES = 16 * 1024
+
+_NAME = re.compile(rb"/([^\s/\[\]()<>{}%]+)")
+_ESCAPE = re.compile(rb"#([0-9A-Fa-f]{2})")
+
+
+def used_names(content):
+    """Every /Name token in a content stream, decoded. Names inside strings
+    and inline image data are included too, which only keeps more."""
+    return {"/" + _ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]), name).decode("latin-1")
+            for name in _NAME.findall(content)}
+
+
+def _content(obj):
+    try:
+        contents = obj.get_contents() if hasattr(obj, "get_contents") else obj
+        return contents.get_data() if contents is not None else b""
+    except Exception:
+        return None
+
+
+def _pruned_resources(resources, names):
+    """Copy of `resources` holding only the entries in `names`. Forms without
+    resources of their own draw with these, so their names count as well."""
+    names = set(names)
+    xobjects = resources.get("/XObject")
+    for name, xobject in (xobjects.get_object() if xobjects is not None else {}).items():
+        xobject = xobject.get_object()
+        if name in names and xobject.get("/Subtype") == "/Form" and "/Resources" not in xobject:
+            form_names = used_names(_content(xobject) or b"")
+            names |= form_names
+    pruned = DictionaryObject()
+    dropped = 0
+    for category, entries in resources.items():
+        if category not in RESOURCE_CATEGORIES:
+            pruned[NameObject(category)] = entries
+            continue
+        entries = entries.get_object()
+        kept = DictionaryObject({NameObject(name): value for name, value in entries.items() if name in names})
+        dropped += len(entries) - len(kept)
+        if kept:
+            pruned[NameObject(category)] = kept
+    return pruned, dropped
+
+
+def _prune_forms(resources, seen):
+    """Prune the resources of the form XObjects in `resources` (writer-side
+    copies) in place, recursively; returns the entries dropped."""
+    dropped = 0
+    xobjects = resources.get("/XObject")
+    for xobject in (xobjects.get_object() if xobjects is not None else {}).values():
+        form = xobject.get_object()
+        if form.get("/Subtype") != "/Form" or id(form) in seen or "/Resources" not in form:
+            continue
+        seen.add(id(form))
+        content = _content(form)
+        if content is None:
+            continue
+        pruned, count = _pruned_resources(form["/Resources"].get_object(), used_names(content))
+        form[NameObject("/Resources")] = pruned
+        dropped += count + _prune_forms(pruned, seen)
+    return dropped
+
+
+def _write(writer):
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getbuffer()
+
+
+def _recompressible(page):
+    """(ImageFile, decoded grayscale image) for the page's large opaque
+    images; 1-bit scans (CCITT / JBIG2) are already small and stay as they are."""
+    images = []
+    for image_file in page.images:
+        obj = image_file.indirect_reference.get_object() if image_file.indirect_reference else None
+        if obj is None or len(getattr(obj, "_data", b"") or b"") < MIN_IMAGE_BYTES:
+            continue
+        if obj.get("/ImageMask") or "/SMask" in obj or "/Mask" in obj or obj.get("/BitsPerComponent", 8) == 1:
+            continue
+        try:
+            images.append((image_file, image_file.image.convert("L"), len(obj._data)))
+        except Exception:
+            continue
+    return images
+
+
+def _fit_images(writer, page, max_bytes):
+    """Recompress the page's images step by step until the file fits
+    `max_bytes` (or the steps run out); returns (payload, images replaced)."""
+    images = _recompressible(page)
+    payload = _write(writer)
+    replaced = set()
+    for quality, scale in IMAGE_STEPS:
+        if len(payload) <= max_bytes or not images:
+            break
+        for index, (image_file, original, original_size) in enumerate(images):
+            image = original
+            if scale < 1.0:
+                image = original.resize((max(1, int(original.width * scale)), max(1, int(original.height * scale))),
+                                        Image.LANCZOS)
+            encoded = io.BytesIO()
+            image.save(encoded, format="JPEG", quality=quality, optimize=True)
+            # Never replace an image with a bigger one
+            if len(encoded.getbuffer()) < original_size:
+                image_file.replace(image, quality=quality)
+                replaced.add(index)
+        payload = _write(writer)
+    return payload, len(replaced)
+
+
+def split_page(pdf_reader, page_num, max_bytes=None, measure=False):
+    """Return (payload, info): a minimal one-page PDF of `page_num` (1-based).
+
+    Only the resources named by the page's content streams (and by the forms
+    it draws) are kept, links and popups are dropped, other annotations keep
+    their appearance but lose their links to the rest of the document, and
+    identical objects are merged. With `max_bytes`, pages still over it have
+    their large images recompressed (IMAGE_STEPS). `info` holds
+    "bytes_after", "resources_dropped" and "images_recompressed", plus
+    "bytes_before" (size of the plain add_page copy) with `measure`.
+    """
+    page = pdf_reader.pages[page_num - 1]
+    info = {}
+    if measure:
+        info["bytes_before"] = len(single_page_pdf(pdf_reader, page_num))
+
+    writer = PdfWriter()
+    new_page = writer.add_page(page, excluded_keys=DROPPED_PAGE_KEYS)
+
+    content = _content(page)
+    resources = page.get("/Resources")
+    dropped = 0
+    if resources is not None:
+        resources = resources.get_object()
+        if content is None:
+            # Unreadable content stream: keep every resource
+            pruned = resources
+        else:
+            pruned, dropped = _pruned_resources(resources, used_names(content))
+        new_page[NameObject("/Resources")] = pruned.clone(writer)
+        dropped += _prune_forms(new_page["/Resources"], set())
+
+    annots = []
+    for annot in page.get("/Annots") or []:
+        annot = annot.get_object()
+        if annot.get("/Subtype") in DROPPED_ANNOTATIONS or "/AP" not in annot:
+            continue
+        clone = annot.clone(writer, ignore_fields=ANNOTATION_REFERENCES)
+        annots.append(clone.indirect_reference or writer._add_object(clone))
+    if annots:
+        new_page[NameObject("/Annots")] = ArrayObject(annots)
+
+    if content and len(content) > MIN_COMPRESSED_CONTENT:
+        new_page.compress_content_streams()
+    writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+    payload = _write(writer)
+    recompressed = 0
+    if max_bytes is not None and len(payload) > max_bytes:
+        payload, recompressed = _fit_images(writer, new_page, max_bytes)
+    info.update(bytes_after=len(payload), resources_dropped=dropped, images_recompressed=recompressed)
+    return payload, info
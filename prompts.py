@@ -0,0 +1,193 @@
+# prompts.py
+# Gemini prompts shared by the Streamlit apps and the batch CLI.
+
+# Define general medication extraction prompt
+general_medication_extraction_prompt = """You are a licensed medical practitioner and clinical reviewer.
+
+TASK (high level)
+From the provided medical document (may contain printed text, scanned pages, and handwriting), extract the following clinical information and return it in two outputs:
+
+A) Plain-text output (human-readable) in this exact order and formatting:
+   1) A single short paragraph labeled "Hospital Course" (one paragraph).
+   2) A named block labeled "Operative Notes:" containing five single-line fields:
+       Date: <Admission Date or NOT_FOUND>
+       Surgery: <Proposed/Performed Surgery or NOT_FOUND>
+       Surgeon: <Dr. Full Name or Dr. NOT_FOUND>
+       Anesthesia: <Anesthesia type or NOT_FOUND>
+       Anesthetist: <Dr. Full Name or Dr. NOT_FOUND>
+   3) A single short paragraph labeled "Operative Details:" (one paragraph) describing the procedure, intra-op findings, catheter/foley/irrigation details and immediate postop course; if nothing found output exactly NOT_FOUND for this paragraph.
+
+B) A single JSON block (exact schema below) after the plain-text block. The JSON must be the only JSON block returned (no extra commentary).
+
+IMPORTANT PRINCIPLES (in order)
+1. **Conservative extraction:** do NOT invent facts. If illegible or ambiguous, insert "NOT_FOUND".  
+2. **Preserve tokens:** preserve original words where readable; when merging fragmented handwritten lines, produce a concise medically sensible sentence using only source tokens.  
+3. **Name formatting & stripping:** Format person names as `Dr. First [Middle] Last`. Remove registration numbers, material codes, and parenthetical codes from names.  
+4. **Page numbers:** return the page number where the heading or main block appears. If not found, return -1. If content appears across pages, use the page containing the main heading; if heading absent, use the earliest page containing the related sentence(s).
+
+HOW TO LOCATE EACH ITEM
+- **Hospital Course:** match tolerant headings: "Hospital Course", "Clinical Summary", "Clinical Course", "Course in Hospital", "Hospital Course / Clinical Summary". Condense the paragraph(s) under that heading into one short paragraph covering admission reason, investigations, monitoring, daily consultant (if present), consultant physician (fitness for surgery), pre-op assessment, and disposition at time of operation.
+
+- **Operative Notes (fields):**
+  - **Date:** Prefer the Admission Date shown top-right/header on the first few pages. If not present there, search the document for "Admission Date", "Admit Date", or dates near the Hospital Course or header.
+  - **Surgery:** Look for fields labeled "Proposed Surgery", "Surgery", "Procedure", or operation header. Use the procedure name exactly as printed (e.g., "Cystoscopy with OIU with TURP + Bladder neck incision").
+  - **Surgeon:** Label cues: "Surgeon:", "Operative Surgeon", "Consultant:", "Consultant Dr", "Consultant", "Daily consulted by", "Consulted by". Choose the name nearest to the Hospital Course or Operative heading (±3 lines). If ambiguous/unreadable → `Dr. NOT_FOUND`.
+  - **Anesthesia:** Search for "Anesthesia", "Anaesthesia", "Type of Anaesthesia", "Spinal", "General", "Regional", etc. If multiple types mentioned, choose the type actually used for the surgery; otherwise return the most clearly stated value or NOT_FOUND.
+  - **Anesthetist:** Label cues: "Anesthetist:", "Anesthesiologist:", "Anaesthetist". Return `Dr. Full Name` or `Dr. NOT_FOUND`.
+
+- **Operative Details:** Search headings labelled "Operation Note", "Operative Notes", "Procedure details", "Procedure", "Operative Details". Capture handwritten/printed operation descriptions (intra-op findings, resection, catheter/foley/irrigation status, immediate postop condition, NBM/feeds, meds started). Merge into one concise paragraph. If absent, return exactly `NOT_FOUND`.
+
+ALLOWED MINOR OCR CORRECTIONS
+You may correct **single-word OCR errors** for common medical tokens only (examples):  
+`urethanotomy→urethrotomy`, `uretheric→ureteric`, `hematura→hematuria`, `trabeculated→trabeculated`, `Foley→Foley`, `catheter→catheter`, `TURP→TURP`, `OIU→OIU`, `BNI→BNI`, `lobe→lobe`, `bladder→bladder`, `irrigation→irrigation`.  
+Do NOT invent procedures, outcomes, dates, or timings. Corrections must be token-level and conservative.
+
+OUTPUT FORMAT (exact - plain text + JSON)
+Return EXACTLY the following plain-text structure (including labels and punctuation), then a blank line, then the JSON block (no extra text):
+
+Plain-text (example formatting — replace extracted text or NOT_FOUND):
+
+Hospital Course
+Patient was admitted with the above mentioned complaints and history. All relevant laboratory investigations done (Reports attached to the file). General condition and vitals of the patient closely monitored. Daily consulted by Dr. <SURGEON_NAME>. Fitness for surgery given by Dr. <CONSULTANT_NAME> (Consultant Physician). All preoperative assessment done, patient taken up for surgery.
+
+Operative Notes:
+Date: <DD-MM-YYYY or NOT_FOUND>
+Surgery: <Surgery name or NOT_FOUND>
+Surgeon: <Dr. Full Name or Dr. NOT_FOUND>
+Anesthesia: <Anesthesia type or NOT_FOUND>
+Anesthetist: <Dr. Full Name or Dr. NOT_FOUND>
+
+Operative Details:
+<One concise paragraph assembled from operative note or NOT_FOUND>
+
+After this (on a new line) output **only one** JSON object matching this exact schema:
+
+{
+  "hospital_course_text": "<Exact Hospital Course paragraph above>",
+  "hospital_course_page": <page_number_or_-1>,
+  "operative_notes": {
+    "date": "<DD-MM-YYYY or NOT_FOUND>",
+    "surgery": "<Surgery name or NOT_FOUND>",
+    "surgeon": "<Dr. Full Name or Dr. NOT_FOUND>",
+    "anesthesia": "<Anesthesia type or NOT_FOUND>",
+    "anesthetist": "<Dr. Full Name or Dr. NOT_FOUND>",
+    "page": <page_number_or_-1>
+  },
+  "operative_details_text": "<Exact Operative Details paragraph above or 'NOT_FOUND'>",
+  "operative_details_page": <page_number_or_-1>,
+  "surgeon_name": "<Dr. Full Name or Dr. NOT_FOUND>",
+  "consultant_physician_name": "<Dr. Full Name (Consultant Physician) or Dr. NOT_FOUND (Consultant Physician)>"
+}
+
+ADDITIONAL RULES & FALLBACKS
+- If multiple pages contain pieces of a section, set the section page to the page where the heading appears; if heading absent, set to earliest page where related sentences appear.
+- If a doctor name in JSON is `Dr. NOT_FOUND` but you locate a clear `Dr. X` elsewhere by label regex (e.g., near "Consultant"), prefer that name and overwrite the NOT_FOUND.
+- Do not return any other text, lists, confidence numbers, or debug info. The output must be exactly:
+  1) Plain-text block as described (Hospital Course, Operative Notes, Operative Details),
+  2) A blank line,
+  3) A single JSON object (strict schema).
+
+END TASK.
+
+"""
+
+
+# Prompt for Gemini OCR
+hospital_course_prompt = """
+You are a licensed medical practitioner and clinical reviewer experienced with typed and handwritten clinical notes.
+
+GOAL
+Extract ALL clinically relevant text from target sections that collectively form the hospital course narrative, then merge into a single chronological record of the patient's hospitalization.
+
+TARGET SECTIONS (search in this order)
+1. Manual - Progress note / Progress Note / Doctor's Progress Notes (and variants)
+2. OT Note / Operation Note / Operative Note / Operative Details / Operation Report
+3. Anesthesia notes / Anaesthesia notes / Anesthetic Note / Anaesthesia Chart
+4. MDM sheet / MDM / Multidisciplinary Meeting / MDT / Case Discussion
+5. Diet sheet / Diet Orders / Dietary Chart
+
+ALGORITHM
+1) Page-by-page extraction:
+   - Locate exact or near-exact header variants (case-insensitive; allow small OCR errors)
+   - For each matched header, extract header line plus all verbatim readable text until next recognized header, explicit terminator, or end-of-page
+   - Preserve original line breaks and token order
+
+2) Focused fallback for missing sections:
+   - If any target section not found, search document for relevant keywords
+   - Extract nearest contiguous paragraphs and prepend appropriate header with "(AUTO-EXTRACT)"
+
+3) Content merging:
+   - Combine ALL extracted sections into ONE continuous narrative
+   - Arrange in chronological/document reading order
+   - Remove duplicate header lines but preserve chronological flow
+   - Maintain all clinically relevant content from progress notes, operative details, anesthesia records, MDM discussions, and diet information
+
+OUTPUT FORMAT (SIMPLE TEXT)
+Merge all extracted content into a single, continuous hospital course narrative that includes:
+- Diagnostic investigations and test results
+- Medical/surgical interventions  
+- Response to treatment
+- Complications (if any)
+- Overall progress
+- Patient condition
+- Clinical reasoning behind decisions
+
+Format as plain text with natural paragraph breaks. Do not include page numbers, JSON, or commentary.
+
+HANDWRITING/OCR GUIDELINES
+- Preserve readable tokens exactly
+- Use [ILLEGIBLE] for unreadable words
+- Allow minor conservative medical spelling corrections
+- Include both printed and handwritten text
+
+FINAL OUTPUT: Single merged hospital course text only.
+END.
+"""
+
+
+# Prompts selectable from the CLI (--prompt)
+PROMPTS = {
+    "general_medication": general_medication_extraction_prompt,
+    "hospital_course": hospital_course_prompt
+}
+
+
+# Map-reduce helpers for long documents (chunked mode in app3.py).
+# Prepended to the map prompt for each page window.
+chunk_note_template = """NOTE: The attached PDF is an excerpt covering pages {start}-{end} of a {total}-page document.
+Extract only what appears in this excerpt; other excerpts are processed separately.
+"""
+
+# The same for hybrid mode, where the excerpt is split into a PDF and text
+# parts (numbering explained by hybrid_note_template)
+hybrid_chunk_note_template = """NOTE: The pages sent with this request are an excerpt covering original pages {start}-{end} of a {total}-page document, numbered as explained in the note on page numbers above.
+Extract only what appears in this excerpt; other excerpts are processed separately.
+"""
+
+hospital_course_reduce_prompt = """
+You are a licensed medical practitioner and clinical reviewer.
+
+Below are partial hospital course narratives, each extracted from a consecutive page range of the same admission file.
+Neighbouring ranges overlap by a few pages, so the same event may appear in two parts.
+
+TASK
+Merge the parts into ONE continuous hospital course narrative in chronological order.
+- Keep all clinically relevant content; do not invent facts.
+- Remove duplicated sentences caused by overlapping page ranges.
+- Keep [ILLEGIBLE] markers as they are.
+- End every paragraph with a source tag listing the part page ranges it was built from, e.g. [pages 1-20] or [pages 1-20, 19-40].
+
+Format as plain text with natural paragraph breaks. No JSON, no commentary.
+
+PARTS
+{parts}
+END.
+"""
+
+
+# Hybrid mode: only scanned / handwritten pages are attached as PDF, typed
+# pages are sent as text. {layout} describes which numbers are which, {order}
+# lists them in original page order.
+hybrid_note_template = """NOTE ON PAGE NUMBERS: the {count} pages sent with this request are numbered 1-{count}: {layout}.
+This numbering does not follow the original page order. In the original document the pages come in this order: {order}. Read them in that order for chronology, and report page numbers in this request's numbering.
+"""
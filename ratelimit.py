@@ -0,0 +1,249 @@
+# ratelimit.py
+# Shared rate limiters used when several worker threads talk to the same API,
+# and the retry backoff policy for throttled / transient failures.
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Token-bucket limiter with an additional cap on in-flight requests.
+
+    `rate` tokens are added per second up to `burst`; every request consumes
+    one token. `max_in_flight` bounds how many requests may be outstanding at
+    the same time. Use as a context manager around a single request:
+
+        with bucket:
+            requests.post(...)
+    """
+
+    def __init__(self, rate, burst=1, max_in_flight=1):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                self._refill()
+                if self._in_flight < self.max_in_flight and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self._in_flight += 1
+                    return
+                if self._in_flight >= self.max_in_flight:
+                    # wait for a slot to be released
+                    self._cond.wait()
+                else:
+                    # wait until the next token is due
+                    self._cond.wait((1.0 - self._tokens) / self.rate)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, outcome, latency=None, retry_after=None):
+        """Feedback hook shared with AdaptiveLimiter; fixed limits ignore it."""
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class AdaptiveLimiter:
+    """Request-rate and in-flight limiter that finds the provider's ceiling
+    by itself (AIMD on the request rate).
+
+    The rate starts at `initial_rate` requests per second. While responses
+    come back clean it grows once per `interval` seconds (or per average
+    round trip, if longer): doubling until the first throttled response
+    (slow start), then by `increase` x the rate that was last throttled, up
+    to `max_rate` if given. It only grows while requests are actually
+    waiting on it. A throttled response (429 / quota message) multiplies
+    the rate by `decrease` and pauses every worker for the Retry-After hint
+    or, without one, `pause` seconds; throttled responses to requests sent
+    before that decrease count once. When the recent average latency stays
+    above `latency_tolerance` x a slow moving average of past windows (so
+    jitter and gradual drift do not count) for `latency_windows` windows
+    in a row, the rate is trimmed by 10%.
+
+    Concurrency follows the rate (Little's law): rate x average latency with
+    50% headroom, between `min_in_flight` and `max_in_flight`;
+    `initial_in_flight` until the first response.
+
+    Same acquire()/release()/context-manager interface as TokenBucket;
+    callers report each response with record().
+    """
+
+    def __init__(self, max_in_flight=16, initial_in_flight=2, min_in_flight=1, initial_rate=2.0,
+                 max_rate=None, min_rate=0.1, interval=1.0, increase=0.05, decrease=0.7, pause=0.5,
+                 latency_tolerance=2.0, latency_windows=3):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.min_in_flight = max(1, min(int(min_in_flight), self.max_in_flight))
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.interval = interval
+        self.increase = increase
+        self.decrease = decrease
+        self.pause = pause
+        self.latency_tolerance = latency_tolerance
+        self.latency_windows = max(1, int(latency_windows))
+        self._rate = self._bounded(initial_rate)
+        self._initial_limit = min(max(int(initial_in_flight), self.min_in_flight), self.max_in_flight)
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._in_flight = 0
+        self._resume_at = 0.0
+        self._last_decrease = 0.0
+        self._window_started = self._last
+        self._ceiling = None
+        self._rate_bound = False
+        self._avg_latency = None
+        self._base_latency = None
+        self._slow_windows = 0
+        self.peak_limit = self._initial_limit
+        self.peak_rate = self._rate
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def _bounded(self, rate):
+        rate = max(self.min_rate, rate)
+        return min(self.max_rate, rate) if self.max_rate else rate
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def limit(self):
+        if self._avg_latency is None:
+            return self._initial_limit
+        wanted = int(self._rate * self._avg_latency * 1.5) + 1
+        return min(self.max_in_flight, max(self.min_in_flight, wanted))
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(1.0, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                pause = self._resume_at - now
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= self.limit:
+                    self._cond.wait()
+                elif self._tokens < 1.0:
+                    # The rate, not the provider, is what holds requests back
+                    self._rate_bound = True
+                    self._cond.wait((1.0 - self._tokens) / self._rate)
+                else:
+                    self._tokens -= 1.0
+                    self._in_flight += 1
+                    self.peak_limit = max(self.peak_limit, self.limit)
+                    return
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, outcome, latency=None, retry_after=None):
+        """Adjust the rate after one response.
+
+        outcome: "ok", "throttled", or anything else (transient / permanent
+        errors say nothing about load and leave the rate alone). `latency`
+        is the request's round trip in seconds.
+        """
+        with self._cond:
+            now = time.monotonic()
+            sent = now - (latency or 0.0)
+            if outcome == "throttled":
+                self.throttled += 1
+                if retry_after:
+                    self._resume_at = max(self._resume_at, now + retry_after)
+                if sent >= self._last_decrease:
+                    self._ceiling = self._rate
+                    self._slow(now, self.decrease)
+                    if not retry_after:
+                        self._resume_at = max(self._resume_at, now + self.pause)
+            elif outcome == "ok" and latency is not None:
+                if self._avg_latency is None:
+                    self._avg_latency = self._base_latency = latency
+                self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+                if sent >= self._last_decrease and \
+                        now - self._window_started >= max(self.interval, self._avg_latency):
+                    # One decision per window; the baseline follows the
+                    # window averages slowly, so a lasting shift is
+                    # absorbed after a trim or two
+                    rising = self._avg_latency > self.latency_tolerance * self._base_latency
+                    self._base_latency = 0.9 * self._base_latency + 0.1 * self._avg_latency
+                    if rising:
+                        self._slow_windows += 1
+                        self._window_started = now
+                        if self._slow_windows >= self.latency_windows:
+                            self._slow(now, 0.9)
+                    elif self._rate_bound:
+                        self._slow_windows = 0
+                        if self._ceiling is None:
+                            self._rate = self._bounded(self._rate * 2)
+                        else:
+                            self._rate = self._bounded(self._rate + self.increase * self._ceiling)
+                        self.peak_rate = max(self.peak_rate, self._rate)
+                        self._window_started = now
+                        self._rate_bound = False
+                    else:
+                        self._slow_windows = 0
+            self._cond.notify_all()
+
+    def _slow(self, now, factor):
+        self._rate = self._bounded(self._rate * factor)
+        self._last_decrease = self._window_started = now
+        self._rate_bound = False
+        self._slow_windows = 0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter.
+
+    Attempt n (1-based) waits a uniform random time in
+    [0, min(max_delay, base_delay * 2**(n-1))], or at least the server's
+    Retry-After when one was given. Failed attempts count against
+    `max_attempts`; throttled ones do not, they are retried until the
+    request has been throttled for `throttle_timeout` seconds.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, seed=None, throttle_timeout=600.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.throttle_timeout = throttle_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+
+    def delay(self, attempt, retry_after=None):
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after:
+            delay = max(delay, min(self.max_delay, retry_after))
+        return delay
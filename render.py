@@ -0,0 +1,123 @@
+# render.py
+# Render scan pages to grayscale images and compress them under a byte budget
+# before upload. Smaller payloads upload faster and avoid OCR.space's 1 MB
+# free-plan rejections. Requires poppler (used by pdf2image).
+import io
+import os
+import tempfile
+import time
+
+from pdf2image import convert_from_bytes, convert_from_path
+from PIL import Image
+
+DEFAULT_DPI = 200
+DEFAULT_MAX_BYTES = 900 * 1024
+
+# Low-resolution page thumbnails (dedup / triage) and the longest page run
+# rendered by one poppler call, which bounds the images held at once
+THUMBNAIL_DPI = 24
+THUMBNAIL_RUN = 64
+
+# JPEG quality search range and the downscale step used when even the lowest
+# quality is over budget
+MIN_QUALITY = 30
+MAX_QUALITY = 90
+DOWNSCALE_STEP = 0.75
+MIN_LONG_SIDE = 800
+
+
+def _encode(image, fmt, quality=None):
+    out = io.BytesIO()
+    if fmt == "PNG":
+        image.save(out, format="PNG", optimize=True)
+    else:
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def _best_jpeg(image, max_bytes):
+    """Highest JPEG quality that fits `max_bytes`, or None."""
+    lo, hi, best = MIN_QUALITY, MAX_QUALITY, None
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = _encode(image, "JPEG", quality)
+        if len(data) <= max_bytes:
+            best = (data, quality)
+            lo = quality + 1
+        else:
+            hi = quality - 1
+    return best
+
+
+def compress_image(image, max_bytes=DEFAULT_MAX_BYTES):
+    """Encode `image` as PNG or JPEG, whichever fits the budget at best quality.
+
+    Returns (data, fmt, quality, size); quality is None for PNG. If nothing fits at
+    the current size the image is downscaled until it does (or gets too small,
+    in which case the smallest encoding is returned anyway).
+    """
+    while True:
+        # Lossless wins if it already fits (clean black-on-white scans often do)
+        png = _encode(image, "PNG")
+        if len(png) <= max_bytes:
+            return png, "PNG", None, image.size
+
+        best = _best_jpeg(image, max_bytes)
+        if best is not None:
+            return best[0], "JPEG", best[1], image.size
+
+        width, height = image.size
+        if max(width, height) * DOWNSCALE_STEP < MIN_LONG_SIDE:
+            return _encode(image, "JPEG", MIN_QUALITY), "JPEG", MIN_QUALITY, image.size
+        image = image.resize((int(width * DOWNSCALE_STEP), int(height * DOWNSCALE_STEP)),
+                             Image.LANCZOS)
+
+
+def render_page(single_page_pdf, dpi=DEFAULT_DPI, max_bytes=DEFAULT_MAX_BYTES, grayscale=True):
+    """Render a one-page PDF and compress it for upload.
+
+    Returns (data, filename_ext, info) where info holds the chosen format,
+    quality, pixel size and render seconds. Runs in a worker process.
+    """
+    started = time.perf_counter()
+    images = convert_from_bytes(single_page_pdf, dpi=dpi, grayscale=grayscale)
+    image = images[0]
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+    data, fmt, quality, size = compress_image(image, max_bytes=max_bytes)
+    ext = "png" if fmt == "PNG" else "jpg"
+    return data, ext, {"format": fmt, "quality": quality, "size": size,
+                       "seconds": time.perf_counter() - started}
+
+
+def _page_runs(page_nums, max_run):
+    """Split sorted page numbers into (first, last) runs of consecutive pages."""
+    runs = []
+    for n in sorted(page_nums):
+        if runs and n == runs[-1][1] + 1 and n - runs[-1][0] < max_run:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+    return runs
+
+
+def render_thumbnails(pdf_source, page_nums, dpi=THUMBNAIL_DPI, thread_count=4):
+    """Yield (page_num, grayscale PIL image) for `page_nums` in page order.
+
+    `pdf_source` is the PDF bytes or a file path (large-file mode). Runs of
+    consecutive pages are rendered by one poppler call each instead of one
+    process per page; bytes are written to a temp file once for all runs.
+    """
+    if not isinstance(pdf_source, str):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(pdf_source)
+        try:
+            yield from render_thumbnails(f.name, page_nums, dpi, thread_count)
+        finally:
+            os.unlink(f.name)
+        return
+    for first, last in _page_runs(page_nums, THUMBNAIL_RUN):
+        images = convert_from_path(pdf_source, dpi=dpi, first_page=first, last_page=last,
+                                   grayscale=True, thread_count=thread_count)
+        for page_num, image in zip(range(first, last + 1), images):
+            yield page_num, image if image.mode == "L" else image.convert("L")
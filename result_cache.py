@@ -0,0 +1,100 @@
+# result_cache.py
+# Persistent, content-addressed cache for OCR.space and Gemini results.
+#
+# Streamlit reruns the whole script on every widget change, so without this
+# every rerun re-uploads the same pages / PDF to the APIs.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "PDF_OCR_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "pdf-ocr")
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def ocr_key(payload, params):
+    """Key for one OCR.space request: single-page payload + engine params."""
+    engine = {k: params.get(k) for k in ("language", "OCREngine", "detectOrientation")}
+    return "ocr:" + sha256_hex(payload) + ":" + json.dumps(engine, sort_keys=True)
+
+
+def gemini_key(pdf_bytes, model, prompt):
+    """Key for one Gemini request: whole PDF + model + prompt text."""
+    prompt_hash = sha256_hex(prompt.encode("utf-8"))
+    return f"gemini:{sha256_hex(pdf_bytes)}:{model}:{prompt_hash}"
+
+
+class ResultCache:
+    """SQLite-backed key/value store with total-size LRU eviction.
+
+    Values are JSON-serialisable objects. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "results.sqlite3")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # timeout: several CLI worker processes may share one cache file
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        encoded = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, encoded, len(encoded), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM results ORDER BY last_access ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,140 @@
+# scheduler.py
+# Pipelined extraction of several documents at once.
+#
+# Run one after another, documents leave the CPU idle while pages wait on the
+# OCR API and the network idle while the next file is parsed and classified.
+# DocumentScheduler keeps `max_documents` documents in flight: while the
+# pages of one document are being OCRed, the next one is opened, classified
+# (and triaged / deduplicated) on a CPU slot. Global limits hold across all of
+# them: at most `cpu_slots` documents in their CPU stage (each using up to
+# `classify_workers` processes), and one shared pool of `upload_workers`
+# threads and one limiter (its max_in_flight) for all OCR requests.
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from extraction import extract_pdf_pages
+
+_DONE = object()
+
+
+class DocumentScheduler:
+    """Extract several PDFs with CPU and network stages overlapped.
+
+        scheduler = DocumentScheduler(max_documents=2, upload_workers=4)
+        for name, record in scheduler.run([("a.pdf", pdf_bytes, None)], api_key):
+            ...
+        scheduler.summary()
+
+    `stats` holds per-document timings keyed by name: "pages", "ocr_pages",
+    "queued_seconds" (waiting for a CPU slot), "cpu_seconds", "seconds"
+    (document start to last page) and "pages_per_second".
+    """
+
+    def __init__(self, max_documents=2, cpu_slots=1, upload_workers=4):
+        self.max_documents = max_documents
+        self.upload_workers = upload_workers
+        self._cpu = threading.Semaphore(cpu_slots)
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.started = None
+        self.finished = None
+
+    @contextmanager
+    def _cpu_stage(self, name):
+        waiting = time.perf_counter()
+        with self._cpu:
+            started = time.perf_counter()
+            self._update(name, queued_seconds=started - waiting)
+            try:
+                yield
+            finally:
+                self._update(name, cpu_seconds=time.perf_counter() - started)
+
+    def _update(self, name, **values):
+        with self._lock:
+            self.stats.setdefault(name, {"pages": 0, "ocr_pages": 0}).update(values)
+
+    def _count(self, name, record):
+        with self._lock:
+            stats = self.stats.setdefault(name, {"pages": 0, "ocr_pages": 0})
+            stats["pages"] += 1
+            if record.get("method") not in ("digital", "blank"):
+                stats["ocr_pages"] += 1
+            stats["finished"] = time.perf_counter()
+
+    def run(self, documents, api_key, limiter=None, cache=None, engine=None, document_options=None,
+            **options):
+        """Yield (name, page record) for every page of `documents`, a list of
+        (name, pdf_bytes, pdf_path) with one of the two set, as pages finish.
+
+        Records are those of extraction.extract_pdf_pages; `options` are
+        passed on to it (classify_workers, render_options, retry, dedup,
+        triage, ...). A failed document yields one record with method
+        "failed". `limiter` and `engine` are shared by all documents;
+        `document_options` ({name: options}) adds options for one document,
+        e.g. its own `stats` or `upload_sizes` dict. Closing the generator
+        stops the run at once: only requests already in flight complete.
+        """
+        records = queue.Queue()
+        stop = threading.Event()
+        self.started = time.perf_counter()
+
+        def process(name, pdf_bytes, pdf_path):
+            self._update(name, started=time.perf_counter())
+            try:
+                for record in extract_pdf_pages(pdf_bytes, api_key, limiter=limiter, cache=cache,
+                                                max_workers=self.upload_workers, engine=engine,
+                                                pdf_path=pdf_path, executor=uploads,
+                                                cpu_slot=self._cpu_stage(name), stop=stop, **options,
+                                                **(document_options or {}).get(name, {})):
+                    if stop.is_set():
+                        break
+                    self._count(name, record)
+                    records.put((name, record))
+            except Exception as e:
+                records.put((name, {"page": None, "method": "failed", "text": "", "error": str(e)}))
+            finally:
+                with self._lock:
+                    stats = self.stats[name]
+                    stats["finished"] = time.perf_counter()
+                    stats["seconds"] = stats["finished"] - stats["started"]
+                    stats["pages_per_second"] = stats["pages"] / stats["seconds"] if stats["seconds"] else None
+                records.put((name, _DONE))
+
+        uploads = ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="uploads")
+        docs = ThreadPoolExecutor(max_workers=self.max_documents, thread_name_prefix="document")
+        try:
+            for name, pdf_bytes, pdf_path in documents:
+                docs.submit(process, name, pdf_bytes, pdf_path)
+            remaining = len(documents)
+            while remaining:
+                name, record = records.get()
+                if record is _DONE:
+                    remaining -= 1
+                else:
+                    yield name, record
+        finally:
+            # Closing the generator early (e.g. a Streamlit rerun or Stop)
+            # must not wait for, or keep paying for, the remaining pages:
+            # documents not started and uploads not sent are dropped, and
+            # only requests already in flight finish in the background
+            stop.set()
+            docs.shutdown(wait=False, cancel_futures=True)
+            uploads.shutdown(wait=False, cancel_futures=True)
+            self.finished = time.perf_counter()
+
+    def summary(self):
+        """Aggregate throughput: documents, pages, wall seconds, pages per
+        second and overlap (summed per-document time / wall time)."""
+        end = self.finished or time.perf_counter()
+        wall = end - self.started if self.started is not None else 0.0
+        with self._lock:
+            pages = sum(s["pages"] for s in self.stats.values())
+            busy = sum(s.get("seconds") or 0.0 for s in self.stats.values())
+            documents = len(self.stats)
+        return {"documents": documents, "pages": pages, "seconds": wall,
+                "pages_per_second": pages / wall if wall else None,
+                "overlap": busy / wall if wall else None}
@@ -0,0 +1,125 @@
+# telemetry.py
+# Structured timing spans for the extraction stages (PDF open, classify,
+# single-page write, upload, API wait, JSON decode, Gemini calls), with
+# per-page timeline, JSON and Prometheus text exports.
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Span:
+    __slots__ = ("stage", "page", "start", "duration", "bytes_in", "bytes_out", "outcome")
+
+    def __init__(self, stage, page=None, start=None, duration=0.0, bytes_in=0, bytes_out=0, outcome="ok"):
+        self.stage = stage
+        self.page = page
+        self.start = start
+        self.duration = duration
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.outcome = outcome
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Tracer:
+    """Thread-safe collector of Spans for one extraction run.
+
+        with tracer.span("single_page_write", page=3) as span:
+            payload = single_page_pdf(reader, 3)
+            span.bytes_out = len(payload)
+
+    A span whose block raises gets outcome "error"; callers may set any other
+    outcome (e.g. "cached", "throttled") on the span themselves.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, page=None, bytes_in=0):
+        span = Span(stage, page=page, start=time.perf_counter() - self.origin, bytes_in=bytes_in)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.outcome = "error"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            with self._lock:
+                self._spans.append(span)
+
+    def add(self, stage, duration, page=None, bytes_in=0, bytes_out=0, outcome="ok", start=None):
+        """Record a span measured elsewhere (e.g. in a worker process)."""
+        if start is None:
+            start = time.perf_counter() - self.origin - duration
+        with self._lock:
+            self._spans.append(Span(stage, page, start, duration, bytes_in, bytes_out, outcome))
+
+    @property
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def stage_totals(self):
+        """{stage: {"count", "seconds", "max_seconds", "bytes_in", "bytes_out", "outcomes"}}"""
+        totals = {}
+        for span in self.spans:
+            t = totals.setdefault(span.stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                               "bytes_in": 0, "bytes_out": 0, "outcomes": {}})
+            t["count"] += 1
+            t["seconds"] += span.duration
+            t["max_seconds"] = max(t["max_seconds"], span.duration)
+            t["bytes_in"] += span.bytes_in
+            t["bytes_out"] += span.bytes_out
+            t["outcomes"][span.outcome] = t["outcomes"].get(span.outcome, 0) + 1
+        return totals
+
+    def timeline(self, methods=None):
+        """One row per page with the milliseconds spent in each stage."""
+        rows = {}
+        for span in self.spans:
+            if span.page is None:
+                continue
+            row = rows.setdefault(span.page, {"page": span.page})
+            row[f"{span.stage}_ms"] = row.get(f"{span.stage}_ms", 0.0) + span.duration * 1000
+            row["bytes_out"] = row.get("bytes_out", 0) + span.bytes_out
+            if span.outcome != "ok":
+                row["outcome"] = span.outcome
+        if methods:
+            for page, row in rows.items():
+                row["method"] = methods.get(page)
+        return [rows[page] for page in sorted(rows)]
+
+    def to_json(self):
+        return json.dumps({"spans": [s.to_dict() for s in self.spans],
+                           "stages": self.stage_totals()}, indent=2)
+
+    def to_prometheus(self, prefix="pdf_extract"):
+        """Prometheus text exposition of per-stage totals."""
+        totals = self.stage_totals()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+
+        metric("stage_seconds_total", "counter", "Total seconds spent per stage.",
+               [({"stage": s}, round(t["seconds"], 6)) for s, t in totals.items()])
+        metric("stage_seconds_max", "gauge", "Longest single span per stage.",
+               [({"stage": s}, round(t["max_seconds"], 6)) for s, t in totals.items()])
+        metric("stage_spans_total", "counter", "Spans per stage and outcome.",
+               [({"stage": s, "outcome": o}, n) for s, t in totals.items() for o, n in t["outcomes"].items()])
+        metric("stage_bytes_in_total", "counter", "Bytes consumed per stage.",
+               [({"stage": s}, t["bytes_in"]) for s, t in totals.items()])
+        metric("stage_bytes_out_total", "counter", "Bytes produced per stage.",
+               [({"stage": s}, t["bytes_out"]) for s, t in totals.items()])
+        return "\n".join(lines) + "\n"
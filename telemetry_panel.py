@@ -0,0 +1,23 @@
+# telemetry_panel.py
+# Streamlit side of telemetry.py: the "Stage timings" expander shared by the
+# apps, with per-stage totals, an optional per-page timeline and the JSON /
+# Prometheus exports.
+import json
+
+import streamlit as st
+
+
+def show_stage_timings(tracer, methods=None):
+    """Stage totals of `tracer`; with `methods` ({page: method}) of a single
+    document, its per-page timeline too (spans carry page numbers only)."""
+    with st.expander("Stage timings" + (" and per-page timeline" if methods is not None else "")):
+        st.dataframe([dict(stage=stage, **{k: v for k, v in t.items() if k != "outcomes"},
+                           outcomes=json.dumps(t["outcomes"]))
+                      for stage, t in tracer.stage_totals().items()])
+        if methods is not None:
+            st.dataframe(tracer.timeline(methods))
+        col_json, col_prom = st.columns(2)
+        col_json.download_button("Export spans (JSON)", tracer.to_json(), "extraction_spans.json",
+                                 mime="application/json")
+        col_prom.download_button("Export metrics (Prometheus)", tracer.to_prometheus(), "extraction_metrics.prom",
+                                 mime="text/plain")
@@ -0,0 +1,241 @@
+# transport.py
+# HTTP transport for the OCR.space client.
+#
+# Transport keeps one requests.Session with a bounded keep-alive connection
+# pool, so page uploads after the first reuse an open TCP/TLS connection
+# instead of paying a fresh handshake each. KeyPool spreads requests over
+# several API keys: each key has its own request rate, in-flight cap and
+# quota, every request goes to the key with the most headroom, and a key
+# that keeps failing is benched for a while.
+import re
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+
+# Consecutive key-level failures (throttling, rejected key) before a key is
+# benched, and for how long
+BENCH_AFTER = 3
+BENCH_SECONDS = 60.0
+
+# Keys are separated by commas, semicolons or whitespace
+_KEY_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+class Transport:
+    """Pooled keep-alive HTTP session shared by all worker threads.
+
+    `pool_size` bounds the open connections per host (extra requests wait
+    for a free one). With keep_alive=False every request opens its own
+    connection, as a bare requests.post does.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, keep_alive=True):
+        self.pool_size = max(1, int(pool_size))
+        self.timeout = (connect_timeout, read_timeout)
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, prepared, timeout=None):
+        """Send a requests.PreparedRequest; `timeout` defaults to the
+        transport's (connect, read) timeouts."""
+        timeout = timeout if timeout is not None else self.timeout
+        if not self.keep_alive:
+            with requests.Session() as session:
+                return session.send(prepared, timeout=timeout)
+        return self.session.send(prepared, timeout=timeout)
+
+    def post(self, url, timeout=None, **kwargs):
+        return self.send(self.session.prepare_request(requests.Request("POST", url, **kwargs)), timeout)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def default_transport():
+    """The process-wide Transport used when none is passed."""
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
+
+
+def parse_keys(text):
+    """API keys from a comma / semicolon / whitespace separated string."""
+    return [key for key in _KEY_SEPARATORS.split(text or "") if key]
+
+
+def mask_key(key):
+    return f"…{key[-4:]}" if len(key) > 4 else "…"
+
+
+class _KeyState:
+    def __init__(self, key, rate):
+        self.key = key
+        self.tokens = 1.0
+        self.last = time.monotonic()
+        self.rate = rate
+        self.in_flight = 0
+        self.window = deque()
+        self.sent = 0
+        self.ok = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.benched_until = 0.0
+        self.benched = 0
+        self.resume_at = 0.0
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(1.0, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+class KeyPool:
+    """Requests sharded over several API keys.
+
+        pool = KeyPool(["key-a", "key-b"], rate=2.0, quota=500)
+        key = pool.acquire()
+        try:
+            ...  # one request with `key`
+            pool.record(key, "ok")
+        finally:
+            pool.release(key)
+
+    Per key: at most `rate` requests per second and `max_in_flight` at
+    once, and `quota` requests per `quota_window` seconds (None = no
+    limit). acquire() waits for the key with the most headroom (fewest
+    requests in flight, then fewest recent failures, most unused quota and
+    fewest requests sent) and returns None only when every key has used up
+    its quota. After `bench_after` consecutive failures
+    reported through record() a key is skipped for `bench_seconds`.
+    """
+
+    def __init__(self, keys, rate=None, max_in_flight=None, quota=None, quota_window=86400.0,
+                 bench_after=BENCH_AFTER, bench_seconds=BENCH_SECONDS):
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            raise ValueError("KeyPool needs at least one API key")
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.quota = quota
+        self.quota_window = quota_window
+        self.bench_after = bench_after
+        self.bench_seconds = bench_seconds
+        self._states = {key: _KeyState(key, rate) for key in keys}
+        self._cond = threading.Condition()
+
+    @property
+    def keys(self):
+        return list(self._states)
+
+    def _quota_left(self, state, now):
+        if self.quota is None:
+            return float("inf")
+        while state.window and now - state.window[0] >= self.quota_window:
+            state.window.popleft()
+        return self.quota - len(state.window)
+
+    def _ready_at(self, state, now):
+        """Monotonic time at which `state` can take a request (now if it
+        can), or None if it is waiting for a slot or its quota is used up."""
+        if self._quota_left(state, now) <= 0:
+            return None
+        if self.max_in_flight is not None and state.in_flight >= self.max_in_flight:
+            return None
+        state.refill(now)
+        token_due = now + (1.0 - state.tokens) / state.rate if state.rate and state.tokens < 1.0 else now
+        return max(now, state.benched_until, state.resume_at, token_due)
+
+    def acquire(self):
+        """Reserve a request on the key with the most headroom and return it;
+        None if every key's quota is used up."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready = [(state, self._ready_at(state, now)) for state in self._states.values()]
+                if all(self._quota_left(state, now) <= 0 for state in self._states.values()):
+                    return None
+                free = [state for state, at in ready if at is not None and at <= now]
+                if free:
+                    state = max(free, key=lambda s: (-s.in_flight, -s.consecutive_errors,
+                                                     self._quota_left(s, now), s.tokens, -s.sent))
+                    if state.rate:
+                        state.tokens -= 1.0
+                    state.in_flight += 1
+                    state.sent += 1
+                    if self.quota is not None:
+                        state.window.append(now)
+                    return state.key
+                waits = [at - now for _, at in ready if at is not None]
+                # No key is ready: wait for the next token / bench end, or a release
+                self._cond.wait(min(waits) if waits else None)
+
+    def release(self, key):
+        with self._cond:
+            self._states[key].in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, key, outcome, retry_after=None):
+        """Report a response: "ok" (or None), "throttled" or "rejected" (the
+        key itself was refused). Only key-level failures belong here; a
+        page the API rejects is "ok"."""
+        with self._cond:
+            state = self._states[key]
+            now = time.monotonic()
+            if outcome in (None, "ok"):
+                state.ok += 1
+                state.consecutive_errors = 0
+                return
+            state.errors += 1
+            state.consecutive_errors += 1
+            if retry_after:
+                state.resume_at = max(state.resume_at, now + retry_after)
+            if state.consecutive_errors >= self.bench_after:
+                state.benched_until = now + self.bench_seconds
+                state.benched += 1
+                state.consecutive_errors = 0
+            self._cond.notify_all()
+
+    def stats(self):
+        """One row per key (masked) with requests sent, successes, errors,
+        in-flight requests, quota left, times benched and whether it is
+        benched now."""
+        with self._cond:
+            now = time.monotonic()
+            return [{"key": mask_key(state.key), "sent": state.sent, "ok": state.ok,
+                     "errors": state.errors, "in_flight": state.in_flight,
+                     "quota_left": None if self.quota is None else self._quota_left(state, now),
+                     "benched": state.benched, "benched_now": state.benched_until > now}
+                    for state in self._states.values()]
+
+
+def key_source(text, **options):
+    """A KeyPool over the keys in `text` (`options` are passed to KeyPool),
+    or the plain key string when there is one key and no per-key limits."""
+    keys = parse_keys(text)
+    if len(keys) > 1 or (keys and any(value is not None for value in options.values())):
+        return KeyPool(keys, **options)
+    return keys[0] if keys else text
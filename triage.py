@@ -0,0 +1,200 @@
+# triage.py
+# Blank-page and text-density triage on rendered thumbnails.
+#
+# The digital / needs_ocr split only asks whether pypdf finds any text. Blank
+# separator pages are then sent to OCR for nothing, and scans that carry a
+# small digital header (a stamped patient label, a fax banner) count as
+# digital and are never OCRed. Triage renders low-DPI thumbnails, measures
+# ink with NumPy over whole batches of pages at once and:
+#   - labels scan pages without ink "blank" (not OCRed): thin pen lines and
+#     small type almost vanish at thumbnail size, so pages that look blank
+#     there are rendered again at BLANK_CHECK_DPI and skipped only if that
+#     render has next to no ink either;
+#   - sends digital pages whose text covers only a small share of the inked
+#     area back to OCR.
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from classify import image_coverage
+from large_file import release_object_cache
+from render import render_thumbnails
+
+# Thumbnails are resized to this (width, height) so a batch stacks into one
+# array; MARGIN pixels are cut from every edge (scanner borders, punch
+# holes) and ink is counted in BLOCK x BLOCK cells: 15 x 20 cells per page
+TRIAGE_SIZE = (136, 176)
+MARGIN = 8
+BLOCK = 8
+
+# A pixel is ink when it is this many grey levels darker than the page's
+# paper colour (its 90th percentile brightness)
+INK_CONTRAST = 48
+
+# Scan pages with less inked thumbnail area than this are blank candidates;
+# a candidate is blank only if its render at BLANK_CHECK_DPI has at most
+# BLANK_MAX_INK_PIXELS ink pixels (dust and scanner specks, not a pen line)
+BLANK_COVERAGE = 0.002
+BLANK_CHECK_DPI = 100
+BLANK_MAX_INK_PIXELS = 40
+
+# Digital pages with images, at least MIN_INKED_BLOCKS inked cells and less
+# than MIN_TEXT_SHARE of them under digital text are sent to OCR
+MIN_INKED_BLOCKS = 12
+MIN_TEXT_SHARE = 0.5
+
+# Thumbnails measured per NumPy batch
+TRIAGE_BATCH = 256
+
+
+def measure_ink(images):
+    """Ink coverage and inked cells for a batch of grayscale thumbnails.
+
+    Returns (coverage, blocks): the inked fraction of each page and a
+    boolean (pages, rows, cols) array of cells containing any ink.
+    """
+    batch = np.stack([np.asarray(image.resize(TRIAGE_SIZE, Image.BOX), dtype=np.int16)
+                      for image in images])
+    batch = batch[:, MARGIN:-MARGIN, MARGIN:-MARGIN]
+    paper = np.percentile(batch, 90, axis=(1, 2))
+    ink = batch < (paper - INK_CONTRAST)[:, None, None]
+    pages, height, width = ink.shape
+    blocks = ink.reshape(pages, height // BLOCK, BLOCK, width // BLOCK, BLOCK).any(axis=(2, 4))
+    return ink.mean(axis=(1, 2)), blocks
+
+
+def ink_pixels(image):
+    """Ink pixels of a grayscale render of any size, margins excluded."""
+    page = np.asarray(image, dtype=np.int16)
+    margin_y = round(page.shape[0] * MARGIN / TRIAGE_SIZE[1])
+    margin_x = round(page.shape[1] * MARGIN / TRIAGE_SIZE[0])
+    page = page[margin_y:page.shape[0] - margin_y, margin_x:page.shape[1] - margin_x]
+    if not page.size:
+        return 0
+    paper = np.percentile(page, 90)
+    return int((page < paper - INK_CONTRAST).sum())
+
+
+def text_blocks(page, shape):
+    """Boolean (rows, cols) mask of the cells covered by the page's digital
+    text, estimated from pypdf's text positions and font sizes."""
+    mask = np.zeros(shape, dtype=bool)
+    box = page.cropbox
+    left, bottom = float(box.left), float(box.bottom)
+    width, height = float(box.width), float(box.height)
+    # Cell size in points, margin included
+    cell_x = width * BLOCK / TRIAGE_SIZE[0]
+    cell_y = height * BLOCK / TRIAGE_SIZE[1]
+    offset_x = width * MARGIN / TRIAGE_SIZE[0]
+    offset_y = height * MARGIN / TRIAGE_SIZE[1]
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if not text.strip():
+            return
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4] - left
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5] - bottom
+        size = font_size * (tm[0] ** 2 + tm[1] ** 2) ** 0.5 * (cm[0] ** 2 + cm[1] ** 2) ** 0.5
+        # Rough glyph box: half an em per character, one em high
+        x0, x1 = x, x + 0.5 * size * len(text.rstrip())
+        y0, y1 = height - (y + size), height - y
+        c0, c1 = int((x0 - offset_x) // cell_x), int((x1 - offset_x) // cell_x)
+        r0, r1 = int((y0 - offset_y) // cell_y), int((y1 - offset_y) // cell_y)
+        mask[max(r0, 0):max(r1 + 1, 0), max(c0, 0):max(c1 + 1, 0)] = True
+
+    try:
+        page.extract_text(visitor_text=visit)
+    except Exception:
+        pass
+    # One cell of slack around the estimated boxes
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    grown[:, 1:] |= grown[:, :-1].copy()
+    grown[:, :-1] |= grown[:, 1:].copy()
+    return grown
+
+
+def triage_pages(pdf_reader, methods, pdf_source, stats=None, tracer=None, release_cache=False):
+    """Re-label pages from classify_pages by their rendered ink.
+
+    Returns {page_num: new method}: "blank" for needs_ocr pages without ink
+    in the thumbnail and in a BLANK_CHECK_DPI render, "needs_ocr" for
+    digital pages (with images) whose digital text covers less than
+    MIN_TEXT_SHARE of the inked cells. `pdf_source` is the PDF bytes or
+    file path; thumbnails need poppler. Rotated pages are not checked for
+    text share. If any render fails, no page is re-labelled. `stats`
+    receives "triage_blank", "triage_to_ocr", "triage_pages",
+    "triage_seconds" and "triage_render_error".
+    """
+    started = time.perf_counter()
+    scans = {n for n, method in methods.items() if method == "needs_ocr"}
+    mixed = set()
+    for n, method in methods.items():
+        if method != "digital":
+            continue
+        page = pdf_reader.pages[n - 1]
+        if not page.rotation and image_coverage(page) > 0:
+            mixed.add(n)
+        if release_cache:
+            release_object_cache(pdf_reader)
+
+    changes = {}
+    render_error = None
+    batch = []
+    candidates = []
+
+    def flush():
+        coverage, blocks = measure_ink([image for _, image in batch])
+        for (n, _), page_coverage, page_blocks in zip(batch, coverage, blocks):
+            if n in scans:
+                if page_coverage < BLANK_COVERAGE:
+                    candidates.append(n)
+                continue
+            inked = int(page_blocks.sum())
+            if inked < MIN_INKED_BLOCKS:
+                continue
+            covered = int((page_blocks & text_blocks(pdf_reader.pages[n - 1], page_blocks.shape)).sum())
+            if release_cache:
+                release_object_cache(pdf_reader)
+            if covered / inked < MIN_TEXT_SHARE:
+                changes[n] = "needs_ocr"
+        batch.clear()
+
+    spooled = None
+    if not isinstance(pdf_source, str):
+        # Written once for the thumbnails and the blank checks
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(pdf_source)
+        pdf_source = spooled = f.name
+    try:
+        for n, image in render_thumbnails(pdf_source, sorted(scans | mixed)):
+            batch.append((n, image))
+            if len(batch) >= TRIAGE_BATCH:
+                flush()
+        if batch:
+            flush()
+        for n, image in render_thumbnails(pdf_source, candidates, dpi=BLANK_CHECK_DPI):
+            if ink_pixels(image) <= BLANK_MAX_INK_PIXELS:
+                changes[n] = "blank"
+    except Exception as e:
+        # No poppler / unrenderable page: keep every label from
+        # classify_pages, including changes from batches that did render,
+        # so a partial run never leaves pages labelled blank
+        changes.clear()
+        render_error = str(e)
+    finally:
+        if spooled is not None:
+            os.unlink(spooled)
+
+    seconds = time.perf_counter() - started
+    if tracer is not None:
+        tracer.add("triage", seconds, outcome="ok" if render_error is None else "render_error")
+    if stats is not None:
+        stats.update(triage_blank=sum(1 for m in changes.values() if m == "blank"),
+                     triage_to_ocr=sum(1 for m in changes.values() if m == "needs_ocr"),
+                     triage_pages=len(scans | mixed), triage_seconds=seconds,
+                     triage_render_error=render_error)
+    return changes
@@ -0,0 +1,128 @@
+# viewer.py
+# Lazy result views for large outputs: only the visible page range (or list
+# slice) is sent to the browser, and each view is a fragment, so paging and
+# search rerun the view rather than the whole extraction script.
+import math
+from functools import partial
+
+import streamlit as st
+
+from exports import EXPORT_FORMATS, export_file
+
+PAGES_PER_VIEW = (5, 10, 25, 50)
+ITEMS_PER_VIEW = 50
+
+
+def search_pages(extracted_text, query):
+    """1-based numbers of the pages whose text contains `query` (ignoring case)."""
+    needle = query.casefold()
+    return [i for i, text in enumerate(extracted_text, start=1) if text and needle in text.casefold()]
+
+
+def _clamp(key, upper):
+    """Keep a number_input's stored value within 1..upper before it is drawn:
+    the same key may come back for a shorter document or result, and
+    Streamlit rejects a stored value above max_value."""
+    st.session_state[key] = min(max(1, st.session_state.get(key, 1)), max(upper, 1))
+
+
+def _pages(extracted_text, methods, key):
+    total = len(extracted_text)
+    first_key = f"{key}_first"
+    _clamp(first_key, total)
+
+    def jump():
+        st.session_state[first_key] = st.session_state[f"{key}_match"]
+
+    def step(delta):
+        st.session_state[first_key] = min(max(1, st.session_state[first_key] + delta), total)
+
+    col_query, col_size = st.columns([3, 1])
+    query = col_query.text_input("Search text", key=f"{key}_query")
+    per_view = col_size.selectbox("Pages per view", PAGES_PER_VIEW, index=1, key=f"{key}_per_view")
+    if query:
+        matches = search_pages(extracted_text, query)
+        if matches:
+            st.selectbox(f"{len(matches)} matching page(s) — jump to", matches, index=None,
+                         format_func=lambda n: f"Page {n}", key=f"{key}_match", on_change=jump)
+        else:
+            st.caption("No matching pages.")
+
+    col_prev, col_first, col_next = st.columns([1, 2, 1])
+    col_prev.button("◀ Previous", key=f"{key}_prev", on_click=step, args=(-per_view,),
+                    disabled=st.session_state[first_key] <= 1)
+    first = col_first.number_input(f"First page (of {total})", min_value=1, max_value=max(total, 1),
+                                   key=first_key)
+    col_next.button("Next ▶", key=f"{key}_next", on_click=step, args=(per_view,),
+                    disabled=first + per_view > total)
+
+    for page_num in range(first, min(first + per_view, total + 1)):
+        text = extracted_text[page_num - 1]
+        st.markdown(f"**Page {page_num}** · `{methods.get(page_num, 'unknown')}`")
+        st.text_area(f"Page {page_num}", text or "[no text found]", height=240,
+                     key=f"{key}_text_{page_num}", label_visibility="collapsed")
+
+
+@st.fragment
+def show_pages(extracted_text, methods, key="pages"):
+    """Paginated page-by-page text with search that jumps to a matching page.
+
+    `extracted_text` is the page text list (or a large_file.PageTextStore);
+    only the pages in view are read and rendered.
+    """
+    _pages(extracted_text, methods, key)
+
+
+def export_buttons(extracted_text, methods, name="extracted_text", key="export"):
+    """One download button per EXPORT_FORMATS entry; files are written only on click."""
+    for col, (fmt, (ext, mime)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+        col.download_button(f"💾 Download {fmt.upper()}", partial(export_file, fmt, extracted_text, methods),
+                            f"{name}.{ext}", mime=mime, on_click="ignore", key=f"{key}_{fmt}")
+
+
+@st.fragment
+def show_documents(documents, key="documents"):
+    """Pages and exports of one document of a {name: (extracted_text,
+    methods)} batch at a time."""
+    if not documents:
+        return
+    name = st.selectbox("Document", list(documents), key=f"{key}_name")
+    extracted_text, methods = documents[name]
+    index = list(documents).index(name)
+    _pages(extracted_text, methods, key=f"{key}_{index}")
+    export_buttons(extracted_text, methods, name=name.rsplit(".", 1)[0], key=f"{key}_{index}_export")
+
+
+def _json_pages(data, key):
+    if not isinstance(data, dict):
+        st.json(data, expanded=1)
+        return
+    long_lists = {name: items for name, items in data.items()
+                  if isinstance(items, list) and len(items) > ITEMS_PER_VIEW}
+    rest = {name: value for name, value in data.items() if name not in long_lists}
+    if rest:
+        st.json(rest, expanded=2)
+    for name, items in long_lists.items():
+        pages = math.ceil(len(items) / ITEMS_PER_VIEW)
+        _clamp(f"{key}_{name}_page", pages)
+        page = st.number_input(f"{name}: page (of {pages})", min_value=1, max_value=pages,
+                               key=f"{key}_{name}_page")
+        start = (page - 1) * ITEMS_PER_VIEW
+        st.caption(f"{name}: items {start + 1}-{min(start + ITEMS_PER_VIEW, len(items))} of {len(items)}")
+        st.json(items[start:start + ITEMS_PER_VIEW], expanded=1)
+
+
+@st.fragment
+def show_json_pages(data, key):
+    """st.json for large results: top-level lists longer than ITEMS_PER_VIEW
+    are shown one slice at a time."""
+    _json_pages(data, key)
+
+
+@st.fragment
+def show_sections(sections, key="sections"):
+    """One section of a {name: parsed JSON} result at a time."""
+    if not sections:
+        return
+    name = st.selectbox("Section", list(sections), key=f"{key}_name")
+    _json_pages(sections[name], key=f"{key}_{name}")